@@ -0,0 +1,289 @@
+# Copyright 2024 Canonical Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Library to consume the REST API of the Anbox Management Service (AMS).
+
+The library provides the requirer side of the `rest` interface and a client
+which keeps TLS connections to AMS alive between requests, fails over between
+all AMS units and retries transient failures with backoff.
+
+Example usage:
+
+```python
+from charms.ams.v0.ams_client import AMSRequirer
+
+
+class MyCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.ams = AMSRequirer(self, "ams")
+        self.framework.observe(self.on.install, self._on_install)
+        self.framework.observe(self.ams.on.available, self._on_ams_available)
+
+    def _on_install(self, _):
+        # The certificate is registered with AMS on every current and future relation
+        self.ams.register(CERT_PEM)
+
+    def _on_ams_available(self, _):
+        with self.ams.client(cert=(CERT_PATH, KEY_PATH), verify=AMS_CA_PATH) as client:
+            instances = client.get("/1.0/instances").json()
+```
+
+The server certificate of AMS is verified against the system CAs by default.
+AMS serves a self-signed certificate unless configured otherwise, so pass the
+path of the AMS certificate (or of the CA which issued it) as `verify`.
+Passing `verify=False` disables the verification and exposes the client
+certificate and all API traffic to anyone able to intercept the connection.
+
+Requests made from asyncio code can use `await client.arequest("GET", path)`,
+which runs the request in the default executor of the running loop.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple, Union
+
+import ops
+import requests
+from requests.adapters import HTTPAdapter
+
+# The unique Charmhub library identifier, never change it
+LIBID = "d713322fb7814643984769d6c162bd76"
+
+# Increment this major API version when introducing breaking changes
+LIBAPI = 0
+
+# Increment this PATCH version before using `charmcraft publish-lib` or reset
+# to 0 if you are raising the major API version
+LIBPATCH = 2
+
+PYDEPS = ["requests"]
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+class AMSClientError(Exception):
+    """Raised when no AMS endpoint could serve a request."""
+
+
+@dataclass
+class Endpoint:
+    """AMS endpoint published on the `rest` interface."""
+
+    address: str
+    port: int
+    node: str = ""
+    healthy: bool = True
+    weight: int = 1
+
+    @property
+    def url(self) -> str:
+        """Return the base URL of the endpoint."""
+        if self.address.startswith("https://"):
+            return self.address.rstrip("/")
+        return f"https://{self.address}:{self.port}"
+
+
+class AMSClient:
+    """HTTPS client for the AMS API with connection reuse and failover.
+
+    `verify` is passed to `requests`: `True` checks the AMS certificate against
+    the system CAs, a path checks it against the given certificate or CA bundle.
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[Endpoint],
+        cert: Union[str, Tuple[str, str]],
+        verify: Union[bool, str] = True,
+        timeout: float = 30,
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 10,
+    ):
+        self.endpoints = list(endpoints)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._session = requests.Session()
+        self._session.cert = cert
+        self._session.verify = verify
+        adapter = HTTPAdapter(pool_connections=max(len(self.endpoints), 1), pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+
+    def __enter__(self) -> "AMSClient":
+        """Return the client to use in a `with` block."""
+        return self
+
+    def __exit__(self, *_):
+        """Close the client at the end of a `with` block."""
+        self.close()
+
+    def close(self):
+        """Close all pooled connections."""
+        self._session.close()
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request to the first endpoint able to serve it.
+
+        Endpoints are tried in the published order of preference. Requests which
+        are not idempotent are only sent to another endpoint if the connection
+        could not be established, never after an error response.
+        """
+        if not self.endpoints:
+            raise AMSClientError("No AMS endpoint available")
+        method = method.upper()
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method in IDEMPOTENT_METHODS
+        error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                # Full jitter keeps clients from retrying in lockstep
+                time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            for endpoint in self.endpoints:
+                try:
+                    resp = self._session.request(method, f"{endpoint.url}{path}", **kwargs)
+                except requests.exceptions.ConnectionError as e:
+                    error = e
+                    logger.debug("Cannot connect to AMS at %s: %s", endpoint.url, e)
+                    continue
+                except requests.exceptions.Timeout as e:
+                    if not idempotent:
+                        raise AMSClientError(f"{method} {path} timed out: {e}") from e
+                    error = e
+                    continue
+                if idempotent and resp.status_code in RETRY_STATUSES:
+                    error = AMSClientError(f"{endpoint.url} answered {resp.status_code}")
+                    continue
+                return resp
+        raise AMSClientError(f"{method} {path} failed on all AMS endpoints: {error}") from error
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        """Send a GET request."""
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        """Send a POST request."""
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path: str, **kwargs) -> requests.Response:
+        """Send a PATCH request."""
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        """Send a DELETE request."""
+        return self.request("DELETE", path, **kwargs)
+
+    async def arequest(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request without blocking the running event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.request, method, path, **kwargs)
+        )
+
+
+class AMSAvailableEvent(ops.EventBase):
+    """Event emitted when AMS registered the client and published its endpoints."""
+
+
+class AMSRequirerEvents(ops.ObjectEvents):
+    """Events emitted by the AMS requirer."""
+
+    available = ops.EventSource(AMSAvailableEvent)
+
+
+class AMSRequirer(ops.Object):
+    """Requirer side of the `rest` interface provided by AMS."""
+
+    on = AMSRequirerEvents()
+    _stored = ops.StoredState()
+
+    def __init__(self, charm: ops.CharmBase, relation_name: str = "ams"):
+        super().__init__(charm, relation_name)
+        self._charm = charm
+        self._relation_name = relation_name
+        self._stored.set_default(certificate="")
+        self.framework.observe(charm.on[relation_name].relation_joined, self._on_joined)
+        self.framework.observe(charm.on[relation_name].relation_changed, self._on_changed)
+
+    @property
+    def relations(self) -> List[ops.Relation]:
+        """Return all relations to AMS."""
+        return self._charm.model.relations[self._relation_name]
+
+    def register(self, certificate: str):
+        """Ask AMS to trust a client certificate on all current and future relations."""
+        self._stored.certificate = certificate
+        for relation in self.relations:
+            self._publish(relation)
+
+    def _publish(self, relation: ops.Relation):
+        if not self._stored.certificate:
+            return
+        content = json.dumps(self._stored.certificate)
+        if relation.data[self._charm.unit].get("client_certificate") != content:
+            relation.data[self._charm.unit]["client_certificate"] = content
+
+    def _on_joined(self, event: ops.RelationJoinedEvent):
+        self._publish(event.relation)
+
+    def _on_changed(self, _: ops.RelationChangedEvent):
+        if self.is_ready:
+            self.on.available.emit()
+
+    @property
+    def is_ready(self) -> bool:
+        """Check if AMS registered the certificate of this unit."""
+        return any(
+            relation.data[unit].get("port")
+            for relation in self.relations
+            for unit in relation.units
+        )
+
+    @property
+    def endpoints(self) -> List[Endpoint]:
+        """Return the AMS endpoints, healthy and least loaded first.
+
+        AMS publishes all its units in the application data. Older revisions only
+        publish the address of each unit, which is used as a fallback.
+        """
+        endpoints = []
+        for relation in self.relations:
+            published = relation.app and relation.data[relation.app].get("endpoints")
+            if published:
+                endpoints.extend(Endpoint(**e) for e in json.loads(published))
+                continue
+            for unit in relation.units:
+                data = relation.data[unit]
+                if data.get("private_address") and data.get("port"):
+                    endpoints.append(
+                        Endpoint(
+                            address=data["private_address"],
+                            port=int(data["port"]),
+                            node=data.get("node", ""),
+                        )
+                    )
+        return sorted(endpoints, key=lambda e: (not e.healthy, -e.weight, e.node))
+
+    def client(self, cert: Union[str, Tuple[str, str]], **kwargs) -> AMSClient:
+        """Return a client for the currently published AMS endpoints."""
+        return AMSClient(self.endpoints, cert, **kwargs)
@@ -15,14 +15,17 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import http.client
 import json
 import logging
+import os
+import re
 import shutil
-import subprocess
+import socket
 import tempfile
-from dataclasses import asdict, dataclass, field
+from dataclasses import asdict, dataclass, field, replace
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import ops
 import yaml
@@ -30,6 +33,8 @@ from charms.operator_libs_linux.v0 import passwd
 from charms.operator_libs_linux.v1 import systemd
 from charms.operator_libs_linux.v2 import snap
 from jinja2 import Environment, FileSystemLoader
+from pipeline import Step, run_steps
+from runner import CommandError, run
 
 SNAP_NAME = "ams"
 SNAP_COMMON_PATH = Path(f"/var/snap/{SNAP_NAME}/common")
@@ -39,20 +44,68 @@ ETCD_BASE_PATH = SNAP_COMMON_PATH / "etcd"
 ETCD_CA_PATH = ETCD_BASE_PATH / "client-ca.pem"
 ETCD_CERT_PATH = ETCD_BASE_PATH / "client-cert.pem"
 ETCD_KEY_PATH = ETCD_BASE_PATH / "client-key.pem"
+ETCD_DATA_PATH = SNAP_COMMON_PATH / "etcd-data"
 
 AMS_CONFIG_PATH = SNAP_COMMON_PATH / "server/settings.yaml"
+ARTIFACTS_PATH = SNAP_COMMON_PATH / "data/artifacts"
 
 LXD_CLIENT_CONFIG_FOLDER = SNAP_COMMON_PATH / "lxd"
 LXD_CLIENT_CERT_PATH = LXD_CLIENT_CONFIG_FOLDER / "client.crt"
 LXD_CLIENT_KEY_PATH = LXD_CLIENT_CONFIG_FOLDER / "client.key"
+LXD_PENDING_CERT_PATH = LXD_CLIENT_CONFIG_FOLDER / "client.crt.pending"
+LXD_PENDING_KEY_PATH = LXD_CLIENT_CONFIG_FOLDER / "client.key.pending"
+LXD_PREVIOUS_CERT_PATH = LXD_CLIENT_CONFIG_FOLDER / "client.crt.previous"
+LXD_PREVIOUS_KEY_PATH = LXD_CLIENT_CONFIG_FOLDER / "client.key.previous"
 
 SERVICE = "snap.ams.ams.service"
 SERVICE_DROP_IN_PATH = Path(f"/etc/systemd/system/{SERVICE}.d/10-ams-unix-socket-chown.conf")
 GROUP_NAME = "ams"
 
+AMS_SOCKET_PATH = SNAP_COMMON_PATH / "server/unix.socket"
+READINESS_TIMEOUT = 2.0
+# States AMS reports in the metadata of its API root while able to serve requests
+READY_STATES = ("ready", "online")
+
+AMC_BINARY = "/snap/bin/amc"
+LOG_LEVEL_CONFIG_ITEM = "log.level"
+LOG_LEVEL_REVERT_UNIT = "ams-log-level-revert"
+AMC_TIMEOUT = 60
+SNAP_TIMEOUT = 300
+# Installing or refreshing downloads the whole snap from the store
+SNAP_INSTALL_TIMEOUT = 900
+
+# AMS object ids are 20 character base32hex encoded xids
+AMS_ID_PATTERN = re.compile(r"\b[0-9a-v]{20}\b")
+
 logger = logging.getLogger(__name__)
 
 
+def write_file(path: Path, content: bytes, mode: int = 0o644) -> bool:
+    """Atomically replace a file if its content differs, returning whether it was written.
+
+    The content is written to a temporary file in the same directory which is then
+    renamed over the target, so readers never see a partially written file.
+    """
+    try:
+        if path.read_bytes() == content and (path.stat().st_mode & 0o777) == mode:
+            return False
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", delete=False) as f:
+        try:
+            os.fchmod(f.fileno(), mode)
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            os.replace(f.name, path)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    return True
+
+
 @dataclass
 class ETCDConfig:
     """Etcd configuration for AMS."""
@@ -62,6 +115,13 @@ class ETCDConfig:
     cert: Path = ETCD_CERT_PATH
     key: Path = ETCD_KEY_PATH
     servers: List[str] = field(default_factory=list)
+    data_path: Path = ETCD_DATA_PATH
+    quota_backend_bytes: int = 0
+    snapshot_count: int = 0
+    auto_compaction_mode: str = ""
+    auto_compaction_retention: str = ""
+    heartbeat_interval: int = 0
+    election_timeout: int = 0
 
     @property
     def is_ready(self) -> bool:
@@ -127,12 +187,34 @@ class ServiceConfig:
     metrics: PrometheusConfig
 
 
+@dataclass
+class Readiness:
+    """Whether AMS can serve API requests and why not."""
+
+    ready: bool
+    reason: str = ""
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over the unix socket of AMS."""
+
+    def __init__(self, path: Path, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(str(self._path))
+
+
 class AMS:
     """Class for handling AMS configurations."""
 
     def __init__(self, charm: ops.CharmBase):
         self._sc = snap.SnapCache()
         self._charm = charm
+        self._info: Dict = {}
 
     @property
     def snap(self):
@@ -141,50 +223,227 @@ class AMS:
 
     def restart(self):
         """Restart AMS Snap."""
-        self.snap.restart()
+        run(["snap", "restart", SNAP_NAME], operation="snap restart", timeout=SNAP_TIMEOUT)
+
+    def start(self):
+        """Start AMS Snap."""
+        run(["snap", "start", "--enable", SNAP_NAME], operation="snap start", timeout=SNAP_TIMEOUT)
+
+    def stop(self):
+        """Stop AMS Snap."""
+        run(["snap", "stop", SNAP_NAME], operation="snap stop", timeout=SNAP_TIMEOUT)
+
+    @staticmethod
+    def _amc(*args: str, operation: str, timeout: float = AMC_TIMEOUT, **kwargs):
+        return run([AMC_BINARY, *args], operation=operation, timeout=timeout, **kwargs)
 
     def remove(self):
         """Remove AMS users, drop-in service and the snap."""
-        snap.remove(SNAP_NAME)
+        run(["snap", "remove", SNAP_NAME], operation="snap remove", timeout=SNAP_TIMEOUT)
         shutil.rmtree(SERVICE_DROP_IN_PATH.parent)
         passwd.remove_group(GROUP_NAME)
 
-    def install(self, channel: str, revision: Optional[str] = None):
-        """Install AMS including its Snap."""
-        try:
-            kwargs = {}
-            if revision:
-                kwargs = {"revision": int(revision)}
+    def install(
+        self,
+        channel: str,
+        revision: Optional[str] = None,
+        extra_steps: Optional[Dict[str, Step]] = None,
+    ):
+        """Install AMS including its Snap, skipping the steps already done.
+
+        Steps not depending on the snap, including `extra_steps` which can wait
+        for the `snap` step, run while the snap is downloaded and installed.
+        """
+        steps = {"snap": Step(lambda: self._ensure_snap(channel, revision))}
+        steps.update(self._post_install_steps(after=("snap",)))
+        steps.update(extra_steps or {})
+        run_steps(steps)
+
+    def _ensure_snap(self, channel: str, revision: Optional[str]):
+        self._info = self._installed_info()
+        if self._is_installed_at(self._info, channel, revision):
+            return
+        action = "refresh" if self._info else "install"
+        source = f"--revision={revision}" if revision else f"--channel={channel}"
+        run(
+            ["snap", action, SNAP_NAME, source],
+            operation=f"snap {action}",
+            timeout=SNAP_INSTALL_TIMEOUT,
+        )
+        self._reload_installed_info()
+
+    def install_local(self, path: Path, assertion: Optional[Path] = None):
+        """Side-load AMS from a local snap file, verified by its assertion if given."""
+
+        def _side_load():
+            args = ["snap", "install", str(path)]
+            if assertion:
+                run(["snap", "ack", str(assertion)], operation="snap ack", timeout=SNAP_TIMEOUT)
             else:
-                kwargs = {"channel": channel}
-            self.snap.ensure(state=snap.SnapState.Latest, **kwargs)
-            self.snap.hold()
-        except snap.SnapError as e:
-            logger.error("could not install ams. Reason: %s", e.message)
-            logger.debug(e, exc_info=True)
-            raise e
+                logger.warning("No assertion for %s, installing it without signature check", path)
+                args.append("--dangerous")
+            run(args, operation="snap install", timeout=SNAP_TIMEOUT)
+            self._reload_installed_info()
+
+        steps = {"snap": Step(_side_load)}
+        steps.update(self._post_install_steps(after=("snap",)))
+        run_steps(steps)
 
+    def _reload_installed_info(self):
         # refresh snap cache after installation
         self._sc._load_installed_snaps()
-        self.snap.connect(plug="daemon-notify", slot="core:daemon-notify")
-        self.snap.alias("amc", "amc")
-
-        passwd.add_group(GROUP_NAME)
-        passwd.add_user_to_group("ubuntu", GROUP_NAME)
-        self._create_systemd_drop_in()
-
-    def setup_lxd(self, key: bytes, cert: bytes):
-        """Create certificates for Etcd."""
-        LXD_CLIENT_CONFIG_FOLDER.mkdir(exist_ok=True, parents=True)
-        LXD_CLIENT_CERT_PATH.write_bytes(cert)
-        LXD_CLIENT_KEY_PATH.write_bytes(key)
-
-    def setup_etcd(self, ca: str, key: str, cert: str):
-        """Create certificates for Etcd."""
-        ETCD_BASE_PATH.mkdir(exist_ok=True, parents=True)
-        ETCD_CA_PATH.write_text(ca)
-        ETCD_CERT_PATH.write_text(cert)
-        ETCD_KEY_PATH.write_text(key)
+        self._info = self._installed_info() or {}
+
+    def _installed_info(self) -> Optional[Dict]:
+        """Return what snapd knows about the installed AMS snap, `None` if not installed."""
+        try:
+            return self._sc._snap_client._request("GET", f"snaps/{SNAP_NAME}")
+        except snap.SnapAPIError:
+            return None
+
+    def _is_installed_at(
+        self, info: Optional[Dict], channel: str, revision: Optional[str]
+    ) -> bool:
+        if not info:
+            return False
+        if revision:
+            return str(info["revision"]) == str(revision)
+        if info.get("tracking-channel") != channel:
+            return False
+        # Without the store the installed revision of the channel is kept
+        latest = self.store_revision(channel)
+        return latest is None or latest[0] == str(info["revision"])
+
+    def store_revision(self, channel: str) -> Optional[Tuple[str, int]]:
+        """Return the revision and download size of a channel in the store, if reachable."""
+        try:
+            info = self._sc._snap_client.get_snap_information(SNAP_NAME)
+            release = info["channels"][channel]
+        except (snap.SnapAPIError, KeyError) as e:
+            logger.warning("Cannot look up %s in the snap store: %s", channel, e)
+            return None
+        return str(release["revision"]), int(release.get("size", 0))
+
+    def _post_install_steps(self, after: Tuple[str, ...] = ()) -> Dict[str, Step]:
+        """Return the steps bringing the installed snap and the system in shape for AMS.
+
+        The current state is read from snapd and the group database, so only the
+        steps actually missing run a command. snapd refuses concurrent changes to
+        one snap, so the snap steps run one after the other.
+        """
+        return {
+            "snap-hold": Step(self._ensure_held, after=after),
+            "snap-connect": Step(self._ensure_connected, after=("snap-hold",)),
+            "snap-alias": Step(self._ensure_aliased, after=("snap-connect",)),
+            "group": Step(self._ensure_group),
+            "drop-in": Step(self._create_systemd_drop_in),
+        }
+
+    def _ensure_held(self):
+        if not self._info.get("hold"):
+            run(
+                ["snap", "refresh", "--hold", SNAP_NAME],
+                operation="snap hold",
+                timeout=SNAP_TIMEOUT,
+            )
+
+    def _ensure_connected(self):
+        connections = self._sc._snap_client._request("GET", "connections", {"snap": SNAP_NAME})
+        if not any(
+            c["plug"]["snap"] == SNAP_NAME and c["plug"]["plug"] == "daemon-notify"
+            for c in connections.get("established", [])
+        ):
+            run(
+                ["snap", "connect", f"{SNAP_NAME}:daemon-notify", "core:daemon-notify"],
+                operation="snap connect",
+                timeout=SNAP_TIMEOUT,
+            )
+
+    def _ensure_aliased(self):
+        if "amc" not in self._sc._snap_client._request("GET", "aliases").get(SNAP_NAME, {}):
+            run(
+                ["snap", "alias", f"{SNAP_NAME}.amc", "amc"],
+                operation="snap alias",
+                timeout=SNAP_TIMEOUT,
+            )
+
+    @staticmethod
+    def _ensure_group():
+        group = passwd.add_group(GROUP_NAME)
+        if "ubuntu" not in group.gr_mem:
+            passwd.add_user_to_group("ubuntu", GROUP_NAME)
+
+    def setup_lxd(self, key: bytes, cert: bytes) -> bool:
+        """Create certificates for LXD, returning whether any of them changed."""
+        # The key is written last so the pair on disk never has a key without its cert
+        changed = write_file(LXD_CLIENT_CERT_PATH, cert)
+        changed |= write_file(LXD_CLIENT_KEY_PATH, key, mode=0o600)
+        return changed
+
+    @property
+    def lxd_client_certificate(self) -> Optional[bytes]:
+        """Return the certificate AMS uses to authenticate against LXD, if any."""
+        if not (LXD_CLIENT_CERT_PATH.exists() and LXD_CLIENT_KEY_PATH.exists()):
+            return None
+        return LXD_CLIENT_CERT_PATH.read_bytes()
+
+    @property
+    def etcd_client_certificate(self) -> Optional[bytes]:
+        """Return the certificate AMS uses to authenticate against etcd, if any."""
+        if not ETCD_CERT_PATH.exists():
+            return None
+        return ETCD_CERT_PATH.read_bytes()
+
+    @property
+    def pending_lxd_client_certificate(self) -> Optional[bytes]:
+        """Return the certificate waiting to replace the LXD client certificate, if any."""
+        if not (LXD_PENDING_CERT_PATH.exists() and LXD_PENDING_KEY_PATH.exists()):
+            return None
+        return LXD_PENDING_CERT_PATH.read_bytes()
+
+    def stage_lxd_rotation(self, key: bytes, cert: bytes):
+        """Store a new LXD client certificate next to the one in use."""
+        write_file(LXD_PENDING_CERT_PATH, cert)
+        write_file(LXD_PENDING_KEY_PATH, key, mode=0o600)
+
+    def complete_lxd_rotation(self) -> bool:
+        """Replace the LXD client certificate in use with the pending one.
+
+        The replaced certificate is kept as the previous one, so it can stay
+        trusted until AMS was restarted with the new one.
+        """
+        if self.pending_lxd_client_certificate is None:
+            return False
+        write_file(LXD_PREVIOUS_CERT_PATH, LXD_CLIENT_CERT_PATH.read_bytes())
+        write_file(LXD_PREVIOUS_KEY_PATH, LXD_CLIENT_KEY_PATH.read_bytes(), mode=0o600)
+        changed = self.setup_lxd(
+            key=LXD_PENDING_KEY_PATH.read_bytes(), cert=LXD_PENDING_CERT_PATH.read_bytes()
+        )
+        LXD_PENDING_KEY_PATH.unlink()
+        LXD_PENDING_CERT_PATH.unlink()
+        logger.info("Rotated LXD client certificate")
+        return changed
+
+    @property
+    def previous_lxd_client_certificate(self) -> Optional[bytes]:
+        """Return the certificate replaced by the last rotation until it is withdrawn."""
+        if not LXD_PREVIOUS_CERT_PATH.exists():
+            return None
+        return LXD_PREVIOUS_CERT_PATH.read_bytes()
+
+    def withdraw_previous_lxd_client_certificate(self):
+        """Remove the certificate replaced by the last rotation."""
+        LXD_PREVIOUS_KEY_PATH.unlink(missing_ok=True)
+        LXD_PREVIOUS_CERT_PATH.unlink(missing_ok=True)
+
+    def setup_etcd(self, ca: str, key: str, cert: str) -> bool:
+        """Create certificates for Etcd, returning whether any of them changed."""
+        changed = write_file(ETCD_CA_PATH, ca.encode())
+        changed |= write_file(ETCD_CERT_PATH, cert.encode())
+        changed |= write_file(ETCD_KEY_PATH, key.encode(), mode=0o600)
+        if changed:
+            logger.info("Updated etcd client certificates")
+        return changed
 
     def _create_systemd_drop_in(self):
         tenv = Environment(loader=FileSystemLoader("templates"))
@@ -194,35 +453,114 @@ class AMS:
                 "group": GROUP_NAME,
             }
         )
-        SERVICE_DROP_IN_PATH.parent.mkdir(parents=True, exist_ok=True)
-        SERVICE_DROP_IN_PATH.write_text(rendered_content)
-        systemd.daemon_reload()
+        if write_file(SERVICE_DROP_IN_PATH, rendered_content.encode()):
+            systemd.daemon_reload()
 
     @property
     def version(self) -> str:
-        """Return AMS version."""
-        snap_info = self.snap._snap_client.get_snap_information(SNAP_NAME)
-        return snap_info["channels"][self.snap.channel]["version"]
+        """Return the version of the installed AMS snap."""
+        # Side-loaded snaps have no channel, so the installed snap is asked instead of the store
+        return self._sc._snap_client._request("GET", f"snaps/{SNAP_NAME}")["version"]
 
     def configure(
         self,
         config: ServiceConfig,
-    ):
-        """Configure AMS snap."""
+    ) -> bool:
+        """Configure AMS snap, returning whether AMS must be restarted to apply it.
+
+        A stopped AMS is started right away, a running one is left to the caller
+        to restart so restarts can be coordinated across units.
+        """
+        previous = AMS_CONFIG_PATH.read_bytes() if AMS_CONFIG_PATH.exists() else b""
+        rendered_content = self._render_settings(config)
+        changed = write_file(AMS_CONFIG_PATH, rendered_content.encode())
+        logger.debug("Configuration written for ams: %s", rendered_content)
+
+        if changed and systemd.service_running(SERVICE):
+            # A log level change alone is applied to the running AMS if it supports it
+            old_level = (yaml.safe_load(previous) or {}).get("logger", {}).get("level")
+            unchanged = replace(config, log_level=old_level) if old_level else None
+            if unchanged and self._render_settings(unchanged).encode() == previous:
+                return not self.set_log_level(config.log_level)
+            return True
+        self.start()
+        return False
+
+    @staticmethod
+    def _render_settings(config: ServiceConfig) -> str:
         tenv = Environment(loader=FileSystemLoader("templates"))
         template = tenv.get_template("settings.yaml.j2")
-        content = asdict(config)
-        rendered_content = template.render(content)
-        AMS_CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-        AMS_CONFIG_PATH.write_text(rendered_content)
-        logger.debug("Configuration written for ams: %s", rendered_content)
+        return template.render(asdict(config))
+
+    def set_log_level(self, level: str) -> bool:
+        """Change the log level of the running AMS, returning whether it supports that."""
+        try:
+            if LOG_LEVEL_CONFIG_ITEM not in self._get_config():
+                return False
+            self._set_config_item(LOG_LEVEL_CONFIG_ITEM, level)
+        except CommandError as e:
+            logger.warning("Cannot change the log level of AMS live: %s", e)
+            return False
+        logger.info("Changed the log level of AMS to %s without restart", level)
+        return True
+
+    def schedule_log_level_revert(self, level: str, minutes: int):
+        """Set the log level of the running AMS back after some minutes, even without hooks."""
+        self.cancel_log_level_revert()
+        run(
+            [
+                "systemd-run",
+                f"--unit={LOG_LEVEL_REVERT_UNIT}",
+                f"--on-active={minutes}m",
+                "--collect",
+                AMC_BINARY,
+                "config",
+                "set",
+                LOG_LEVEL_CONFIG_ITEM,
+                level,
+            ],
+            operation="schedule log level revert",
+            timeout=30,
+        )
 
-        self.snap.start(enable=True)
+    @staticmethod
+    def cancel_log_level_revert():
+        """Cancel a scheduled revert of the log level, if any."""
+        run(
+            ["systemctl", "stop", f"{LOG_LEVEL_REVERT_UNIT}.timer"],
+            operation="cancel log level revert",
+            timeout=30,
+            check=False,
+        )
 
     @property
     def is_running(self):
-        """Check if the service is running."""
-        return systemd.service_running(SERVICE)
+        """Check if the service is running and able to serve requests."""
+        return self.readiness().ready
+
+    def readiness(self) -> Readiness:
+        """Ask the AMS API over its unix socket whether it can serve requests.
+
+        Unlike the systemd unit state, this also covers AMS waiting for etcd or
+        running migrations, and does not fork any process.
+        """
+        conn = _UnixHTTPConnection(AMS_SOCKET_PATH, READINESS_TIMEOUT)
+        try:
+            conn.request("GET", "/1.0")
+            resp = conn.getresponse()
+            body = json.loads(resp.read() or b"{}")
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            logger.debug("AMS readiness check failed: %s", e)
+            return Readiness(False, "API not reachable")
+        finally:
+            conn.close()
+        if resp.status != 200:
+            return Readiness(False, f"API answered {resp.status}")
+        metadata = body.get("metadata")
+        status = metadata.get("status", "") if isinstance(metadata, dict) else ""
+        if status and status.lower() not in READY_STATES:
+            return Readiness(False, f"service is {status}")
+        return Readiness(True)
 
     def set_location(self, location, port):
         """Set location configuration item for AMS."""
@@ -237,19 +575,57 @@ class AMS:
         return self._get_config().get(item, "")
 
     def _get_config(self) -> dict:
-        output = subprocess.run(
-            ["/snap/bin/amc", "config", "show"], capture_output=True, check=True
-        )
+        output = self._amc("config", "show", operation="amc config show")
         return yaml.safe_load(output.stdout).get("config", {})
 
     def _set_config_item(self, name, value):
-        subprocess.run(["/snap/bin/amc", "config", "set", name, value], check=True)
+        self._amc("config", "set", name, value, operation="amc config set")
         logger.debug("Set ams configuration item: %s", name)
 
+    def list_objects(self, kind: str) -> List[Dict]:
+        """List AMS objects of a kind (image, addon, application, ...)."""
+        output = self._amc(kind, "ls", "--format", "json", operation=f"amc {kind} ls")
+        return json.loads(output.stdout.decode() or "[]")
+
+    def list_instances(self) -> List[Dict]:
+        """List AMS instances with the node they run on and their exposed services."""
+        output = self._amc("ls", "--format", "json", operation="amc ls")
+        return json.loads(output.stdout.decode() or "[]")
+
+    def launch(self, target: str, node: str, raw: bool = False, timeout: int = 600) -> str:
+        """Launch a container on a given node and return its id."""
+        args = ["launch", f"--node={node}"]
+        if raw:
+            args.append("--raw")
+        # Launching is not idempotent, a retry could start a second container
+        result = self._amc(*args, target, operation="amc launch", timeout=timeout, retries=0)
+        match = AMS_ID_PATTERN.search(result.stdout.decode())
+        if not match:
+            raise Exception(f"Failed to find id of the container launched for {target}")
+        return match.group(0)
+
+    def wait_for_container(self, container_id: str, timeout: int = 600):
+        """Wait for a container to be running."""
+        self._amc(
+            "wait",
+            "-c",
+            "status=running",
+            "-t",
+            f"{timeout}s",
+            container_id,
+            operation="amc wait",
+            timeout=timeout + 10,
+            retries=0,
+        )
+
+    def delete_container(self, container_id: str):
+        """Delete a container."""
+        self._amc("delete", "-y", container_id, operation="amc delete")
+
     def get_registered_certificates(self) -> List[Dict[str, str]]:
         """Get registered client with AMS."""
-        result = subprocess.run(
-            ["/snap/bin/amc", "config", "trust", "ls", "--format", "json"], capture_output=True
+        result = self._amc(
+            "config", "trust", "ls", "--format", "json", operation="amc trust ls", check=False
         )
         return json.loads(result.stdout.decode())
 
@@ -262,33 +638,36 @@ class AMS:
         with tempfile.NamedTemporaryFile(delete=False, dir=SNAP_COMMON_PATH, suffix=".crt") as f:
             f.write(cert.encode())
             f.close()
-            result = subprocess.run(
-                ["/snap/bin/amc", "config", "trust", "add", f.name],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-            )
-            if "already exists" in result.stdout.decode():
+            try:
+                self._amc(
+                    "config", "trust", "add", f.name, operation="amc trust add", merge_output=True
+                )
+            except CommandError as e:
+                if "already exists" not in (e.output or b"").decode(errors="replace"):
+                    raise
                 logger.info("Skipped registration for client. Certificate already registered")
                 return ""
-            else:
-                result.check_returncode()
-                logger.debug("Registered new ams client via amc")
+            logger.debug("Registered new ams client via amc")
         updated_certs = self.get_registered_certificates()
         updated_fp = set()
         for crt in updated_certs:
             updated_fp.add(crt["fingerprint"])
         new_fp = updated_fp - current_fp
         if not new_fp:
-            raise Exception("Failed to register certificate")
+            raise CommandError(
+                "amc trust add",
+                1,
+                ["amc", "config", "trust", "add", f.name],
+                stderr=b"certificate missing from the trust store after adding it",
+            )
         return new_fp.pop()
 
     def unregister_client(self, fingerprint: str):
         """Remove client from AMS."""
-        subprocess.run(["/snap/bin/amc", "config", "trust", "remove", fingerprint], check=True)
+        self._amc("config", "trust", "remove", fingerprint, operation="amc trust remove")
         logger.info("Client unregistered successfully. Certificate removed")
 
-    def apply_service_configuration(self, config_items: List[str]):
+    def apply_service_configuration(self, config_items: Dict[str, str]):
         """Set configuration items in ams using `amc config set`."""
-        for item in config_items:
-            name, value = item.split("=")
+        for name, value in config_items.items():
             self._set_config_item(name, value)
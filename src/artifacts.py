@@ -0,0 +1,159 @@
+"""Module to account for and garbage collect the AMS artifact store."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Set
+
+from metrics import Gauge
+
+# Artifacts younger than this are never collected as they might belong to an
+# upload AMS has not registered yet.
+DEFAULT_MIN_AGE = 3600
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Artifact:
+    """File in the artifact store."""
+
+    path: Path
+    size: int
+    mtime: float
+
+
+@dataclass
+class GCReport:
+    """Outcome of an artifact garbage collection run."""
+
+    total_bytes: int = 0
+    total_files: int = 0
+    orphans: List[Artifact] = field(default_factory=list)
+    unmatched_ids: List[str] = field(default_factory=list)
+    deleted: bool = False
+
+    @property
+    def reclaimable_bytes(self) -> int:
+        """Return the bytes used by orphaned artifacts."""
+        return sum(a.size for a in self.orphans)
+
+    @property
+    def gauges(self) -> List[Gauge]:
+        """Return the metrics describing the artifact store."""
+        return [
+            Gauge("ams_charm_artifacts_bytes", self.total_bytes, "Bytes used by AMS artifacts"),
+            Gauge("ams_charm_artifacts_files", self.total_files, "Number of AMS artifact files"),
+            Gauge(
+                "ams_charm_artifacts_reclaimable_bytes",
+                0 if self.deleted else self.reclaimable_bytes,
+                "Bytes used by artifacts no longer referenced by AMS",
+            ),
+        ]
+
+
+def index_artifacts(root: Path) -> List[Artifact]:
+    """List all files in the artifact store."""
+    artifacts = []
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            path = Path(dirpath) / name
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            artifacts.append(Artifact(path=path, size=st.st_size, mtime=st.st_mtime))
+    return artifacts
+
+
+def referenced_ids(objects: Iterable[dict]) -> Set[str]:
+    """Collect the ids of the given AMS objects and of everything nested in them."""
+    ids = set()
+    stack = list(objects)
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if isinstance(item.get("id"), str) and item["id"]:
+                ids.add(item["id"])
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+    return ids
+
+
+def path_ids(artifact: Artifact, root: Path) -> Set[str]:
+    """Return the object ids the components of the artifact path could name."""
+    candidates = set()
+    for part in artifact.path.relative_to(root).parts:
+        candidates.update((part, part.split(".", 1)[0], part.split("_", 1)[0]))
+    return candidates
+
+
+def is_referenced(artifact: Artifact, root: Path, ids: Set[str]) -> bool:
+    """Check if any component of the artifact path names a referenced object."""
+    return bool(path_ids(artifact, root) & ids)
+
+
+def collect(
+    root: Path, ids: Set[str], delete: bool = False, min_age: int = DEFAULT_MIN_AGE
+) -> GCReport:
+    """Find artifacts not referenced by AMS anymore and optionally delete them.
+
+    Orphans are only told apart by the object ids in their paths. Nothing is
+    deleted unless every referenced id was found in a path, as any id missing
+    on disk means the store is laid out differently than assumed and live
+    artifacts could be taken for orphans.
+    """
+    artifacts = index_artifacts(root)
+    report = GCReport(total_bytes=sum(a.size for a in artifacts), total_files=len(artifacts))
+    cutoff = time.time() - min_age
+    matched = set()
+    for artifact in artifacts:
+        matched |= path_ids(artifact, root) & ids
+    report.unmatched_ids = sorted(ids - matched)
+    report.orphans = [a for a in artifacts if a.mtime < cutoff and not is_referenced(a, root, ids)]
+    if delete and not ids:
+        logger.warning("AMS references no objects, not deleting any artifact")
+        delete = False
+    if delete and report.unmatched_ids:
+        logger.warning(
+            "Referenced objects %s have no artifacts on disk, not deleting any artifact",
+            ", ".join(report.unmatched_ids),
+        )
+        delete = False
+    if delete:
+        for artifact in report.orphans:
+            artifact.path.unlink(missing_ok=True)
+            logger.info("Removed orphaned artifact %s", artifact.path)
+            _remove_empty_parents(artifact.path, root)
+        report.total_bytes -= report.reclaimable_bytes
+        report.total_files -= len(report.orphans)
+        report.deleted = True
+    return report
+
+
+def _remove_empty_parents(path: Path, root: Path):
+    for parent in path.parents:
+        if parent == root or root not in parent.parents:
+            return
+        try:
+            parent.rmdir()
+        except OSError:
+            return
@@ -0,0 +1,280 @@
+"""Module to back up and restore the AMS state."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import zstandard
+from ams import SNAP_COMMON_PATH
+from etcd import ETCDCTL_BINARY, ETCDClient
+from runner import CommandError, run
+
+BACKUP_PATH = SNAP_COMMON_PATH / "backups"
+LATEST_MANIFEST = "latest-manifest.json"
+MANIFEST_NAME = "manifest.json"
+SNAPSHOT_NAME = "etcd/snapshot.db"
+ARTIFACTS_PREFIX = "artifacts/"
+CHUNK_SIZE = 1 << 20
+SNAPSHOT_RESTORE_TIMEOUT = 600
+
+logger = logging.getLogger(__name__)
+
+
+class BackupError(Exception):
+    """Raised when a backup cannot be created or restored."""
+
+
+class _HashingWriter(io.RawIOBase):
+    """File wrapper computing the checksum of everything written through it."""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.sha256.update(b)
+        return self._f.write(b)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def index_files(root: Path, previous: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """Index the files below a directory with their content hash.
+
+    Files whose size and modification time match the previous index reuse its
+    hash instead of being read again.
+    """
+    previous = previous or {}
+    entries = {}
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            path = Path(dirpath) / name
+            rel = str(path.relative_to(root))
+            st = path.stat()
+            entry = {"size": st.st_size, "mtime": st.st_mtime_ns}
+            prev = previous.get(rel, {})
+            if prev.get("size") == entry["size"] and prev.get("mtime") == entry["mtime"]:
+                entry["sha256"] = prev["sha256"]
+            else:
+                entry["sha256"] = _sha256(path)
+            entries[rel] = entry
+    return entries
+
+
+def create_backup(
+    directory: Path, artifacts: Path, etcd: Optional[ETCDClient] = None, incremental=False
+) -> dict:
+    """Write a compressed, checksummed archive of the etcd store and the artifacts.
+
+    The archive is streamed through zstd while being written, so memory usage does
+    not depend on the amount of data backed up. Incremental backups only include
+    artifacts whose content changed since the previous backup in the directory.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    latest_path = directory / LATEST_MANIFEST
+    latest = json.loads(latest_path.read_text()) if latest_path.exists() else {}
+    files = index_files(artifacts, latest.get("files"))
+    if incremental and latest:
+        base = latest["files"]
+        included = [
+            rel for rel, e in files.items() if base.get(rel, {}).get("sha256") != e["sha256"]
+        ]
+    else:
+        incremental = False
+        included = list(files)
+
+    name = time.strftime("ams-backup-%Y%m%d-%H%M%S", time.gmtime())
+    name = f"{name}{'-incremental' if incremental else ''}.tar.zst"
+    manifest = {
+        "name": name,
+        "incremental": incremental,
+        "base": latest.get("name", "") if incremental else "",
+        "etcd": etcd is not None,
+        "files": files,
+        "included": included,
+    }
+    archive = directory / name
+    partial = directory / f".{name}.partial"
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        snapshot = Path(tmp) / "snapshot.db"
+        if etcd:
+            etcd.snapshot(snapshot)
+        with partial.open("wb") as raw:
+            writer = _HashingWriter(raw)
+            cctx = zstandard.ZstdCompressor(level=3, threads=-1)
+            with cctx.stream_writer(writer, closefd=False) as zst, tarfile.open(
+                fileobj=zst, mode="w|"
+            ) as tar:
+                content = json.dumps(manifest).encode()
+                info = tarfile.TarInfo(MANIFEST_NAME)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+                if etcd:
+                    tar.add(snapshot, arcname=SNAPSHOT_NAME)
+                for rel in included:
+                    tar.add(artifacts / rel, arcname=f"{ARTIFACTS_PREFIX}{rel}")
+            os.fsync(raw.fileno())
+        os.replace(partial, archive)
+
+    digest = writer.sha256.hexdigest()
+    (directory / f"{name}.sha256").write_text(f"{digest}  {name}\n")
+    latest_path.write_text(json.dumps(manifest))
+    logger.info("Created backup %s with %d of %d artifacts", archive, len(included), len(files))
+    return {
+        "archive": str(archive),
+        "sha256": digest,
+        "size": archive.stat().st_size,
+        "incremental": incremental,
+        "artifacts-included": len(included),
+        "artifacts-skipped": len(files) - len(included),
+    }
+
+
+def verify_backup(archive: Path):
+    """Check the archive against the checksum recorded when it was created."""
+    checksum = archive.with_name(f"{archive.name}.sha256")
+    if not archive.exists() or not checksum.exists():
+        raise BackupError(f"Backup {archive} or its checksum does not exist")
+    expected = checksum.read_text().split()[0]
+    if _sha256(archive) != expected:
+        raise BackupError(f"Checksum mismatch for backup {archive}")
+
+
+@dataclass
+class StagedRestore:
+    """Backup contents extracted next to the live data, ready to be swapped in."""
+
+    manifest: dict
+    staging: Path
+    artifacts: Path
+    etcd_data: Optional[Path] = None
+    staged_etcd_data: Optional[Path] = None
+
+    @property
+    def staged_artifacts(self) -> Path:
+        """Return where the artifacts of the backup are staged."""
+        return self.staging / "artifacts"
+
+    def apply(self):
+        """Swap the staged data in place of the live data."""
+        _swap(self.staged_artifacts, self.artifacts)
+        if self.etcd_data and self.staged_etcd_data:
+            # The data directory can be a mount point, so only its content is swapped
+            _swap(self.staged_etcd_data / "member", self.etcd_data / "member")
+        logger.info("Restored backup %s", self.manifest["name"])
+
+    def cleanup(self):
+        """Remove whatever is left of the staged data."""
+        shutil.rmtree(self.staging, ignore_errors=True)
+        if self.staged_etcd_data:
+            shutil.rmtree(self.staged_etcd_data, ignore_errors=True)
+
+
+def _swap(src: Path, dest: Path):
+    old = dest.with_name(f".{dest.name}.old")
+    shutil.rmtree(old, ignore_errors=True)
+    if dest.exists():
+        os.replace(dest, old)
+    os.replace(src, dest)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _extract(archive: Path, staging: Path) -> dict:
+    manifest = None
+    with archive.open("rb") as raw, zstandard.ZstdDecompressor().stream_reader(
+        raw
+    ) as zst, tarfile.open(fileobj=zst, mode="r|") as tar:
+        for member in tar:
+            if member.name == MANIFEST_NAME:
+                manifest = json.load(tar.extractfile(member))
+                continue
+            target = (staging / member.name).resolve()
+            if not member.isfile() or staging.resolve() not in target.parents:
+                raise BackupError(f"Unexpected member {member.name} in backup")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with tar.extractfile(member) as src, target.open("wb") as dest:
+                shutil.copyfileobj(src, dest, CHUNK_SIZE)
+    if manifest is None:
+        raise BackupError(f"Backup {archive} has no manifest")
+    return manifest
+
+
+def stage_backup(archive: Path, artifacts: Path, etcd_data: Optional[Path] = None):
+    """Extract a verified backup next to the live data without touching it.
+
+    Artifacts left out of an incremental backup are taken from the live data,
+    provided their content still matches the backed up hash.
+    """
+    verify_backup(archive)
+    staging = Path(tempfile.mkdtemp(dir=artifacts.parent, prefix=".restore-"))
+    staged = StagedRestore(manifest={}, staging=staging, artifacts=artifacts)
+    try:
+        staged.manifest = manifest = _extract(archive, staging)
+        staged.staged_artifacts.mkdir(exist_ok=True)
+        for rel, entry in manifest["files"].items():
+            if rel in manifest["included"]:
+                continue
+            src = artifacts / rel
+            if not src.exists() or _sha256(src) != entry["sha256"]:
+                raise BackupError(f"Artifact {rel} is missing, restore {manifest['base']} first")
+            dest = staged.staged_artifacts / rel
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src, dest)
+        if manifest["etcd"] and etcd_data:
+            staged.etcd_data = etcd_data
+            staged.staged_etcd_data = etcd_data / ".restore"
+            shutil.rmtree(staged.staged_etcd_data, ignore_errors=True)
+            run(
+                [
+                    ETCDCTL_BINARY,
+                    "snapshot",
+                    "restore",
+                    str(staging / SNAPSHOT_NAME),
+                    "--data-dir",
+                    str(staged.staged_etcd_data),
+                ],
+                operation="etcd snapshot restore",
+                timeout=SNAPSHOT_RESTORE_TIMEOUT,
+                retries=0,
+                env={**os.environ, "ETCDCTL_API": "3"},
+            )
+    except (BackupError, OSError, tarfile.TarError, zstandard.ZstdError) as e:
+        staged.cleanup()
+        raise BackupError(f"Cannot restore {archive}: {e}") from e
+    except CommandError as e:
+        staged.cleanup()
+        raise BackupError(f"Cannot restore etcd snapshot: {e}") from e
+    return staged
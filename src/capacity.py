@@ -0,0 +1,80 @@
+"""Module to plan the capacity of the AMS container port range."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import math
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List
+
+from config import PortRange
+
+MAX_PORT = 65535
+
+
+@dataclass
+class PortUsage:
+    """Ports of the range allocated to instances on one LXD node."""
+
+    node: str
+    allocated: int
+    capacity: int
+
+    @property
+    def utilisation(self) -> float:
+        """Return the allocated fraction of the range."""
+        return self.allocated / self.capacity if self.capacity else 1.0
+
+
+def _exposed_ports(instance: Dict) -> int:
+    ports = 0
+    for service in (instance.get("network") or {}).get("services") or []:
+        start = service.get("node_port")
+        if start:
+            ports += (service.get("node_port_end") or start) - start + 1
+    return ports
+
+
+def port_usage(instances: List[Dict], port_range: PortRange) -> List[PortUsage]:
+    """Return the port usage per node, the most used first.
+
+    Every LXD node assigns the ports of exposed services from its own copy of
+    the range, so the capacity applies per node.
+    """
+    allocated = Counter()
+    for instance in instances:
+        allocated[instance.get("node", "")] += _exposed_ports(instance)
+    usages = [PortUsage(node, ports, port_range.count) for node, ports in allocated.items()]
+    return sorted(usages, key=lambda u: (-u.utilisation, u.node))
+
+
+def ports_per_instance(instances: List[Dict], default: int = 1) -> float:
+    """Return the average number of ports exposed per instance."""
+    if not instances:
+        return default
+    return max(sum(_exposed_ports(i) for i in instances) / len(instances), default)
+
+
+def suggest_range(
+    instances: int, ports_per_instance: float, start: int, headroom: float = 0.2
+) -> PortRange:
+    """Return a range starting at `start` sized for a number of instances per node."""
+    size = math.ceil(instances * ports_per_instance * (1 + headroom))
+    if start + size - 1 > MAX_PORT:
+        raise ValueError(
+            f"{size} ports starting at {start} exceed port {MAX_PORT}, use a lower start"
+        )
+    return PortRange(start, start + max(size, 1) - 1)
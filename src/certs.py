@@ -0,0 +1,81 @@
+"""Module to track the expiry of the certificates managed by the charm."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timezone
+from typing import Dict, List, MutableMapping, Optional
+
+from cryptography import x509
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CertificateExpiry:
+    """Managed certificate with the time it expires at."""
+
+    name: str
+    not_after: float
+
+    def remaining(self, now: Optional[float] = None) -> float:
+        """Return the seconds until the certificate expires, negative once expired."""
+        return self.not_after - (time.time() if now is None else now)
+
+
+class CertificateIndex:
+    """Expiry of certificates, parsed once per content and cached by its hash.
+
+    The cache maps the SHA-256 of each PEM to its expiry and only keeps the
+    certificates of the last indexing, so it stays as small as the index.
+    """
+
+    def __init__(self, cache: MutableMapping[str, float]):
+        self._cache = cache
+
+    def expiry(self, pem: bytes) -> float:
+        """Return the expiry of a PEM certificate as a UNIX timestamp."""
+        digest = hashlib.sha256(pem).hexdigest()
+        if digest not in self._cache:
+            cert = x509.load_pem_x509_certificate(pem)
+            if hasattr(cert, "not_valid_after_utc"):
+                not_after = cert.not_valid_after_utc
+            else:
+                # cryptography < 42 only offers the naive UTC datetime
+                not_after = cert.not_valid_after.replace(tzinfo=timezone.utc)
+            self._cache[digest] = not_after.timestamp()
+        return self._cache[digest]
+
+    def index(self, certificates: Dict[str, bytes]) -> List[CertificateExpiry]:
+        """Index PEM certificates by name, the first to expire first.
+
+        Certificates which cannot be parsed are logged and left out.
+        """
+        entries, seen = [], set()
+        for name, pem in certificates.items():
+            seen.add(hashlib.sha256(pem).hexdigest())
+            try:
+                not_after = self.expiry(pem)
+            except ValueError as e:
+                logger.warning("Cannot parse certificate %s: %s", name, e)
+                continue
+            entries.append(CertificateExpiry(name, not_after))
+        for digest in set(self._cache) - seen:
+            del self._cache[digest]
+        return sorted(entries, key=lambda e: e.not_after)
@@ -19,11 +19,30 @@
 from __future__ import annotations
 
 import ast
+import hashlib
 import json
 import logging
-from typing import Dict, List
+import subprocess
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
-from ams import AMS, SNAP_DEFAULT_RISK, BackendConfig, ETCDConfig, PrometheusConfig, ServiceConfig
+from ams import (
+    AMS,
+    ARTIFACTS_PATH,
+    LXD_CLIENT_CERT_PATH,
+    LXD_CLIENT_KEY_PATH,
+    LXD_PENDING_CERT_PATH,
+    LXD_PENDING_KEY_PATH,
+    BackendConfig,
+    ETCDConfig,
+    PrometheusConfig,
+    ServiceConfig,
+)
+from artifacts import DEFAULT_MIN_AGE, GCReport, collect, referenced_ids
+from backup import BackupError, create_backup, stage_backup
+from capacity import port_usage, ports_per_instance, suggest_range
+from certs import CertificateIndex
 from charms.grafana_agent.v0.cos_agent import COSAgentProvider
 from charms.tls_certificates_interface.v3.tls_certificates import (
     generate_ca,
@@ -31,23 +50,64 @@ from charms.tls_certificates_interface.v3.tls_certificates import (
     generate_csr,
     generate_private_key,
 )
+from config import METRICS_SERVER_PREFIX, CharmConfig, ConfigError
+from endpoints import (
+    REQUESTS_METRIC,
+    SESSIONS_METRIC,
+    Endpoint,
+    compute_weight,
+    fetch_metrics,
+    request_rate,
+)
+from etcd import ETCDClient, ETCDError, ETCDProxy, install_etcd, order_by_latency
 from interfaces.etcd import ETCDEndpointConsumer
+from interfaces.lxd import LXDClusterConsumer
+from interfaces.reverseproxy import ReverseProxyProvider
+from keypool import KEY_SIZE, KeyPool
+from metrics import Gauge, MetricsExporter
 from ops.charm import (
+    ActionEvent,
     CharmBase,
     ConfigChangedEvent,
     InstallEvent,
+    RelationBrokenEvent,
     RelationDepartedEvent,
     RelationJoinedEvent,
     StopEvent,
+    UpdateStatusEvent,
     UpgradeCharmEvent,
 )
 from ops.framework import StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus, WaitingStatus
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    MaintenanceStatus,
+    ModelError,
+    Relation,
+    WaitingStatus,
+)
+from pipeline import Step
+from prefetch import PrefetchResult, PrefetchTarget, prefetch
+from rolling import RollingOpsCoordinator
+from runner import CommandError, retry_stats
+from staging import SnapStager
+from storage import (
+    StorageError,
+    check_mount,
+    ensure_mount,
+    etcd_data_path,
+    plan_mounts,
+    stranded_etcd_data,
+)
+from sysctl import KernelTuning, KernelTuningError, resolve_profile
 
 # Log messages can be retrieved using juju debug-log
 logger = logging.getLogger(__name__)
 
+PEER_RELATION = "ams-peers"
+KEY_POOL_DIR = "key-pool"
+
 
 def _is_pro_attached():
     return True
@@ -65,23 +125,62 @@ class AmsOperatorCharm(CharmBase):
     def __init__(self, *args):
         super().__init__(*args)
         self.ams = AMS(self)
-        self._state.set_default(registered_clients=set())
+        self._state.set_default(
+            registered_clients=set(),
+            etcd_compaction_revision=0,
+            etcd_servers=[],
+            artifacts_gc_last_run=0.0,
+            api_requests_sample=[0.0, 0.0],
+            command_retry_totals={},
+            snap_resource_sha256="",
+            snap_staging_revision="",
+            snap_staging_size=0,
+            snap_target="",
+            cert_expiry_cache={},
+            port_usage=[],
+            port_range_blocked=False,
+            debug_logging_until=0.0,
+        )
         self.etcd = ETCDEndpointConsumer(self, "etcd")
+        self.lxd = LXDClusterConsumer(self, "lxd-cluster")
+        self.reverse_proxy = ReverseProxyProvider(self, "website")
+        self.kernel_tuning = KernelTuning(self)
+        self.etcd_proxy = ETCDProxy()
+        self.metrics_exporter = MetricsExporter()
+        self.snap_stager = SnapStager()
+        self.certificates = CertificateIndex(self._state.cert_expiry_cache)
+        self._certificate_message = ""
+        self.key_pool = KeyPool(self.charm_dir / KEY_POOL_DIR)
+        self.rolling = RollingOpsCoordinator(
+            self,
+            PEER_RELATION,
+            run=self._on_rolling_operation,
+            is_ready=lambda: self.ams.is_running,
+            max_concurrent=self._max_concurrent_restarts,
+        )
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
         self.framework.observe(self.on.install, self._on_install)
         self.framework.observe(self.on.upgrade_charm, self._on_upgrade)
         self.framework.observe(self.on.config_changed, self._on_config_changed)
         self.framework.observe(self.on.stop, self._on_stop)
+        self.framework.observe(self.on.update_status, self._on_update_status)
         self.framework.observe(self.etcd.on.available, self._on_etcd_available)
-        self.metrics_cfg = PrometheusConfig(
-            target_ip=self.private_ip,
-            target_port=int(self.config["prometheus_target_port"]),
-            tls_cert_path=self.config["prometheus_tls_cert_path"],
-            tls_key_path=self.config["prometheus_tls_key_path"],
-            basic_auth_username=self.config["prometheus_basic_auth_username"],
-            basic_auth_password=self.config["prometheus_basic_auth_password"],
-            extra_labels=self.config["prometheus_extra_labels"],
-            metrics_path=self.config["prometheus_metrics_path"],
+        self.framework.observe(
+            self.on.show_performance_profile_action, self._on_show_performance_profile_action
+        )
+        self.framework.observe(self.on.etcd_maintenance_action, self._on_etcd_maintenance_action)
+        self.framework.observe(self.on.create_backup_action, self._on_create_backup_action)
+        self.framework.observe(self.on.restore_backup_action, self._on_restore_backup_action)
+        self.framework.observe(self.on.artifacts_gc_action, self._on_artifacts_gc_action)
+        self.framework.observe(self.on.prefetch_images_action, self._on_prefetch_images_action)
+        self.framework.observe(self.on.stage_snap_action, self._on_stage_snap_action)
+        self.framework.observe(
+            self.on.suggest_port_range_action, self._on_suggest_port_range_action
         )
+        self.framework.observe(self.on.set_debug_logging_action, self._on_set_debug_logging_action)
+        self._charm_config: Optional[CharmConfig] = None
+        self._charm_options: Dict = {}
+        self.metrics_cfg = self._prometheus_config()
         self._cos = COSAgentProvider(
             self,
             relation_name="cos-agent",
@@ -91,8 +190,21 @@ class AmsOperatorCharm(CharmBase):
         self.framework.observe(
             self.on["lxd-cluster"].relation_joined, self._on_lxd_integrator_joined
         )
+        self.framework.observe(
+            self.on["lxd-cluster"].relation_changed, self._on_lxd_integrator_joined
+        )
+        self.framework.observe(
+            self.on.rotate_lxd_client_certificate_action,
+            self._on_rotate_lxd_client_certificate_action,
+        )
         self.framework.observe(self.on["rest-api"].relation_joined, self._on_rest_api_joined)
         self.framework.observe(self.on["rest-api"].relation_departed, self._on_rest_api_departed)
+        self.framework.observe(self.on[PEER_RELATION].relation_changed, self._publish_endpoints)
+        self.framework.observe(self.on[PEER_RELATION].relation_departed, self._publish_endpoints)
+        self.framework.observe(self.on.leader_elected, self._publish_endpoints)
+        self.framework.observe(self.on["website"].relation_joined, self._on_website_changed)
+        self.framework.observe(self.on["website"].relation_changed, self._on_website_changed)
+        self.framework.observe(self.on["website"].relation_broken, self._on_website_broken)
 
     @property
     def public_ip(self) -> str:
@@ -104,83 +216,938 @@ class AmsOperatorCharm(CharmBase):
         """Private address of the unit."""
         return self.model.get_binding("juju-info").network.bind_address.exploded
 
+    @property
+    def charm_config(self) -> CharmConfig:
+        """Return the validated charm options, parsed again only when they changed."""
+        options = dict(self.config)
+        if self._charm_config is None or options != self._charm_options:
+            self._charm_config = CharmConfig.from_options(options)
+            self._charm_options = options
+        return self._charm_config
+
+    def _valid_config(self) -> Optional[CharmConfig]:
+        """Return the charm options, blocking the unit if they are invalid."""
+        try:
+            return self.charm_config
+        except ConfigError as e:
+            self.unit.status = BlockedStatus(str(e))
+            return None
+
+    def _max_concurrent_restarts(self) -> int:
+        try:
+            return self.charm_config.max_concurrent_restarts
+        except ConfigError:
+            # Restart one unit at a time until the options are fixed
+            return 1
+
+    def _prometheus_config(self) -> Optional[PrometheusConfig]:
+        try:
+            cfg = self.charm_config
+        except ConfigError as e:
+            logger.warning("Metrics are not configured: %s", e)
+            return None
+        return PrometheusConfig(
+            target_ip=self.private_ip,
+            target_port=cfg.prometheus_target_port,
+            tls_cert_path=cfg.prometheus_tls_cert_path,
+            tls_key_path=cfg.prometheus_tls_key_path,
+            basic_auth_username=cfg.prometheus_basic_auth_username,
+            basic_auth_password=cfg.prometheus_basic_auth_password,
+            extra_labels=cfg.prometheus_extra_labels,
+            metrics_path=cfg.prometheus_metrics_path,
+        )
+
     def generate_scrape_config(self) -> List[Dict]:
         """Generate dynamic configs for sending metrics to prometheus."""
-        if not (self.metrics_cfg and self.metrics_cfg.enabled):
-            return []
-        logger.debug("Generated prometheus config: %s", self.metrics_cfg.scrape_jobs)
-        return self.metrics_cfg.scrape_jobs
+        jobs = []
+        try:
+            cfg = self.charm_config
+        except ConfigError:
+            return jobs
+        if self.metrics_cfg and self.metrics_cfg.enabled:
+            jobs.extend(self.metrics_cfg.scrape_jobs)
+        if cfg.use_etcd_proxy and not cfg.use_embedded_etcd:
+            jobs.extend(self.etcd_proxy.scrape_jobs)
+        if cfg.charm_metrics_port:
+            jobs.extend(self.metrics_exporter.scrape_jobs(cfg.charm_metrics_port))
+        logger.debug("Generated prometheus config: %s", jobs)
+        return jobs
 
     def _on_install(self, event: InstallEvent):
         if not _is_pro_attached():
             self.unit.status = BlockedStatus("Waiting for Ubuntu Pro attachment")
             return
-        snap_risk_level = self.config.get("snap_risk_level", SNAP_DEFAULT_RISK)
-        revision = self.config.get("snap_revision", "")
-        self.ams.install(channel=f"{CHARM_VERSION}/{snap_risk_level}", revision=revision)
-        self.unit.set_workload_version(self.ams.version)
+        if self._valid_config() is None:
+            return
+        self._install_ams()
+        self._refill_key_pool()
 
     def _on_upgrade(self, _: UpgradeCharmEvent):
-        snap_risk_level = self.config.get("snap_risk_level", SNAP_DEFAULT_RISK)
-        revision = self.config.get("snap_revision", "")
-        self.ams.install(f"{CHARM_VERSION}/{snap_risk_level}", revision=revision)
+        self.rolling.acquire("refresh")
+
+    def _on_rolling_operation(self, operation: str):
+        self.unit.status = MaintenanceStatus(f"Rolling {operation} of AMS")
+        try:
+            if operation == "refresh":
+                self._install_ams()
+            else:
+                self.ams.restart()
+        except CommandError as e:
+            self._on_command_error(e)
+        except ConfigError as e:
+            self.unit.status = BlockedStatus(str(e))
+
+    def _snap_target_key(self) -> str:
+        cfg = self.charm_config
+        return f"{cfg.snap_risk_level}@{cfg.snap_revision}"
+
+    def _install_ams(self):
+        target = self._snap_target_key()
+        snap_file = self._fetch_resource("ams-snap")
+        if snap_file:
+            self._install_snap_resource(snap_file)
+        elif not self._install_staged_snap():
+            cfg = self.charm_config
+            self.ams.install(
+                channel=f"{CHARM_VERSION}/{cfg.snap_risk_level}",
+                revision=cfg.snap_revision,
+                extra_steps=self._lxd_identity_steps(),
+            )
+        # Only recorded once reached, so a failed refresh is retried
+        self._state.snap_target = target
         self.unit.set_workload_version(self.ams.version)
 
+    def _lxd_identity_steps(self) -> Dict[str, Step]:
+        """Return steps creating the LXD client identity while AMS is installed.
+
+        The key generation only needs CPU, so it overlaps with the snap download
+        on first deploy instead of blocking the hook once LXD is related.
+        """
+        if self.ams.lxd_client_certificate is not None:
+            return {}
+        identity = {}
+        # The model is only accessed from the hook thread
+        public_ip, private_ip = self.public_ip, self.private_ip
+
+        def _generate():
+            identity["cert"], identity["key"] = AmsOperatorCharm._generate_selfsigned_cert(
+                public_ip, public_ip, private_ip, new_key=self._new_private_key
+            )
+
+        return {
+            "lxd-keygen": Step(_generate),
+            "lxd-identity": Step(
+                lambda: self.ams.setup_lxd(**identity), after=("snap", "lxd-keygen")
+            ),
+        }
+
+    def _snap_target(self) -> Optional[Tuple[str, int]]:
+        """Return the targeted snap revision and its download size, 0 if unknown."""
+        cfg = self.charm_config
+        if cfg.snap_revision:
+            return cfg.snap_revision, 0
+        return self.ams.store_revision(f"{CHARM_VERSION}/{cfg.snap_risk_level}")
+
+    def _install_staged_snap(self) -> bool:
+        """Refresh to the staged revision if it is the one targeted."""
+        staged = self.snap_stager.staged
+        if not staged:
+            return False
+        target = self._snap_target()
+        if not target or target[0] != staged.revision:
+            logger.info("Staged AMS revision %s is not targeted anymore", staged.revision)
+            self.snap_stager.clear()
+            return False
+        self.unit.status = MaintenanceStatus(
+            f"Refreshing AMS to staged revision {staged.revision}"
+        )
+        self.ams.install_local(staged.snap, assertion=staged.assertion)
+        self.snap_stager.clear()
+        self._state.snap_staging_revision = ""
+        return True
+
+    def _stage_snap(self, revision: str = "") -> str:
+        """Start downloading a revision in the background and return it."""
+        size = 0
+        if not revision:
+            target = self._snap_target()
+            if not target:
+                return ""
+            revision, size = target
+        if revision == str(self.ams.snap.revision):
+            return ""
+        if self.snap_stager.start(revision):
+            self._state.snap_staging_revision = revision
+            self._state.snap_staging_size = size
+        return revision
+
+    def _on_stage_snap_action(self, event: ActionEvent):
+        try:
+            revision = self._stage_snap(event.params["revision"])
+        except CommandError as e:
+            event.fail(str(e))
+            return
+        if not revision:
+            event.fail("No revision to stage, the targeted revision is installed")
+            return
+        event.set_results({"revision": revision, "status": self._staging_message()})
+
+    def _staging_message(self) -> str:
+        staged = self.snap_stager.staged
+        if staged:
+            return f"AMS revision {staged.revision} staged"
+        revision = self._state.snap_staging_revision
+        if not revision or not self.snap_stager.downloading:
+            return ""
+        progress = self.snap_stager.progress(self._state.snap_staging_size)
+        if progress is None:
+            return f"Downloading AMS revision {revision}"
+        return f"Downloading AMS revision {revision}: {progress:.0%}"
+
+    def _fetch_resource(self, name: str) -> Optional[Path]:
+        """Return the path of an attached resource, `None` if missing or empty."""
+        try:
+            path = self.model.resources.fetch(name)
+        except (ModelError, NameError):
+            return None
+        return path if path.stat().st_size else None
+
+    def _install_snap_resource(self, snap_file: Path):
+        digest = hashlib.sha256()
+        with snap_file.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        checksum = digest.hexdigest()
+        if checksum == self._state.snap_resource_sha256 and self.ams.snap.present:
+            logger.info("AMS snap resource %s is already installed", checksum)
+            return
+        self.unit.status = MaintenanceStatus("Installing AMS from snap resource")
+        self.ams.install_local(snap_file, assertion=self._fetch_resource("ams-snap-assert"))
+        self._state.snap_resource_sha256 = checksum
+
     def _on_stop(self, _: StopEvent):
-        self.ams.remove()
+        try:
+            self.ams.remove()
+        except CommandError as e:
+            logger.warning("Cannot remove AMS: %s", e)
+        self.etcd_proxy.remove()
+        self.metrics_exporter.disable()
+        self.key_pool.clear()
+        try:
+            self.kernel_tuning.reset()
+        except KernelTuningError as e:
+            logger.warning("Cannot restore the kernel defaults: %s", e)
 
     def _on_config_changed(self, event: ConfigChangedEvent):
         self.unit.status = WaitingStatus("Configuring AMS")
-        etcd_cfg = ETCDConfig(
-            use_embedded=self.config["use_embedded_etcd"],
-        )
-        if not etcd_cfg.is_ready:
-            if not self.etcd.is_available:
-                self.unit.status = BlockedStatus("Waiting for etcd")
-                return
-            servers = self.etcd.get_config().get("connection_string", "").split(",")
-            logger.info(f"Received servers {servers}")
+        try:
+            cfg = self.charm_config
+        except ConfigError as e:
+            self.unit.status = BlockedStatus(str(e))
+            return
+        try:
+            self.kernel_tuning.apply(self._performance_settings())
+        except KernelTuningError as e:
+            self.unit.status = BlockedStatus(str(e))
+            return
+        try:
+            self._setup_storage()
+        except StorageError as e:
+            self.unit.status = BlockedStatus(str(e))
+            return
+        etcd_cfg = self._etcd_config()
+        external = not etcd_cfg.is_ready
+        if external:
+            servers = self._external_etcd_servers(etcd_cfg)
             if not servers:
                 self.unit.status = BlockedStatus("Waiting for etcd")
                 return
             etcd_cfg.servers = servers
+        try:
+            if external:
+                etcd_cfg.servers = self._setup_etcd_proxy(etcd_cfg)
+            self._apply_ams_config(self._service_config(etcd_cfg))
+        except CommandError as e:
+            self._on_command_error(e)
+            if e.transient:
+                event.defer()
+            return
+        self._publish_proxy_backend()
+        self._setup_metrics_exporter()
+        self.unit.set_ports(cfg.port)
+        self._update_unit_endpoint()
+        self._set_readiness_status()
+
+    def _service_config(self, etcd_cfg: ETCDConfig) -> ServiceConfig:
+        cfg = self.charm_config
         backend_cfg = BackendConfig(
-            port_range=self.config["port_range"],
-            lxd_project=self.config["lxd_project"],
-            force_tls12=self.config["force_tls12"],
-            use_network_acl=self.config["use_network_acl"],
+            port_range=str(cfg.port_range),
+            lxd_project=cfg.lxd_project,
+            force_tls12=cfg.force_tls12,
+            use_network_acl=cfg.use_network_acl,
         )
-        if self.config["metrics_server"]:
-            backend_cfg.metrics_server = f"influxdb:{self.config['metrics_server']}"
+        if cfg.metrics_server:
+            backend_cfg.metrics_server = f"{METRICS_SERVER_PREFIX}{cfg.metrics_server}"
 
-        cfg = ServiceConfig(
+        return ServiceConfig(
             ip=self.private_ip,
-            port=int(self.config["port"]),
-            log_level=self.config["log_level"],
+            port=cfg.port,
+            log_level=self._log_level(),
             metrics=self.metrics_cfg,
             backend=backend_cfg,
             store=etcd_cfg,
         )
-        self.ams.configure(cfg)
-        if self.config["location"]:
-            self.ams.set_location(self.config["location"], self.config["port"])
-        if self.config["config"]:
-            self.ams.apply_service_configuration(self.config["config"].split("\n"))
-        self.unit.set_ports(int(self.config["port"]))
-        self.unit.status = ActiveStatus()
+
+    def _log_level(self) -> str:
+        if self._state.debug_logging_until > time.time():
+            return "debug"
+        return self.charm_config.log_level
+
+    def _on_set_debug_logging_action(self, event: ActionEvent):
+        try:
+            configured = self.charm_config.log_level
+        except ConfigError as e:
+            event.fail(str(e))
+            return
+        minutes = int(event.params["minutes"])
+        self._state.debug_logging_until = time.time() + minutes * 60 if minutes else 0.0
+        self.on.config_changed.emit()
+        try:
+            if minutes:
+                # Reverts AMS on time even if no hook runs, the settings follow on update-status
+                self.ams.schedule_log_level_revert(configured, minutes)
+            else:
+                self.ams.cancel_log_level_revert()
+        except CommandError as e:
+            logger.warning("Cannot schedule the log level revert: %s", e)
+        results = {"log-level": self._log_level()}
+        if minutes:
+            results["until"] = time.strftime(
+                "%Y-%m-%dT%H:%M:%SZ", time.gmtime(self._state.debug_logging_until)
+            )
+        event.set_results(results)
+
+    def _apply_ams_config(self, cfg: ServiceConfig):
+        if self._state.snap_target and self._state.snap_target != self._snap_target_key():
+            self.rolling.acquire("refresh")
+        if self.ams.configure(cfg):
+            self.rolling.acquire("restart")
+        self._update_location()
+        if self.charm_config.config:
+            self.ams.apply_service_configuration(self.charm_config.config)
+
+    def _etcd_config(self) -> ETCDConfig:
+        cfg = self.charm_config
+        return ETCDConfig(
+            use_embedded=cfg.use_embedded_etcd,
+            data_path=etcd_data_path(cfg.storage_device, cfg.etcd_storage_device),
+            quota_backend_bytes=cfg.etcd_quota_backend_bytes,
+            snapshot_count=cfg.etcd_snapshot_count,
+            auto_compaction_mode=cfg.etcd_auto_compaction_mode,
+            auto_compaction_retention=cfg.etcd_auto_compaction_retention,
+            heartbeat_interval=cfg.etcd_heartbeat_interval,
+            election_timeout=cfg.etcd_election_timeout,
+        )
+
+    def _external_etcd_servers(self, etcd_cfg: ETCDConfig) -> List[str]:
+        """Return the servers of the related etcd, healthiest first."""
+        if not self.etcd.is_available:
+            return []
+        servers = self._ordered_etcd_servers(etcd_cfg)
+        logger.info(f"Received servers {servers}")
+        if servers:
+            self._state.etcd_servers = servers
+        return servers
+
+    def _setup_etcd_proxy(self, etcd_cfg: ETCDConfig) -> List[str]:
+        """Return the servers AMS connects to, routed through the local proxy if enabled."""
+        if not self.charm_config.use_etcd_proxy:
+            self.etcd_proxy.remove()
+            return etcd_cfg.servers
+        install_etcd(self.charm_config.etcd_snap_channel)
+        self.etcd_proxy.configure(
+            etcd_cfg.servers, ca=etcd_cfg.ca, cert=etcd_cfg.cert, key=etcd_cfg.key
+        )
+        return [self.etcd_proxy.endpoint]
+
+    def _on_update_status(self, _: UpdateStatusEvent):
+        cfg = self._valid_config()
+        if cfg is None:
+            return
+        if self._state.debug_logging_until and time.time() >= self._state.debug_logging_until:
+            logger.info("Debug logging expired, reverting to %s", cfg.log_level)
+            self._state.debug_logging_until = 0.0
+            self.on.config_changed.emit()
+        if cfg.use_embedded_etcd:
+            if cfg.etcd_periodic_compaction:
+                self._compact_embedded_etcd()
+        elif self.etcd.is_available and self._state.etcd_servers:
+            servers = self._ordered_etcd_servers(ETCDConfig(use_embedded=False))
+            if servers and servers != list(self._state.etcd_servers):
+                logger.info("etcd endpoint order changed to %s", servers)
+                self.on.config_changed.emit()
+        self._run_scheduled_artifacts_gc()
+        self._progress_lxd_rotation()
+        self._check_certificate_expiry()
+        self._check_port_usage()
+        self._refill_key_pool()
+        self.rolling.update()
+        if cfg.snap_prestage:
+            try:
+                self._stage_snap()
+            except CommandError as e:
+                logger.warning("Cannot stage AMS snap: %s", e)
+        self._update_unit_endpoint()
+        self._publish_endpoints()
+        if not isinstance(self.unit.status, BlockedStatus) or self._state.port_range_blocked:
+            self._set_readiness_status()
+
+    def _on_command_error(self, error: CommandError):
+        """Report a failed command instead of failing the hook."""
+        logger.error("%s", error)
+        if error.transient:
+            self.unit.status = WaitingStatus(f"Retrying later: {error}")
+        else:
+            self.unit.status = BlockedStatus(str(error))
+
+    def _on_pre_commit(self, _):
+        """Account the time spent retrying commands during this hook."""
+        if not retry_stats:
+            return
+        totals = dict(self._state.command_retry_totals)
+        for operation, stats in retry_stats.items():
+            logger.info(
+                "Spent %.1fs in %d retries of %s", stats["seconds"], stats["retries"], operation
+            )
+            retries, seconds = totals.get(operation, (0, 0.0))
+            totals[operation] = [retries + stats["retries"], seconds + stats["seconds"]]
+        retry_stats.clear()
+        self._state.command_retry_totals = totals
+        gauges = []
+        for operation, (retries, seconds) in totals.items():
+            labels = {"operation": operation}
+            gauges.append(
+                Gauge("ams_charm_command_retries", retries, "Retries of commands", labels)
+            )
+            gauges.append(
+                Gauge(
+                    "ams_charm_command_retry_seconds",
+                    round(seconds, 3),
+                    "Seconds spent retrying commands",
+                    labels,
+                )
+            )
+        self.metrics_exporter.set("commands", gauges)
+
+    def _set_readiness_status(self):
+        readiness = self.ams.readiness()
+        self._state.port_range_blocked = readiness.ready and self._port_range_exhausted()
+        if self._state.port_range_blocked:
+            node, allocated, capacity = self._state.port_usage
+            self.unit.status = BlockedStatus(
+                f"Port range exhausted on {node}: {allocated}/{capacity} ports allocated, "
+                "extend port_range"
+            )
+        elif readiness.ready:
+            messages = (
+                self.rolling.message or self._refresh_message(),
+                self._staging_message(),
+                self._certificate_message,
+                self._port_usage_message(),
+            )
+            message = "; ".join(m for m in messages if m)
+            self.unit.status = ActiveStatus(message)
+        else:
+            self.unit.status = WaitingStatus(f"AMS is not ready: {readiness.reason}")
+
+    def _refresh_message(self) -> str:
+        target = self._snap_target_key()
+        if self._state.snap_target and self._state.snap_target != target:
+            return f"AMS not refreshed to {target} yet"
+        return ""
+
+    def _check_port_usage(self):
+        """Export the port range utilisation per node, keeping the most used one."""
+        try:
+            port_range = self.charm_config.port_range
+        except ConfigError:
+            return
+        if not self.ams.is_running:
+            return
+        try:
+            usages = port_usage(self.ams.list_instances(), port_range)
+        except CommandError as e:
+            logger.warning("Cannot determine the port range usage: %s", e)
+            return
+        gauges = []
+        for usage in usages:
+            labels = {"node": usage.node}
+            gauges.extend(
+                [
+                    Gauge(
+                        "ams_charm_port_range_capacity",
+                        usage.capacity,
+                        "Ports in the range of a node",
+                        labels,
+                    ),
+                    Gauge(
+                        "ams_charm_ports_allocated",
+                        usage.allocated,
+                        "Ports of the range allocated on a node",
+                        labels,
+                    ),
+                    Gauge(
+                        "ams_charm_port_range_utilisation",
+                        round(usage.utilisation, 4),
+                        "Allocated fraction of the port range of a node",
+                        labels,
+                    ),
+                ]
+            )
+        self.metrics_exporter.set("ports", gauges)
+        top = usages[0] if usages else None
+        self._state.port_usage = [top.node, top.allocated, top.capacity] if top else []
+
+    def _port_utilisation(self) -> float:
+        if not self._state.port_usage:
+            return 0.0
+        _, allocated, capacity = self._state.port_usage
+        return allocated / capacity if capacity else 1.0
+
+    def _port_range_exhausted(self) -> bool:
+        threshold = self.charm_config.port_usage_blocked
+        return bool(threshold) and self._port_utilisation() * 100 >= threshold
+
+    def _port_usage_message(self) -> str:
+        threshold = self.charm_config.port_usage_warning
+        utilisation = self._port_utilisation()
+        if not threshold or utilisation * 100 < threshold:
+            return ""
+        return f"Port range {utilisation:.0%} used on {self._state.port_usage[0]}"
+
+    def _on_suggest_port_range_action(self, event: ActionEvent):
+        try:
+            current = self.charm_config.port_range
+            instances = self.ams.list_instances() if self.ams.is_running else []
+        except (ConfigError, CommandError) as e:
+            event.fail(str(e))
+            return
+        per_instance = float(event.params["ports-per-instance"]) or ports_per_instance(instances)
+        try:
+            suggested = suggest_range(
+                int(event.params["instances"]),
+                per_instance,
+                start=current.start,
+                headroom=int(event.params["headroom"]) / 100,
+            )
+        except ValueError as e:
+            event.fail(str(e))
+            return
+        event.set_results(
+            {
+                "port-range": str(suggested),
+                "capacity": suggested.count,
+                "current-capacity": current.count,
+                "ports-per-instance": round(per_instance, 2),
+            }
+        )
+
+    def _setup_metrics_exporter(self):
+        port = self.charm_config.charm_metrics_port
+        if port:
+            self.metrics_exporter.enable("127.0.0.1", port)
+        else:
+            self.metrics_exporter.disable()
+
+    def _collect_artifacts(self, delete: bool, min_age: int = DEFAULT_MIN_AGE) -> GCReport:
+        objects = []
+        for kind in ("image", "addon", "application"):
+            objects.extend(self.ams.list_objects(kind))
+        report = collect(ARTIFACTS_PATH, referenced_ids(objects), delete=delete, min_age=min_age)
+        self.metrics_exporter.set("artifacts", report.gauges)
+        return report
+
+    def _run_scheduled_artifacts_gc(self):
+        interval = self.charm_config.artifacts_gc_interval * 3600
+        if not interval or time.time() - self._state.artifacts_gc_last_run < interval:
+            return
+        if not self.ams.is_running:
+            return
+        try:
+            report = self._collect_artifacts(delete=True)
+        except subprocess.CalledProcessError as e:
+            logger.warning("Scheduled artifact garbage collection failed: %s", e)
+            return
+        self._state.artifacts_gc_last_run = time.time()
+        logger.info("Reclaimed %d bytes of orphaned artifacts", report.reclaimable_bytes)
+
+    def _on_artifacts_gc_action(self, event: ActionEvent):
+        if not self.ams.is_running:
+            event.fail("AMS is not running")
+            return
+        try:
+            report = self._collect_artifacts(
+                delete=not event.params["dry-run"], min_age=event.params["min-age"]
+            )
+        except subprocess.CalledProcessError as e:
+            event.fail(f"Failed to list AMS objects: {e}")
+            return
+        event.set_results(
+            {
+                "total-bytes": report.total_bytes,
+                "total-files": report.total_files,
+                "reclaimable-bytes": report.reclaimable_bytes,
+                "orphans": "\n".join(str(a.path) for a in report.orphans),
+                "unmatched-ids": ",".join(report.unmatched_ids),
+                "deleted": report.deleted,
+            }
+        )
+
+    def _ordered_etcd_servers(self, etcd_cfg: ETCDConfig) -> List[str]:
+        connection_string = self.etcd.get_config().get("connection_string", "")
+        servers = [s for s in connection_string.split(",") if s]
+        return order_by_latency(
+            servers,
+            ca=etcd_cfg.ca,
+            cert=etcd_cfg.cert,
+            key=etcd_cfg.key,
+            previous=list(self._state.etcd_servers),
+        )
+
+    def _compact_embedded_etcd(self):
+        """Compact the embedded store up to the revision seen on the previous run.
+
+        Keeping one update-status interval of history allows AMS watches to resume
+        without hitting an already compacted revision.
+        """
+        if not self.ams.is_running:
+            return
+        client = ETCDClient()
+        try:
+            current = client.revision
+            previous = self._state.etcd_compaction_revision
+            if 0 < previous < current:
+                client.compact(previous)
+            self._state.etcd_compaction_revision = current
+        except ETCDError as e:
+            logger.warning("Periodic etcd compaction failed: %s", e)
+
+    def _on_etcd_maintenance_action(self, event: ActionEvent):
+        try:
+            use_embedded = self.charm_config.use_embedded_etcd
+        except ConfigError as e:
+            event.fail(str(e))
+            return
+        if not use_embedded:
+            event.fail("Maintenance is only supported for the embedded etcd")
+            return
+        client = ETCDClient()
+        try:
+            size_before = int(client.status().get("dbSize", 0))
+            revision = client.compact()
+            if event.params["defragment"]:
+                client.defragment()
+            size_after = int(client.status().get("dbSize", 0))
+        except ETCDError as e:
+            event.fail(str(e))
+            return
+        self._state.etcd_compaction_revision = revision
+        event.set_results(
+            {
+                "compacted-revision": revision,
+                "db-size-before": size_before,
+                "db-size-after": size_after,
+            }
+        )
+
+    def _on_create_backup_action(self, event: ActionEvent):
+        try:
+            etcd = ETCDClient() if self.charm_config.use_embedded_etcd else None
+        except ConfigError as e:
+            event.fail(str(e))
+            return
+        try:
+            results = create_backup(
+                Path(event.params["directory"]),
+                ARTIFACTS_PATH,
+                etcd=etcd,
+                incremental=event.params["incremental"],
+            )
+        except (BackupError, ETCDError, OSError) as e:
+            event.fail(str(e))
+            return
+        event.set_results(results)
+
+    def _on_restore_backup_action(self, event: ActionEvent):
+        try:
+            cfg = self.charm_config
+        except ConfigError as e:
+            event.fail(str(e))
+            return
+        etcd_data = None
+        if cfg.use_embedded_etcd:
+            etcd_data = self._etcd_config().data_path
+            try:
+                install_etcd(cfg.etcd_snap_channel)
+            except CommandError as e:
+                event.fail(str(e))
+                return
+        try:
+            staged = stage_backup(Path(event.params["archive"]), ARTIFACTS_PATH, etcd_data)
+        except BackupError as e:
+            event.fail(str(e))
+            return
+        self.unit.status = MaintenanceStatus("Restoring backup")
+        try:
+            self.ams.stop()
+            staged.apply()
+        except (CommandError, OSError) as e:
+            event.fail(f"Cannot restore backup: {e}")
+        else:
+            event.set_results({"restored": staged.manifest["name"]})
+        finally:
+            staged.cleanup()
+        try:
+            self.ams.start()
+        except CommandError as e:
+            self._on_command_error(e)
+            return
+        self._set_readiness_status()
+
+    def _on_prefetch_images_action(self, event: ActionEvent):
+        targets = [
+            PrefetchTarget(name=name.strip(), raw=True)
+            for name in event.params["images"].split(",")
+            if name.strip()
+        ]
+        targets += [
+            PrefetchTarget(name=name.strip(), raw=False)
+            for name in event.params["applications"].split(",")
+            if name.strip()
+        ]
+        if not targets:
+            event.fail("No image or application given")
+            return
+        nodes = [n.strip() for n in event.params["nodes"].split(",") if n.strip()]
+        if not nodes:
+            try:
+                nodes = [node["name"] for node in self.ams.list_objects("node")]
+            except subprocess.CalledProcessError as e:
+                event.fail(f"Failed to list LXD nodes: {e}")
+                return
+
+        def _progress(result: PrefetchResult):
+            state = "done" if result.ok else f"failed ({result.error})"
+            event.log(f"{result.target} on {result.node}: {state} after {result.seconds:.1f}s")
+
+        results = prefetch(
+            self.ams,
+            targets,
+            nodes,
+            parallelism=event.params["parallelism"],
+            timeout=event.params["timeout"],
+            progress=_progress,
+        )
+        failed = [r for r in results if not r.ok]
+        event.set_results(
+            {
+                "staged": len(results) - len(failed),
+                "failed": len(failed),
+                "results": json.dumps(
+                    [
+                        {
+                            "target": r.target,
+                            "node": r.node,
+                            "seconds": round(r.seconds, 1),
+                            "error": r.error,
+                        }
+                        for r in sorted(results, key=lambda r: (r.node, r.target))
+                    ],
+                    indent=2,
+                ),
+            }
+        )
+        if failed:
+            event.fail(f"Failed to stage {len(failed)} of {len(results)} targets")
+
+    def _setup_storage(self):
+        cfg = self.charm_config
+        if cfg.use_embedded_etcd:
+            stranded = stranded_etcd_data(
+                etcd_data_path(cfg.storage_device, cfg.etcd_storage_device)
+            )
+            if stranded:
+                raise StorageError(
+                    f"Embedded etcd data is in {stranded}, storage devices cannot change "
+                    "after deployment"
+                )
+        mounts = plan_mounts(
+            cfg.storage_device,
+            etcd_device=cfg.etcd_storage_device,
+            filesystem=cfg.storage_filesystem,
+        )
+        for mount in mounts:
+            ensure_mount(mount)
+            check_mount(mount)
+
+    def _performance_settings(self) -> Dict[str, str]:
+        cfg = self.charm_config
+        return resolve_profile(
+            cfg.performance_profile,
+            custom=cfg.performance_sysctl,
+            port_range=str(cfg.port_range),
+        )
+
+    def _on_show_performance_profile_action(self, event: ActionEvent):
+        try:
+            expected = self._performance_settings()
+        except ConfigError as e:
+            event.fail(str(e))
+            return
+        keys = sorted(set(expected) | set(self.kernel_tuning.managed_keys))
+        effective = self.kernel_tuning.effective_values(keys)
+        settings = {
+            key: {"expected": expected.get(key, ""), "effective": effective[key]} for key in keys
+        }
+        event.set_results(
+            {
+                "profile": self.charm_config.performance_profile,
+                "settings": json.dumps(settings, indent=2),
+                "in-sync": str(all(expected.get(k) == effective[k] for k in expected)),
+            }
+        )
 
     def _on_etcd_available(self, _):
         cfg = self.etcd.get_config()
-        self.ams.setup_etcd(ca=cfg["ca"], cert=cfg["cert"], key=cfg["key"])
-        self.on.config_changed.emit()
+        changed = self.ams.setup_etcd(ca=cfg["ca"], cert=cfg["cert"], key=cfg["key"])
+        servers = set(cfg["connection_string"].split(","))
+        if changed or servers != set(self._state.etcd_servers):
+            self.on.config_changed.emit()
+
+    def _on_lxd_integrator_joined(self, _):
+        self._progress_lxd_rotation()
+        self.lxd.publish(self._lxd_client_certificates())
+
+    def _lxd_client_certificates(self) -> List[str]:
+        """Return the client certificates to publish, creating the identity if needed.
+
+        All LXD clusters share one persisted identity so joining another cluster or
+        re-joining never invalidates the trust established with the others.
+        """
+        cert = self.ams.lxd_client_certificate
+        if cert is None:
+            cert, key = AmsOperatorCharm._generate_selfsigned_cert(
+                self.public_ip, self.public_ip, self.private_ip, new_key=self._new_private_key
+            )
+            self.ams.setup_lxd(cert=cert, key=key)
+        certs = [cert.decode("utf-8")]
+        for other in (
+            self.ams.pending_lxd_client_certificate,
+            self.ams.previous_lxd_client_certificate,
+        ):
+            if other is not None:
+                certs.append(other.decode("utf-8"))
+        return certs
+
+    def _progress_lxd_rotation(self):
+        """Move a rotation of the LXD client certificate to its next step.
+
+        The pending certificate is only installed once every cluster trusts it,
+        and AMS loads it through a rolling restart. The replaced certificate
+        stays published until AMS is ready again and the clusters accept the
+        new identity, so a failed restart can still fall back to it.
+        """
+        if self.ams.previous_lxd_client_certificate is not None:
+            if self.rolling.pending or not self.ams.is_running:
+                logger.debug("Waiting for AMS to restart with the new LXD client certificate")
+                return
+            if not self.lxd.is_trusted(LXD_CLIENT_CERT_PATH, LXD_CLIENT_KEY_PATH):
+                logger.debug("Waiting for LXD clusters to accept the new LXD client certificate")
+                return
+            self.ams.withdraw_previous_lxd_client_certificate()
+            logger.info("Withdrew the replaced LXD client certificate")
+            self.lxd.publish(self._lxd_client_certificates())
+            return
+        if self.ams.pending_lxd_client_certificate is None:
+            return
+        if not self.lxd.is_trusted(LXD_PENDING_CERT_PATH, LXD_PENDING_KEY_PATH):
+            logger.debug("Waiting for LXD clusters to trust the new client certificate")
+            return
+        self.ams.complete_lxd_rotation()
+        self.rolling.acquire("restart")
+
+    def _lxd_rotation_in_progress(self) -> bool:
+        return (
+            self.ams.pending_lxd_client_certificate is not None
+            or self.ams.previous_lxd_client_certificate is not None
+        )
+
+    def _on_rotate_lxd_client_certificate_action(self, event: ActionEvent):
+        if self._lxd_rotation_in_progress():
+            event.fail("A certificate rotation is already in progress")
+            return
+        if self.ams.lxd_client_certificate is None:
+            event.fail("No LXD client certificate to rotate")
+            return
+        cert = self._start_lxd_rotation()
+        event.set_results({"pending-certificate": cert.decode("utf-8")})
 
-    def _on_lxd_integrator_joined(self, event: RelationJoinedEvent):
+    def _start_lxd_rotation(self) -> bytes:
+        """Publish a new LXD client certificate next to the one in use and return it."""
         cert, key = AmsOperatorCharm._generate_selfsigned_cert(
-            self.public_ip, self.public_ip, self.private_ip
+            self.public_ip, self.public_ip, self.private_ip, new_key=self._new_private_key
         )
-        self.ams.setup_lxd(cert=cert, key=key)
-        relation_data = event.relation.data[self.unit]
-        relation_data["client_certificates"] = json.dumps([cert.decode("utf-8")])
+        self.ams.stage_lxd_rotation(cert=cert, key=key)
+        self.lxd.publish(self._lxd_client_certificates())
+        return cert
+
+    def _managed_certificates(self) -> Dict[str, bytes]:
+        """Return the PEM of all certificates AMS relies on by name."""
+        certs = {
+            "lxd-client": self.ams.lxd_client_certificate,
+            "lxd-client-pending": self.ams.pending_lxd_client_certificate,
+            "lxd-client-previous": self.ams.previous_lxd_client_certificate,
+            "etcd-client": self.ams.etcd_client_certificate,
+        }
+        for relation in self.model.relations["rest-api"]:
+            for unit in relation.units:
+                client_cert = relation.data[unit].get("client_certificate")
+                if client_cert:
+                    certs[f"rest-api:{unit.name}"] = ast.literal_eval(client_cert).encode()
+        return {name: pem for name, pem in certs.items() if pem}
+
+    def _check_certificate_expiry(self):
+        """Export the time left on all certificates and renew the LXD one ahead of expiry.
+
+        The LXD client certificate is rotated through the same overlap as the
+        rotate action, so the clusters trust the new one before the old expires.
+        Certificates issued by related applications can only be reported.
+        """
+        threshold = self.charm_config.cert_renewal_days * 86400
+        now = time.time()
+        gauges, expiring = [], []
+        for cert in self.certificates.index(self._managed_certificates()):
+            remaining = cert.remaining(now)
+            gauges.append(
+                Gauge(
+                    "ams_charm_certificate_expiry_seconds",
+                    round(remaining),
+                    "Seconds until a certificate used by AMS expires",
+                    {"certificate": cert.name},
+                )
+            )
+            if remaining > threshold or cert.name in ("lxd-client-pending", "lxd-client-previous"):
+                continue
+            if cert.name == "lxd-client" and not self._lxd_rotation_in_progress():
+                logger.info("LXD client certificate expires in %ds, rotating it", remaining)
+                self._start_lxd_rotation()
+            elif cert.name != "lxd-client":
+                logger.warning("Certificate %s expires in %ds", cert.name, remaining)
+                expiring.append(cert)
+        self.metrics_exporter.set("certificates", gauges)
+        if expiring:
+            days = max(int(expiring[0].remaining(now) // 86400), 0)
+            self._certificate_message = f"Certificate {expiring[0].name} expires in {days} days"
 
     def _on_rest_api_joined(self, event: RelationJoinedEvent):
         remote_data = event.relation.data.get(event.unit)
@@ -192,23 +1159,36 @@ class AmsOperatorCharm(CharmBase):
             event.defer()
             logger.error("No client certificate found")
             return
-        if not self.ams.is_running:
+        if self._valid_config() is None or not self.ams.is_running:
             event.defer()
             return
-        fingerprint = self.ams.register_client(ast.literal_eval(client_cert))
+        try:
+            fingerprint = self.ams.register_client(ast.literal_eval(client_cert))
+        except CommandError as e:
+            self._on_command_error(e)
+            if e.transient:
+                event.defer()
+            return
         if fingerprint:
             self._state.registered_clients.add(f"{event.unit.name}:{fingerprint}")
         logger.info("Client registration with AMS complete")
         data = {
-            "port": str(self.config["port"]),
+            "port": str(self.charm_config.port),
             "private_address": self.private_ip,
             "public_address": self.public_ip,
             "node": self.unit.name.replace("/", ""),
         }
-        location = self.ams.get_config_item("load_balancer.url")
+        try:
+            location = self.ams.get_config_item("load_balancer.url")
+        except CommandError as e:
+            self._on_command_error(e)
+            if e.transient:
+                event.defer()
+            return
         if location:
             data["private_address"] = location
         event.relation.data[self.unit].update(data)
+        self._publish_endpoints()
 
     def _on_rest_api_departed(self, event: RelationDepartedEvent):
         fp = None
@@ -220,12 +1200,135 @@ class AmsOperatorCharm(CharmBase):
         if not fp:
             logger.warning(f"No client found for {event.unit} to unregister")
             return
-        self.ams.unregister_client(fp)
+        try:
+            self.ams.unregister_client(fp)
+        except CommandError as e:
+            self._on_command_error(e)
+            if e.transient:
+                event.defer()
+            return
+
+    def _update_location(self, broken: Optional[Relation] = None):
+        cfg = self.charm_config
+        location = cfg.location or self.reverse_proxy.frontend_address(exclude=broken)
+        if not location and broken is not None:
+            # The proxy went away, clients have to reach this unit directly again
+            location = self.private_ip
+        if location:
+            self.ams.set_location(location, cfg.port)
+
+    def _publish_proxy_backend(self):
+        cfg = self.charm_config
+        self.reverse_proxy.publish(
+            self.private_ip,
+            cfg.port,
+            weight=cfg.proxy_weight,
+            maxconn=cfg.proxy_maxconn,
+        )
+
+    def _on_website_changed(self, event):
+        if self._valid_config() is None:
+            return
+        self._publish_proxy_backend()
+        if not self.ams.is_running:
+            return
+        try:
+            self._update_location()
+        except CommandError as e:
+            self._on_command_error(e)
+            if e.transient:
+                event.defer()
+
+    def _on_website_broken(self, event: RelationBrokenEvent):
+        if self._valid_config() is None:
+            return
+        if not self.ams.is_running:
+            event.defer()
+            return
+        try:
+            self._update_location(broken=event.relation)
+        except CommandError as e:
+            self._on_command_error(e)
+            if e.transient:
+                event.defer()
+
+    def _unit_weight(self) -> int:
+        metrics = (self.metrics_cfg and fetch_metrics(self.metrics_cfg)) or {}
+        rate = 0.0
+        if REQUESTS_METRIC in metrics:
+            now = time.time()
+            rate = request_rate(metrics[REQUESTS_METRIC], self._state.api_requests_sample, now)
+            self._state.api_requests_sample = [metrics[REQUESTS_METRIC], now]
+        return compute_weight(metrics.get(SESSIONS_METRIC, 0.0), rate)
+
+    def _update_unit_endpoint(self):
+        """Share the endpoint, health and load of this unit with its peers."""
+        peers = self.model.get_relation(PEER_RELATION)
+        if not peers:
+            return
+        data = {
+            "address": self.private_ip,
+            "port": str(self.charm_config.port),
+            "node": self.unit.name.replace("/", ""),
+            "healthy": str(self.ams.is_running),
+            "weight": str(self._unit_weight()),
+        }
+        if any(peers.data[self.unit].get(k) != v for k, v in data.items()):
+            peers.data[self.unit].update(data)
+
+    def _endpoints(self) -> List[Endpoint]:
+        peers = self.model.get_relation(PEER_RELATION)
+        if not peers:
+            return []
+        endpoints = []
+        for unit in {self.unit, *peers.units}:
+            data = peers.data[unit]
+            if not data.get("address"):
+                continue
+            endpoints.append(
+                Endpoint(
+                    node=data["node"],
+                    address=data["address"],
+                    port=int(data["port"]),
+                    healthy=data.get("healthy") == "True",
+                    weight=int(data.get("weight", 0)),
+                )
+            )
+        return sorted(endpoints, key=lambda e: e.node)
+
+    def _publish_endpoints(self, _=None):
+        """Publish all AMS endpoints with their load to the API clients.
+
+        Only the leader writes the list and only when it changed, so clients are
+        not woken up on every update-status hook.
+        """
+        if not self.unit.is_leader():
+            return
+        content = json.dumps([e.to_dict() for e in self._endpoints()])
+        for relation in self.model.relations["rest-api"]:
+            if relation.data[self.app].get("endpoints") != content:
+                relation.data[self.app]["endpoints"] = content
+
+    def _new_private_key(self) -> bytes:
+        """Return a pre-generated private key, generating one if the pool ran out."""
+        key = self.key_pool.take()
+        if key is None:
+            logger.info("Key pool is empty, generating a private key inline")
+            key = generate_private_key(key_size=KEY_SIZE)
+        return key
+
+    def _refill_key_pool(self):
+        size = self.charm_config.key_pool_size
+        if size <= 0:
+            self.key_pool.clear()
+            return
+        self.key_pool.trim(size)
+        self.key_pool.refill_in_background(size)
 
     @staticmethod
     def _generate_selfsigned_cert(
-        hostname, public_ip, private_ip
-    ) -> Tuple[bytes, bytes]:  # noqa: F821
+        hostname, public_ip, private_ip, new_key: Optional[Callable[[], bytes]] = None
+    ) -> Tuple[bytes, bytes]:
         if not hostname:
             raise Exception("A hostname is required")
 
@@ -235,10 +1338,11 @@ class AmsOperatorCharm(CharmBase):
         if not private_ip:
             raise Exception("A private IP is required")
 
-        ca_key = generate_private_key(key_size=4096)
+        new_key = new_key or (lambda: generate_private_key(key_size=KEY_SIZE))
+        ca_key = new_key()
         ca_cert = generate_ca(ca_key, hostname)
 
-        key = generate_private_key(key_size=4096)
+        key = new_key()
         csr = generate_csr(
             private_key=key,
             subject=hostname,
@@ -0,0 +1,212 @@
+"""Module to parse and validate the charm options."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import re
+from typing import Dict, Literal, Mapping, NamedTuple
+
+from pydantic import BaseModel, ValidationError, conint, validator
+from sysctl import PROFILES, InvalidProfileError, parse_sysctl_settings
+
+Port = conint(ge=1, le=65535)
+OptionalPort = conint(ge=0, le=65535)
+NonNegative = conint(ge=0)
+Percentage = conint(ge=0, le=100)
+
+METRICS_SERVER_PREFIX = "influxdb:"
+METRICS_SERVER_PATTERN = re.compile(
+    r"^(?:[^:@\s]+:[^@\s]*@)?(?:[\w.-]+|\[[0-9a-fA-F:]+\])(?::\d{1,5})?$"
+)
+CONFIG_ITEM_PATTERN = re.compile(r"^[a-z0-9_-]+(?:\.[a-z0-9_-]+)*$")
+
+
+class ConfigError(Exception):
+    """Raised when charm options are invalid."""
+
+
+class PortRange(NamedTuple):
+    """Inclusive range of ports."""
+
+    start: int
+    end: int
+
+    @property
+    def count(self) -> int:
+        """Return the number of ports in the range."""
+        return self.end - self.start + 1
+
+    def __str__(self) -> str:
+        """Render the range the way AMS and sysctl expect it."""
+        return f"{self.start}-{self.end}"
+
+
+class CharmConfig(BaseModel):
+    """Typed charm options, parsed into the values the charm works with.
+
+    Options needing more than a type check are parsed by the validators below,
+    so every hook uses the same derived values and bad input is reported once
+    with the name of the option instead of reaching AMS.
+    """
+
+    class Config:
+        """Options are read-only once parsed."""
+
+        allow_mutation = False
+        extra = "forbid"
+
+    snap_risk_level: Literal["stable", "candidate", "beta", "edge"]
+    snap_revision: str
+    snap_prestage: bool
+    port: Port
+    storage_device: str
+    etcd_storage_device: str
+    storage_filesystem: Literal["xfs", "ext4"]
+    storage_pool: str
+    log_level: Literal["debug", "info", "warning", "error", "critical"]
+    prometheus_target_port: OptionalPort
+    prometheus_metrics_path: str
+    prometheus_tls_cert_path: str
+    prometheus_tls_key_path: str
+    prometheus_basic_auth_username: str
+    prometheus_basic_auth_password: str
+    prometheus_extra_labels: Dict[str, str]
+    port_range: PortRange
+    metrics_server: str
+    config: Dict[str, str]
+    registry_mode: str
+    lxd_project: str
+    force_tls12: bool
+    use_network_acl: bool
+    location: str
+    performance_profile: str
+    performance_sysctl: Dict[str, str]
+    use_embedded_etcd: bool
+    etcd_quota_backend_bytes: NonNegative
+    etcd_snapshot_count: NonNegative
+    etcd_auto_compaction_mode: Literal["", "periodic", "revision"]
+    etcd_auto_compaction_retention: str
+    etcd_heartbeat_interval: NonNegative
+    etcd_election_timeout: NonNegative
+    etcd_periodic_compaction: bool
+    use_etcd_proxy: bool
+    etcd_snap_channel: str
+    charm_metrics_port: OptionalPort
+    proxy_weight: conint(ge=0, le=256)
+    proxy_maxconn: NonNegative
+    max_concurrent_restarts: conint(ge=1)
+    key_pool_size: NonNegative
+    cert_renewal_days: NonNegative
+    artifacts_gc_interval: NonNegative
+    port_usage_warning: Percentage
+    port_usage_blocked: Percentage
+
+    @validator("snap_revision")
+    @classmethod
+    def _validate_revision(cls, value: str) -> str:
+        if value and not value.isdigit():
+            raise ValueError("must be a snap revision number")
+        return value
+
+    @validator("etcd_storage_device")
+    @classmethod
+    def _validate_etcd_device(cls, value: str, values: Dict) -> str:
+        if value and value == values.get("storage_device"):
+            raise ValueError("must differ from storage_device")
+        return value
+
+    @validator("prometheus_extra_labels", pre=True)
+    @classmethod
+    def _parse_labels(cls, value: str) -> Dict[str, str]:
+        labels = {}
+        for label in filter(None, (item.strip() for item in value.split(","))):
+            key, sep, val = label.partition("=")
+            if not sep or not key.strip():
+                raise ValueError(f"'{label}' is not of the form key=value")
+            labels[key.strip()] = val.strip()
+        return labels
+
+    @validator("port_range", pre=True)
+    @classmethod
+    def _parse_port_range(cls, value: str) -> PortRange:
+        match = re.fullmatch(r"\s*(\d+)\s*-\s*(\d+)\s*", value)
+        if not match:
+            raise ValueError(f"'{value}' is not of the form <first port>-<last port>")
+        ports = PortRange(int(match.group(1)), int(match.group(2)))
+        if not 1 <= ports.start <= ports.end <= 65535:
+            raise ValueError(f"'{value}' must be an ascending range within 1-65535")
+        return ports
+
+    @validator("metrics_server")
+    @classmethod
+    def _validate_metrics_server(cls, value: str) -> str:
+        # The documented form carries the prefix the charm adds itself
+        if value.startswith(METRICS_SERVER_PREFIX):
+            value = value[len(METRICS_SERVER_PREFIX) :]
+        if value and not METRICS_SERVER_PATTERN.match(value):
+            raise ValueError(f"'{value}' is not of the form [user:password@]host[:port]")
+        return value
+
+    @validator("config", pre=True)
+    @classmethod
+    def _parse_config_items(cls, value: str) -> Dict[str, str]:
+        items = {}
+        for line in filter(None, (line.strip() for line in value.splitlines())):
+            name, sep, item = line.partition("=")
+            name = name.strip()
+            if not sep or not CONFIG_ITEM_PATTERN.match(name):
+                raise ValueError(f"'{line}' is not of the form <name>=<value>")
+            items[name] = item.strip()
+        return items
+
+    @validator("performance_profile")
+    @classmethod
+    def _validate_profile(cls, value: str) -> str:
+        if value not in PROFILES:
+            raise ValueError(f"unknown profile '{value}', use one of {', '.join(PROFILES)}")
+        return value
+
+    @validator("performance_sysctl", pre=True)
+    @classmethod
+    def _parse_sysctl(cls, value: str) -> Dict[str, str]:
+        try:
+            return parse_sysctl_settings(value)
+        except InvalidProfileError as e:
+            raise ValueError(str(e)) from e
+
+    @validator("etcd_auto_compaction_retention")
+    @classmethod
+    def _validate_retention(cls, value: str, values: Dict) -> str:
+        if values.get("etcd_auto_compaction_mode") and not value:
+            raise ValueError("must be set when etcd_auto_compaction_mode is")
+        return value
+
+    @validator("etcd_election_timeout")
+    @classmethod
+    def _validate_election_timeout(cls, value: int, values: Dict) -> int:
+        heartbeat = values.get("etcd_heartbeat_interval")
+        if heartbeat and value < 5 * heartbeat:
+            raise ValueError("must be at least 5 times etcd_heartbeat_interval")
+        return value
+
+    @classmethod
+    def from_options(cls, options: Mapping) -> "CharmConfig":
+        """Parse the charm options, raising `ConfigError` naming the first invalid one."""
+        try:
+            return cls.parse_obj(dict(options))
+        except ValidationError as e:
+            error = e.errors()[0]
+            option = error["loc"][0]
+            raise ConfigError(f"Invalid {option}: {error['msg']}") from e
@@ -0,0 +1,110 @@
+"""Module to describe AMS endpoints and their load to API clients."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import base64
+import logging
+import ssl
+import urllib.error
+import urllib.request
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Sequence
+
+from ams import PrometheusConfig
+
+# Metrics of the AMS Prometheus endpoint the load of a unit is derived from and
+# the amount of each considered to be a full unit of load.
+SESSIONS_METRIC = "ams_containers_running"
+REQUESTS_METRIC = "ams_http_requests_total"
+SESSIONS_PER_LOAD = 100
+REQUESTS_PER_SECOND_PER_LOAD = 50
+MAX_WEIGHT = 100
+# Weights are published in steps so small load changes do not cause relation churn
+WEIGHT_STEP = 10
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Endpoint:
+    """AMS endpoint as published to API clients."""
+
+    node: str
+    address: str
+    port: int
+    healthy: bool
+    weight: int
+
+    def to_dict(self) -> dict:
+        """Return the endpoint as a dict."""
+        return asdict(self)
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Sum all samples of each metric in a Prometheus text exposition."""
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        if "}" in line:
+            sample, rest = line.rsplit("}", 1)
+        else:
+            sample, _, rest = line.partition(" ")
+        name = sample.split("{", 1)[0].strip()
+        try:
+            values[name] = values.get(name, 0.0) + float(rest.split()[0])
+        except (ValueError, IndexError):
+            continue
+    return values
+
+
+def fetch_metrics(cfg: PrometheusConfig, timeout: float = 2.0) -> Optional[Dict[str, float]]:
+    """Fetch the metrics AMS exposes for Prometheus, `None` if not available."""
+    if not cfg.enabled:
+        return None
+    scheme = "https" if cfg.tls_cert_path and cfg.tls_key_path else "http"
+    req = urllib.request.Request(f"{scheme}://{cfg.target_ip}:{cfg.target_port}{cfg.metrics_path}")
+    if cfg.basic_auth_username and cfg.basic_auth_password:
+        auth = f"{cfg.basic_auth_username}:{cfg.basic_auth_password}".encode()
+        req.add_header("Authorization", f"Basic {base64.b64encode(auth).decode()}")
+    context = None
+    if scheme == "https":
+        # The endpoint is local and uses a self signed certificate
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    try:
+        with urllib.request.urlopen(req, timeout=timeout, context=context) as resp:
+            return parse_metrics(resp.read().decode())
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        logger.debug("Failed to fetch AMS metrics: %s", e)
+        return None
+
+
+def request_rate(current: float, previous: Sequence[float], now: float) -> float:
+    """Return the requests per second since the previous `(count, time)` sample."""
+    count, when = previous
+    if not when or now <= when or current < count:
+        # No previous sample or the counter was reset by an AMS restart
+        return 0.0
+    return (current - count) / (now - when)
+
+
+def compute_weight(sessions: float, requests_per_second: float) -> int:
+    """Derive a load balancing weight, higher for less loaded units."""
+    load = sessions / SESSIONS_PER_LOAD + requests_per_second / REQUESTS_PER_SECOND_PER_LOAD
+    weight = MAX_WEIGHT / (1 + load)
+    return max(1, int(round(weight / WEIGHT_STEP)) * WEIGHT_STEP)
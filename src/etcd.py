@@ -0,0 +1,238 @@
+"""Module to talk to the etcd store used by AMS."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import base64
+import json
+import logging
+import ssl
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+from charms.operator_libs_linux.v1 import systemd
+from jinja2 import Environment, FileSystemLoader
+from runner import run
+
+EMBEDDED_ETCD_ENDPOINT = "http://127.0.0.1:2379"
+PROBE_TIMEOUT = 2.0
+# An endpoint only moves ahead of another one when it answers faster by more
+# than this margin, so jitter does not reorder the endpoints on every probe.
+PROBE_MARGIN = 0.005
+
+ETCD_SNAP = "etcd"
+ETCD_INSTALL_TIMEOUT = 600
+ETCD_BINARY = f"/snap/{ETCD_SNAP}/current/bin/etcd"
+ETCDCTL_BINARY = f"/snap/{ETCD_SNAP}/current/bin/etcdctl"
+ETCD_PROXY_SERVICE = "ams-etcd-proxy.service"
+ETCD_PROXY_UNIT_PATH = Path(f"/etc/systemd/system/{ETCD_PROXY_SERVICE}")
+ETCD_PROXY_PORT = 23790
+ETCD_PROXY_METRICS_PORT = 23791
+
+logger = logging.getLogger(__name__)
+
+
+class ETCDError(Exception):
+    """Raised when a request to etcd fails."""
+
+
+class ETCDClient:
+    """Minimal client for the etcd v3 JSON gateway."""
+
+    def __init__(
+        self,
+        endpoint: str = EMBEDDED_ETCD_ENDPOINT,
+        ca: Optional[Path] = None,
+        cert: Optional[Path] = None,
+        key: Optional[Path] = None,
+        timeout: float = 10,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.timeout = timeout
+        self._context = None
+        if self.endpoint.startswith("https://"):
+            self._context = ssl.create_default_context(cafile=str(ca) if ca else None)
+            if cert and key:
+                self._context.load_cert_chain(str(cert), str(key))
+
+    def _request(self, path: str, body: Optional[dict] = None) -> dict:
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(f"{self.endpoint}{path}", data=data)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout, context=self._context) as resp:
+                return json.loads(resp.read() or b"{}")
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise ETCDError(f"etcd request {path} to {self.endpoint} failed: {e}") from e
+
+    def health(self) -> bool:
+        """Check if the etcd member reports itself as healthy."""
+        req = urllib.request.Request(f"{self.endpoint}/health")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout, context=self._context) as resp:
+                return json.loads(resp.read()).get("health") == "true"
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            logger.debug("etcd health check for %s failed: %s", self.endpoint, e)
+            return False
+
+    def status(self) -> dict:
+        """Return the status of the etcd member."""
+        return self._request("/v3/maintenance/status", {})
+
+    @property
+    def revision(self) -> int:
+        """Return the current revision of the store."""
+        return int(self.status()["header"]["revision"])
+
+    def compact(self, revision: Optional[int] = None) -> int:
+        """Compact the key space up to the given or the current revision."""
+        if revision is None:
+            revision = self.revision
+        self._request("/v3/kv/compaction", {"revision": str(revision), "physical": True})
+        logger.info("Compacted etcd at %s up to revision %d", self.endpoint, revision)
+        return revision
+
+    def snapshot(self, dest: Path):
+        """Stream a point in time snapshot of the store into a file."""
+        req = urllib.request.Request(f"{self.endpoint}/v3/maintenance/snapshot", data=b"{}")
+        try:
+            with urllib.request.urlopen(
+                req, timeout=self.timeout, context=self._context
+            ) as resp, dest.open("wb") as f:
+                # The gateway streams one JSON object per chunk of the snapshot
+                for line in resp:
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise ETCDError(f"etcd snapshot failed: {chunk['error']}")
+                    f.write(base64.b64decode(chunk["result"].get("blob", "")))
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise ETCDError(f"etcd snapshot from {self.endpoint} failed: {e}") from e
+
+    def defragment(self):
+        """Release the space freed by compaction back to the filesystem."""
+        self._request("/v3/maintenance/defragment", {})
+        logger.info("Defragmented etcd at %s", self.endpoint)
+
+
+def probe(endpoint: str, ca: Path, cert: Path, key: Path) -> Optional[float]:
+    """Return the round trip time of a TLS handshake plus health check, `None` if unhealthy."""
+    try:
+        client = ETCDClient(endpoint, ca=ca, cert=cert, key=key, timeout=PROBE_TIMEOUT)
+    except (ssl.SSLError, OSError) as e:
+        logger.warning("Cannot load etcd client certificates: %s", e)
+        return None
+    start = time.monotonic()
+    if not client.health():
+        return None
+    return time.monotonic() - start
+
+
+def order_by_latency(
+    servers: List[str], ca: Path, cert: Path, key: Path, previous: Optional[List[str]] = None
+) -> List[str]:
+    """Order etcd endpoints by measured round trip time and drop unhealthy ones.
+
+    Endpoints keep their previous order unless one is faster than an endpoint
+    ahead of it by more than `PROBE_MARGIN`. If no endpoint answers, the list
+    is returned unchanged so AMS can still retry on its own.
+    """
+    if not servers:
+        return []
+    with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+        rtts = list(executor.map(lambda s: probe(s, ca, cert, key), servers))
+    healthy = {s: rtt for s, rtt in zip(servers, rtts) if rtt is not None}
+    if not healthy:
+        logger.warning("No healthy etcd endpoint found, keeping %s", servers)
+        return servers
+    for server in set(servers) - set(healthy):
+        logger.warning("Excluding unhealthy etcd endpoint %s", server)
+    previous = previous or []
+    known = [s for s in previous if s in healthy] + [s for s in servers if s not in previous]
+    ordered: List[str] = []
+    for server in (s for s in known if s in healthy):
+        position = len(ordered)
+        while position and healthy[ordered[position - 1]] - healthy[server] > PROBE_MARGIN:
+            position -= 1
+        ordered.insert(position, server)
+    return ordered
+
+
+def install_etcd(channel: str):
+    """Install the snap shipping the etcd binaries used by the charm.
+
+    Raises `CommandError` if the snap cannot be installed or refreshed in time.
+    """
+    action = "refresh" if Path(f"/snap/{ETCD_SNAP}/current").exists() else "install"
+    run(
+        ["snap", action, ETCD_SNAP, f"--channel={channel}"],
+        operation=f"etcd snap {action}",
+        timeout=ETCD_INSTALL_TIMEOUT,
+    )
+
+
+class ETCDProxy:
+    """Local etcd gRPC proxy caching reads and coalescing watches for AMS."""
+
+    endpoint = f"http://127.0.0.1:{ETCD_PROXY_PORT}"
+    metrics_target = f"localhost:{ETCD_PROXY_METRICS_PORT}"
+
+    def configure(self, endpoints: List[str], ca: Path, cert: Path, key: Path) -> bool:
+        """Point the proxy at the upstream endpoints, returning whether it was restarted."""
+        tenv = Environment(loader=FileSystemLoader("templates"))
+        template = tenv.get_template(f"{ETCD_PROXY_SERVICE}.j2")
+        content = template.render(
+            {
+                "binary": ETCD_BINARY,
+                "endpoints": endpoints,
+                "port": ETCD_PROXY_PORT,
+                "metrics_port": ETCD_PROXY_METRICS_PORT,
+                "ca": ca,
+                "cert": cert,
+                "key": key,
+            }
+        )
+        if ETCD_PROXY_UNIT_PATH.exists() and ETCD_PROXY_UNIT_PATH.read_text() == content:
+            if not systemd.service_running(ETCD_PROXY_SERVICE):
+                systemd.service_start(ETCD_PROXY_SERVICE)
+            return False
+        ETCD_PROXY_UNIT_PATH.write_text(content)
+        systemd.daemon_reload()
+        systemd.service_enable(ETCD_PROXY_SERVICE)
+        systemd.service_restart(ETCD_PROXY_SERVICE)
+        logger.info("etcd proxy now forwards to %s", ", ".join(endpoints))
+        return True
+
+    def remove(self):
+        """Stop and remove the proxy service."""
+        if not ETCD_PROXY_UNIT_PATH.exists():
+            return
+        systemd.service_stop(ETCD_PROXY_SERVICE)
+        systemd.service_disable(ETCD_PROXY_SERVICE)
+        ETCD_PROXY_UNIT_PATH.unlink()
+        systemd.daemon_reload()
+
+    @property
+    def scrape_jobs(self) -> List[dict]:
+        """Generate scrape jobs for the proxy cache and latency metrics."""
+        return [
+            {
+                "job_name": "etcd-proxy",
+                "metrics_path": "/metrics",
+                "static_configs": [{"targets": [self.metrics_target]}],
+            }
+        ]
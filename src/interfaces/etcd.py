@@ -57,10 +57,14 @@ class ETCDEndpointConsumer(ops.framework.Object):
 
     def _on_etcd_changed(self, event: ops.RelationChangedEvent):
         data = event.relation.data[event.unit]
+        current = self.get_config()
         self._state.cert = data.get("client_cert")
         self._state.key = data.get("client_key")
         self._state.ca = data.get("client_ca")
         self._state.connection_string = data.get("connection_string")
+        if self.get_config() == current:
+            logger.debug("etcd relation data unchanged")
+            return
         if self.is_available:
             self.on.available.emit()
 
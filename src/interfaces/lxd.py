@@ -0,0 +1,100 @@
+"""LXD Interface for AMS charm."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import http.client
+import json
+import logging
+import ssl
+from pathlib import Path
+from typing import List, Optional
+
+import ops
+
+LXD_PORT = 8443
+PROBE_TIMEOUT = 5
+
+logger = logging.getLogger(__name__)
+
+
+def probe_trust(
+    address: str, cert: Path, key: Path, port: int = LXD_PORT, timeout: float = PROBE_TIMEOUT
+) -> Optional[bool]:
+    """Ask LXD whether it trusts a client certificate, `None` if it cannot be asked.
+
+    LXD reports in `/1.0` whether the client certificate of the request is
+    trusted. Only that answer is used, so the server certificate is not verified.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    conn = None
+    try:
+        # Fails when the certificate is being replaced while probing
+        context.load_cert_chain(str(cert), str(key))
+        conn = http.client.HTTPSConnection(address, port, timeout=timeout, context=context)
+        conn.request("GET", "/1.0")
+        metadata = json.loads(conn.getresponse().read()).get("metadata") or {}
+    except (ssl.SSLError, OSError, ValueError, http.client.HTTPException) as e:
+        logger.debug("Cannot ask LXD at %s about trust: %s", address, e)
+        return None
+    finally:
+        if conn:
+            conn.close()
+    return metadata.get("auth") == "trusted"
+
+
+class LXDClusterConsumer(ops.framework.Object):
+    """LXD consumer interface publishing the client certificates of AMS."""
+
+    def __init__(self, charm: ops.CharmBase, relation_name: str):
+        super().__init__(charm, relation_name)
+        self._charm = charm
+        self._relation_name = relation_name
+
+    @property
+    def relations(self) -> List[ops.Relation]:
+        """Return all LXD cluster relations."""
+        return self._charm.model.relations[self._relation_name]
+
+    def publish(self, certificates: List[str]) -> bool:
+        """Publish client certificates on all relations where they differ."""
+        content = json.dumps(certificates)
+        changed = False
+        for relation in self.relations:
+            data = relation.data[self._charm.unit]
+            if data.get("client_certificates") != content:
+                data["client_certificates"] = content
+                changed = True
+        if changed:
+            logger.info("Published %d LXD client certificate(s)", len(certificates))
+        return changed
+
+    def is_trusted(self, cert: Path, key: Path) -> bool:
+        """Check if every related cluster trusts a certificate, asking LXD itself.
+
+        Cluster members share their trust store, so one member per cluster
+        answering that it trusts the certificate is enough.
+        """
+        for relation in self.relations:
+            addresses = [
+                relation.data[unit].get("ingress-address")
+                or relation.data[unit].get("private-address")
+                for unit in relation.units
+            ]
+            if not any(probe_trust(a, cert, key) for a in addresses if a):
+                return False
+        return True
@@ -0,0 +1,89 @@
+"""Reverse proxy Interface for AMS charm."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+from typing import List, Optional
+
+import ops
+import yaml
+
+SERVICE_NAME = "ams"
+# TLS is passed through to AMS, so connections are balanced at the TCP level and
+# health checks only require the API to answer over TLS, whatever the status.
+SERVICE_OPTIONS = [
+    "mode tcp",
+    "balance leastconn",
+    "option httpchk GET /1.0",
+    "http-check expect rstatus ^[234]",
+]
+CHECK_OPTIONS = "check check-ssl verify none inter 5s rise 2 fall 3"
+
+logger = logging.getLogger(__name__)
+
+
+class ReverseProxyProvider(ops.framework.Object):
+    """Provider side of the `http` interface used by haproxy to balance AMS units."""
+
+    def __init__(self, charm: ops.CharmBase, relation_name: str):
+        super().__init__(charm, relation_name)
+        self._charm = charm
+        self._relation_name = relation_name
+
+    @property
+    def relations(self) -> List[ops.Relation]:
+        """Return all reverse proxy relations."""
+        return self._charm.model.relations[self._relation_name]
+
+    def publish(self, address: str, port: int, weight: int, maxconn: int) -> bool:
+        """Register this unit as a backend server on all relations where it differs."""
+        options = f"{CHECK_OPTIONS} weight {weight}"
+        if maxconn:
+            options += f" maxconn {maxconn}"
+        services = yaml.safe_dump(
+            [
+                {
+                    "service_name": SERVICE_NAME,
+                    "service_host": "0.0.0.0",
+                    "service_port": port,
+                    "service_options": SERVICE_OPTIONS,
+                    "servers": [[self._charm.unit.name.replace("/", "-"), address, port, options]],
+                }
+            ]
+        )
+        changed = False
+        for relation in self.relations:
+            data = relation.data[self._charm.unit]
+            if data.get("services") != services:
+                data.update({"hostname": address, "port": str(port), "services": services})
+                changed = True
+        return changed
+
+    def frontend_address(self, exclude: Optional[ops.Relation] = None) -> Optional[str]:
+        """Return the address clients reach the proxy on, `None` if not related.
+
+        A relation being broken can be excluded, as it is still listed while
+        its relation-broken hook runs.
+        """
+        for relation in self.relations:
+            if exclude is not None and relation.id == exclude.id:
+                continue
+            for unit in sorted(relation.units, key=lambda u: u.name):
+                data = relation.data[unit]
+                address = data.get("public-address") or data.get("private-address")
+                if address:
+                    return address
+        return None
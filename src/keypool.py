@@ -0,0 +1,157 @@
+"""Module to keep private keys generated ahead of the hooks needing them."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import fcntl
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+KEY_SIZE = 4096
+LOCK_FILE = ".refill.lock"
+
+logger = logging.getLogger(__name__)
+
+
+class KeyPool:
+    """Directory of RSA private keys generated ahead of time.
+
+    The keys are stored unencrypted: any passphrase would have to live on the
+    same machine, so the pool relies on the directory being 0700 and the keys
+    0600, both owned by root, like the other private keys of the charm.
+    Keys are claimed by renaming them, so a hook taking a key never races with
+    a background refill writing new ones.
+    """
+
+    def __init__(self, path: Path, key_size: int = KEY_SIZE):
+        self.path = path
+        self._key_size = key_size
+
+    def _keys(self) -> List[Path]:
+        if not self.path.exists():
+            return []
+        return sorted(self.path.glob("*.pem"), key=lambda p: p.stat().st_mtime)
+
+    def __len__(self) -> int:
+        """Return the number of keys ready to be taken."""
+        return len(self._keys())
+
+    def take(self) -> Optional[bytes]:
+        """Remove a key from the pool and return it as PEM, if any is left."""
+        for key_file in self._keys():
+            claimed = key_file.with_suffix(".claimed")
+            try:
+                key_file.rename(claimed)
+            except FileNotFoundError:
+                continue
+            try:
+                key = serialization.load_pem_private_key(claimed.read_bytes(), password=None)
+            # Keys left encrypted by earlier revisions of the charm raise TypeError
+            except (TypeError, ValueError) as e:
+                logger.warning("Discarding unreadable pooled key %s: %s", key_file.name, e)
+                continue
+            finally:
+                claimed.unlink()
+            return key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.TraditionalOpenSSL,
+                encryption_algorithm=serialization.NoEncryption(),
+            )
+        return None
+
+    def fill(self, size: int) -> int:
+        """Generate keys until the pool holds `size` of them, returning how many were added."""
+        self.path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        added = 0
+        while len(self) < size:
+            key = rsa.generate_private_key(public_exponent=65537, key_size=self._key_size)
+            content = key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption(),
+            )
+            name = uuid.uuid4().hex
+            tmp = self.path / f"{name}.tmp"
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            # The key only becomes visible to `take` once completely written
+            tmp.rename(tmp.with_suffix(".pem"))
+            added += 1
+        return added
+
+    def trim(self, size: int):
+        """Remove the oldest keys above `size`."""
+        keys = self._keys()
+        for key_file in keys[: max(len(keys) - size, 0)]:
+            key_file.unlink(missing_ok=True)
+
+    @property
+    def refilling(self) -> bool:
+        """Check if a background refill is running."""
+        lock = self.path / LOCK_FILE
+        if not lock.exists():
+            return False
+        with lock.open("a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(f, fcntl.LOCK_UN)
+        return False
+
+    def refill_in_background(self, size: int) -> bool:
+        """Start a detached process filling the pool, unless full or already refilling."""
+        if len(self) >= size or self.refilling:
+            return False
+        self.path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        subprocess.Popen(
+            [sys.executable, __file__, str(self.path), str(size), str(self._key_size)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        logger.info("Started refilling the key pool to %d keys", size)
+        return True
+
+    def clear(self):
+        """Remove all pooled keys."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def main(path: str, size: str, key_size: str):
+    """Fill a pool from a detached process, holding the refill lock meanwhile."""
+    pool = KeyPool(Path(path), key_size=int(key_size))
+    pool.path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    with (pool.path / LOCK_FILE).open("a") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        pool.fill(int(size))
+
+
+if __name__ == "__main__":  # pragma: nocover
+    main(*sys.argv[1:4])
@@ -0,0 +1,116 @@
+"""Module to export metrics collected by the charm to Prometheus."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from ams import SNAP_COMMON_PATH, write_file
+from charms.operator_libs_linux.v1 import systemd
+from jinja2 import Environment, FileSystemLoader
+
+CHARM_METRICS_PATH = SNAP_COMMON_PATH / "charm-metrics"
+CHARM_METRICS_FILE = "metrics"
+CHARM_METRICS_SERVICE = "ams-charm-metrics.service"
+CHARM_METRICS_UNIT_PATH = Path(f"/etc/systemd/system/{CHARM_METRICS_SERVICE}")
+CHARM_METRICS_SERVER = Path(__file__).parent / "metrics_server.py"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Gauge:
+    """Single gauge sample in the Prometheus text format."""
+
+    name: str
+    value: float
+    help: str
+    labels: Dict[str, str] = field(default_factory=dict)
+
+    def render(self) -> str:
+        """Render the sample without its metadata."""
+        labels = ",".join(f'{k}="{v}"' for k, v in sorted(self.labels.items()))
+        return (
+            f"{self.name}{{{labels}}} {self.value}\n" if labels else f"{self.name} {self.value}\n"
+        )
+
+
+class MetricsExporter:
+    """Expose metrics collected in hooks through a file served on loopback.
+
+    Each part of the charm owns a group of metrics which is replaced as a whole,
+    the served file is the concatenation of all groups.
+    """
+
+    def __init__(self, path: Path = CHARM_METRICS_PATH):
+        self.path = path
+
+    def set(self, group: str, gauges: List[Gauge]):
+        """Replace the metrics of a group."""
+        content, seen = "", set()
+        for gauge in sorted(gauges, key=lambda g: g.name):
+            if gauge.name not in seen:
+                content += f"# HELP {gauge.name} {gauge.help}\n# TYPE {gauge.name} gauge\n"
+                seen.add(gauge.name)
+            content += gauge.render()
+        if not write_file(self.path / "groups" / f"{group}.prom", content.encode()):
+            return
+        groups = sorted((self.path / "groups").glob("*.prom"))
+        combined = "".join(g.read_text() for g in groups)
+        write_file(self.path / CHARM_METRICS_FILE, combined.encode())
+
+    def enable(self, address: str, port: int):
+        """Serve the metrics on the given address and port."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / CHARM_METRICS_FILE).touch()
+        tenv = Environment(loader=FileSystemLoader("templates"))
+        template = tenv.get_template(f"{CHARM_METRICS_SERVICE}.j2")
+        content = template.render(
+            {
+                "server": CHARM_METRICS_SERVER,
+                "address": address,
+                "port": port,
+                "file": self.path / CHARM_METRICS_FILE,
+            }
+        ).encode()
+        if write_file(CHARM_METRICS_UNIT_PATH, content):
+            systemd.daemon_reload()
+            systemd.service_enable(CHARM_METRICS_SERVICE)
+            systemd.service_restart(CHARM_METRICS_SERVICE)
+        elif not systemd.service_running(CHARM_METRICS_SERVICE):
+            systemd.service_start(CHARM_METRICS_SERVICE)
+
+    def disable(self):
+        """Stop serving the metrics."""
+        if not CHARM_METRICS_UNIT_PATH.exists():
+            return
+        systemd.service_stop(CHARM_METRICS_SERVICE)
+        systemd.service_disable(CHARM_METRICS_SERVICE)
+        CHARM_METRICS_UNIT_PATH.unlink()
+        systemd.daemon_reload()
+
+    @staticmethod
+    def scrape_jobs(port: int) -> List[Dict]:
+        """Generate scrape jobs for the metrics collected by the charm."""
+        return [
+            {
+                "job_name": "charm",
+                "metrics_path": f"/{CHARM_METRICS_FILE}",
+                "static_configs": [{"targets": [f"localhost:{port}"]}],
+            }
+        ]
@@ -0,0 +1,57 @@
+"""Module serving the metrics file written by the charm, run as a systemd service."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# Only the standard library is available to the system python running this module
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def handler(path: Path) -> type:
+    """Build a request handler serving the file at `path` under its own name only."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            if self.path.split("?")[0] != f"/{path.name}":
+                self.send_error(404)
+                return
+            try:
+                content = path.read_bytes()
+            except OSError:
+                self.send_error(503)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *_):
+            pass
+
+    return MetricsHandler
+
+
+def main(address: str, port: str, path: str):
+    """Serve the metrics file until stopped."""
+    ThreadingHTTPServer((address, int(port)), handler(Path(path))).serve_forever()
+
+
+if __name__ == "__main__":  # pragma: nocover
+    main(*sys.argv[1:4])
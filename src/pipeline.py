@@ -0,0 +1,78 @@
+"""Module to run setup steps concurrently while respecting their dependencies."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+MAX_WORKERS = 4
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Step:
+    """Unit of work which may only start once the named steps completed."""
+
+    fn: Callable[[], object]
+    after: Tuple[str, ...] = ()
+
+
+def _timed(name: str, fn: Callable[[], object]):
+    started = time.monotonic()
+    try:
+        return fn()
+    finally:
+        logger.info("Step %s took %.2fs", name, time.monotonic() - started)
+
+
+def run_steps(steps: Dict[str, Step], max_workers: int = MAX_WORKERS):
+    """Run steps in a thread pool, each as soon as the steps it comes after completed.
+
+    Once a step fails no further step is started, the error is raised after the
+    running ones finished.
+    """
+    started = time.monotonic()
+    pending = dict(steps)
+    done = set()
+    running: Dict[Future, str] = {}
+    error: Optional[Exception] = None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            if error is None:
+                for name, step in list(pending.items()):
+                    if set(step.after) <= done:
+                        running[executor.submit(_timed, name, step.fn)] = name
+                        del pending[name]
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    done.add(name)
+                except Exception as e:
+                    logger.error("Step %s failed: %s", name, e)
+                    error = error or e
+    if error is not None:
+        raise error
+    if pending:
+        raise ValueError(f"Steps {', '.join(sorted(pending))} depend on unknown steps")
+    logger.info("Ran %d steps in %.2fs", len(done), time.monotonic() - started)
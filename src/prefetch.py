@@ -0,0 +1,96 @@
+"""Module to pre-stage images on LXD nodes managed by AMS."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from ams import AMS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefetchTarget:
+    """Image or application to pre-stage."""
+
+    name: str
+    raw: bool
+
+
+@dataclass
+class PrefetchResult:
+    """Outcome of pre-staging a target on a node."""
+
+    target: str
+    node: str
+    seconds: float
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        """Check if the target was staged successfully."""
+        return not self.error
+
+
+def _prefetch_one(ams: AMS, target: PrefetchTarget, node: str, timeout: int) -> PrefetchResult:
+    start = time.monotonic()
+    container_id = None
+    try:
+        # Launching a container is what makes AMS pull the image onto the node,
+        # the container itself is removed again once it is running.
+        container_id = ams.launch(target.name, node, raw=target.raw, timeout=timeout)
+        ams.wait_for_container(container_id, timeout=timeout)
+        error = ""
+    except subprocess.CalledProcessError as e:
+        error = (e.stderr or e.stdout or b"").decode().strip() or str(e)
+    except Exception as e:
+        error = str(e)
+    finally:
+        if container_id:
+            try:
+                ams.delete_container(container_id)
+            except subprocess.CalledProcessError as e:
+                logger.warning("Failed to delete prefetch container %s: %s", container_id, e)
+    return PrefetchResult(target.name, node, time.monotonic() - start, error)
+
+
+def prefetch(
+    ams: AMS,
+    targets: List[PrefetchTarget],
+    nodes: List[str],
+    parallelism: int = 4,
+    timeout: int = 600,
+    progress: Optional[Callable[[PrefetchResult], None]] = None,
+) -> List[PrefetchResult]:
+    """Stage every target on every node with at most `parallelism` launches at a time."""
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        futures = [
+            executor.submit(_prefetch_one, ams, target, node, timeout)
+            for node in nodes
+            for target in targets
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if progress:
+                progress(result)
+    return results
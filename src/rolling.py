@@ -0,0 +1,185 @@
+"""Module to coordinate restarts and refreshes across AMS units."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import logging
+import time
+from typing import Callable, List, Optional
+
+import ops
+
+# Operations ordered by how much they cover, a refresh also restarts AMS
+OPERATIONS = ("restart", "refresh")
+READY_TIMEOUT = 120
+READY_POLL_INTERVAL = 5
+
+logger = logging.getLogger(__name__)
+
+
+class RollingOpsCoordinator(ops.framework.Object):
+    """Peer relation lock letting a limited number of units restart at a time.
+
+    Units request the lock in their unit data, the leader grants it in request
+    order by listing units in the application data. A unit keeps the lock until
+    AMS passed its readiness check after the operation, so the next units only
+    go down once the previous ones serve again. Readiness is polled for a
+    bounded time in the hook running the operation, and checked again by later
+    hooks only if AMS took longer.
+    """
+
+    _state = ops.StoredState()
+
+    def __init__(
+        self,
+        charm: ops.CharmBase,
+        relation_name: str,
+        run: Callable[[str], None],
+        is_ready: Callable[[], bool],
+        max_concurrent: Callable[[], int],
+        ready_timeout: float = READY_TIMEOUT,
+        poll_interval: float = READY_POLL_INTERVAL,
+    ):
+        super().__init__(charm, "rolling-ops")
+        self._charm = charm
+        self._relation_name = relation_name
+        self._run = run
+        self._is_ready = is_ready
+        self._max_concurrent = max_concurrent
+        self._ready_timeout = ready_timeout
+        self._poll_interval = poll_interval
+        self._state.set_default(operation="", started=False)
+        self.framework.observe(charm.on[relation_name].relation_changed, self._on_changed)
+        self.framework.observe(charm.on[relation_name].relation_departed, self._on_changed)
+        self.framework.observe(charm.on.leader_elected, self._on_changed)
+
+    @property
+    def _relation(self) -> Optional[ops.Relation]:
+        return self._charm.model.get_relation(self._relation_name)
+
+    @property
+    def pending(self) -> str:
+        """Return the operation this unit waits for or runs, if any."""
+        return self._state.operation
+
+    def acquire(self, operation: str):
+        """Queue an operation to run once this unit holds the lock."""
+        if OPERATIONS.index(operation) < OPERATIONS.index(self._state.operation or "restart"):
+            operation = self._state.operation
+        if self._state.started:
+            # Already down for an operation, the new one runs right after it
+            self._state.started = False
+        self._state.operation = operation
+        relation = self._relation
+        if relation is None:
+            self._execute()
+            return
+        data = relation.data[self._charm.unit]
+        if not data.get("lock"):
+            data["lock"] = json.dumps({"operation": operation, "requested": time.time()})
+        self._process()
+
+    def _on_changed(self, _):
+        self._process()
+
+    def _process(self):
+        if self._relation is None:
+            if self._state.operation:
+                self._execute()
+            return
+        self._grant()
+        if self._state.operation and self._granted(self._charm.unit.name):
+            self._execute()
+
+    def update(self):
+        """Release the lock once AMS is ready again after the operation."""
+        self._process()
+
+    def _wait_ready(self) -> bool:
+        """Poll the readiness check until it passes or the timeout elapsed."""
+        deadline = time.monotonic() + self._ready_timeout
+        while not self._is_ready():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self._poll_interval)
+        return True
+
+    def _execute(self):
+        if not self._state.started:
+            logger.info("Running rolling %s", self._state.operation)
+            self._state.started = True
+            self._run(self._state.operation)
+            # Released in this hook unless AMS takes longer, then on a later one
+            ready = self._wait_ready()
+        else:
+            ready = self._is_ready()
+        if not ready:
+            return
+        logger.info("Rolling %s completed", self._state.operation)
+        self._state.operation = ""
+        self._state.started = False
+        relation = self._relation
+        if relation is not None and relation.data[self._charm.unit].get("lock"):
+            relation.data[self._charm.unit]["lock"] = ""
+            self._grant()
+
+    def _requests(self) -> List[str]:
+        """Return the units requesting the lock in request order."""
+        relation = self._relation
+        requests = []
+        for unit in {self._charm.unit, *relation.units}:
+            lock = relation.data[unit].get("lock")
+            if lock:
+                requests.append((json.loads(lock)["requested"], unit.name))
+        return [name for _, name in sorted(requests)]
+
+    def _granted(self, unit: str) -> bool:
+        relation = self._relation
+        granted = relation.data[relation.app].get("granted")
+        return unit in json.loads(granted or "[]")
+
+    def _grant(self):
+        if not self._charm.unit.is_leader():
+            return
+        relation = self._relation
+        requests = self._requests()
+        granted = json.loads(relation.data[relation.app].get("granted") or "[]")
+        granted = [unit for unit in granted if unit in requests]
+        for unit in requests:
+            if len(granted) >= max(self._max_concurrent(), 1):
+                break
+            if unit not in granted:
+                granted.append(unit)
+        content = json.dumps(granted)
+        if relation.data[relation.app].get("granted") != content:
+            relation.data[relation.app]["granted"] = content
+
+    @property
+    def message(self) -> str:
+        """Describe where this unit is in the rolling operation."""
+        operation = self._state.operation
+        if not operation:
+            return ""
+        if self._state.started:
+            return f"{operation} in progress"
+        relation = self._relation
+        if relation is None:
+            return ""
+        waiting = [u for u in self._requests() if not self._granted(u)]
+        if self._charm.unit.name not in waiting:
+            return f"{operation} in progress"
+        position = waiting.index(self._charm.unit.name) + 1
+        return f"{operation} queued at position {position}"
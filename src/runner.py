@@ -0,0 +1,159 @@
+"""Module to run external commands with bounded time and retries."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import random
+import subprocess
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, TypeVar
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 1.0
+# Output of failed commands indicating that retrying later can succeed
+TRANSIENT_MARKERS = (
+    "connection refused",
+    "connection reset",
+    "timed out",
+    "timeout",
+    "deadline exceeded",
+    "temporarily unavailable",
+    "try again",
+    "change in progress",
+    "service unavailable",
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Attempts and seconds spent retrying per operation in the current process,
+# reported through the charm metrics at the end of each hook.
+retry_stats: Dict[str, Dict[str, float]] = defaultdict(lambda: {"retries": 0, "seconds": 0.0})
+
+
+class CommandError(subprocess.CalledProcessError):
+    """Raised when a command fails, with whether retrying later can succeed."""
+
+    def __init__(self, operation: str, returncode, cmd, output=None, stderr=None, transient=False):
+        super().__init__(returncode, cmd, output=output, stderr=stderr)
+        self.operation = operation
+        self.transient = transient
+
+    def __str__(self) -> str:
+        """Describe the failure with the output of the command."""
+        detail = (self.stderr or self.output or b"").decode(errors="replace").strip()
+        kind = "transient " if self.transient else ""
+        return f"{self.operation} failed with {kind}error: {detail or self.returncode}"
+
+
+class CommandTimeoutError(CommandError):
+    """Raised when a command does not finish within its timeout."""
+
+    def __init__(self, operation: str, cmd, timeout: float):
+        super().__init__(operation, -1, cmd, transient=True)
+        self.timeout = timeout
+
+    def __str__(self) -> str:
+        """Describe the timeout."""
+        return f"{self.operation} timed out after {self.timeout}s"
+
+
+def is_transient(output: bytes) -> bool:
+    """Classify the output of a failed command as transient or permanent."""
+    text = output.decode(errors="replace").lower()
+    return any(marker in text for marker in TRANSIENT_MARKERS)
+
+
+def retry(
+    fn: Callable[[], T],
+    operation: str,
+    should_retry: Callable[[Exception], bool],
+    retries: int = DEFAULT_RETRIES,
+    backoff: float = DEFAULT_BACKOFF,
+) -> T:
+    """Call a function, retrying with jittered exponential backoff on transient errors."""
+    failed_at = None
+    try:
+        for attempt in range(retries + 1):
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == retries or not should_retry(e):
+                    raise
+                failed_at = failed_at or time.monotonic()
+                delay = random.uniform(0, backoff * 2**attempt)
+                logger.warning("%s failed (%s), retrying in %.1fs", operation, e, delay)
+                retry_stats[operation]["retries"] += 1
+                time.sleep(delay)
+    finally:
+        if failed_at is not None:
+            retry_stats[operation]["seconds"] += time.monotonic() - failed_at
+
+
+def run(
+    cmd: List[str],
+    operation: Optional[str] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    retries: int = DEFAULT_RETRIES,
+    backoff: float = DEFAULT_BACKOFF,
+    check: bool = True,
+    merge_output: bool = False,
+    env: Optional[Dict[str, str]] = None,
+) -> subprocess.CompletedProcess:
+    """Run a command with a timeout, retrying transient failures.
+
+    With `check` disabled the result of the last attempt is returned even if
+    it failed, transient failures are still retried.
+    """
+    operation = operation or " ".join(cmd[:3])
+
+    def _run() -> subprocess.CompletedProcess:
+        try:
+            result = subprocess.run(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT if merge_output else subprocess.PIPE,
+                timeout=timeout,
+                env=env,
+            )
+        except subprocess.TimeoutExpired as e:
+            raise CommandTimeoutError(operation, cmd, timeout) from e
+        if result.returncode:
+            output = (result.stderr or b"") + (result.stdout or b"")
+            error = CommandError(
+                operation,
+                result.returncode,
+                cmd,
+                output=result.stdout,
+                stderr=result.stderr,
+                transient=is_transient(output),
+            )
+            if check or error.transient:
+                raise error
+        return result
+
+    def _should_retry(e: Exception) -> bool:
+        return isinstance(e, CommandError) and e.transient
+
+    try:
+        return retry(_run, operation, _should_retry, retries=retries, backoff=backoff)
+    except CommandError as e:
+        if check or isinstance(e, CommandTimeoutError):
+            raise
+        return subprocess.CompletedProcess(cmd, e.returncode, e.output, e.stderr)
@@ -0,0 +1,105 @@
+"""Module to download AMS snap revisions ahead of upgrades."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import re
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from ams import SNAP_COMMON_PATH, SNAP_NAME
+from charms.operator_libs_linux.v1 import systemd
+from runner import run
+
+STAGING_PATH = SNAP_COMMON_PATH / "staged-snaps"
+DOWNLOAD_UNIT = "ams-snap-download"
+STAGED_SNAP_PATTERN = re.compile(rf"^{SNAP_NAME}_(\d+)\.snap$")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StagedSnap:
+    """Downloaded snap revision with its assertion."""
+
+    revision: str
+    snap: Path
+    assertion: Path
+
+
+class SnapStager:
+    """Download snap revisions in the background so upgrades only swap them in."""
+
+    def __init__(self, path: Path = STAGING_PATH):
+        self.path = path
+
+    @property
+    def staged(self) -> Optional[StagedSnap]:
+        """Return the completely downloaded revision, if any."""
+        if not self.path.exists():
+            return None
+        for snap_file in self.path.iterdir():
+            match = STAGED_SNAP_PATTERN.match(snap_file.name)
+            assertion = snap_file.with_suffix(".assert")
+            if match and assertion.exists():
+                return StagedSnap(revision=match.group(1), snap=snap_file, assertion=assertion)
+        return None
+
+    @property
+    def downloading(self) -> bool:
+        """Check if a download is in progress."""
+        return systemd.service_running(f"{DOWNLOAD_UNIT}.service")
+
+    def progress(self, size: int) -> Optional[float]:
+        """Return the downloaded fraction of a snap of the given size, if known."""
+        if not size or not self.path.exists():
+            return None
+        partial = sum(p.stat().st_size for p in self.path.glob("*.partial"))
+        return min(partial / size, 1.0)
+
+    def start(self, revision: str) -> bool:
+        """Start downloading a revision unless it is staged or a download is running."""
+        if self.downloading:
+            return False
+        staged = self.staged
+        if staged and staged.revision == revision:
+            return False
+        self.clear()
+        self.path.mkdir(parents=True, exist_ok=True)
+        # The download runs in its own unit so it outlives the hook which started it
+        run(
+            [
+                "systemd-run",
+                f"--unit={DOWNLOAD_UNIT}",
+                "--collect",
+                "--property=Nice=10",
+                "snap",
+                "download",
+                SNAP_NAME,
+                f"--revision={revision}",
+                f"--target-directory={self.path}",
+            ],
+            operation="start snap download",
+            timeout=30,
+        )
+        logger.info("Started download of %s revision %s", SNAP_NAME, revision)
+        return True
+
+    def clear(self):
+        """Remove staged and partially downloaded revisions."""
+        shutil.rmtree(self.path, ignore_errors=True)
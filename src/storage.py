@@ -0,0 +1,197 @@
+"""Module to prepare dedicated storage devices for AMS data."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+import os
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ams import SNAP_COMMON_PATH
+from runner import CommandError, run
+
+DATA_MOUNT_PATH = SNAP_COMMON_PATH / "data"
+ETCD_DATA_MOUNT_PATH = SNAP_COMMON_PATH / "etcd-data"
+FSTAB_PATH = Path("/etc/fstab")
+MOUNTS_PATH = Path("/proc/self/mounts")
+
+# Access times are never used by AMS, so `noatime` saves a metadata write per
+# read. For xfs bigger log buffers help with the many small etcd fsyncs.
+MOUNT_OPTIONS = {
+    "xfs": "defaults,noatime,inode64,logbsize=256k",
+    "ext4": "defaults,noatime,commit=30",
+}
+# Forcing is only safe because devices with any signature are never formatted
+MKFS_COMMANDS = {
+    "xfs": ["mkfs.xfs", "-q"],
+    "ext4": ["mkfs.ext4", "-q", "-F", "-m", "0"],
+}
+# Formatting writes the metadata of the whole device, which takes a while on
+# large ones, the other commands only touch the superblock.
+MKFS_TIMEOUT = 600
+MOUNT_TIMEOUT = 60
+BLKID_TIMEOUT = 30
+
+logger = logging.getLogger(__name__)
+
+
+class StorageError(Exception):
+    """Raised when a storage device cannot be prepared for AMS."""
+
+
+@dataclass
+class Mount:
+    """Storage device mounted for AMS."""
+
+    device: str
+    path: Path
+    filesystem: str = "xfs"
+
+    @property
+    def options(self) -> str:
+        """Mount options used for the filesystem."""
+        return MOUNT_OPTIONS[self.filesystem]
+
+
+def plan_mounts(device: str, etcd_device: str = "", filesystem: str = "xfs") -> List[Mount]:
+    """Return the mounts required for the storage devices validated with the charm options."""
+    mounts = []
+    if device:
+        mounts.append(Mount(device=device, path=DATA_MOUNT_PATH, filesystem=filesystem))
+    if etcd_device:
+        mounts.append(Mount(device=etcd_device, path=ETCD_DATA_MOUNT_PATH, filesystem=filesystem))
+    return mounts
+
+
+def etcd_data_path(device: str, etcd_device: str = "") -> Path:
+    """Return where the embedded etcd keeps its data for the configured devices."""
+    if device and not etcd_device:
+        return DATA_MOUNT_PATH / "etcd"
+    return ETCD_DATA_MOUNT_PATH
+
+
+def stranded_etcd_data(path: Path) -> Optional[Path]:
+    """Return where the embedded etcd kept its data before, if not at `path` anymore.
+
+    Changing the storage devices after deployment moves the etcd data path, so
+    etcd would start on an empty store while the data stays behind.
+    """
+    for candidate in (ETCD_DATA_MOUNT_PATH, DATA_MOUNT_PATH / "etcd"):
+        if candidate != path and _has_files(candidate):
+            return candidate
+    return None
+
+
+def _run(cmd: List[str], operation: str, timeout: float, **kwargs) -> subprocess.CompletedProcess:
+    try:
+        return run(cmd, operation=operation, timeout=timeout, **kwargs)
+    except CommandError as e:
+        raise StorageError(str(e)) from e
+
+
+def _blkid(device: str, tag: str) -> Optional[str]:
+    # Probes the device itself instead of the blkid cache, exits with 2 if the
+    # device has no such tag, e.g. when not formatted
+    result = _run(
+        ["blkid", "-p", "-o", "value", "-s", tag, device],
+        operation="blkid",
+        timeout=BLKID_TIMEOUT,
+        check=False,
+    )
+    return (result.stdout or b"").decode().strip() or None
+
+
+def _mounted() -> Dict[str, List[str]]:
+    mounts = {}
+    for line in MOUNTS_PATH.read_text().splitlines():
+        fields = line.split()
+        if len(fields) >= 4:
+            mounts[fields[1]] = fields[3].split(",")
+    return mounts
+
+
+def _has_files(path: Path) -> bool:
+    if not path.exists():
+        return False
+    for _, _, files in os.walk(path):
+        if files:
+            return True
+    return False
+
+
+def _format(mount: Mount):
+    if not Path(mount.device).exists():
+        raise StorageError(f"Storage device {mount.device} does not exist")
+    table = _blkid(mount.device, "PTTYPE")
+    if table:
+        raise StorageError(f"Refusing to format {mount.device}, it has a {table} partition table")
+    current = _blkid(mount.device, "TYPE")
+    if current:
+        if current not in MOUNT_OPTIONS:
+            raise StorageError(f"Refusing to format {mount.device}, it holds {current} data")
+        if current != mount.filesystem:
+            logger.warning(
+                "Keeping existing %s filesystem on %s instead of %s",
+                current,
+                mount.device,
+                mount.filesystem,
+            )
+            mount.filesystem = current
+        return
+    # Never retried, a timed out mkfs may still be writing to the device
+    _run(
+        [*MKFS_COMMANDS[mount.filesystem], mount.device],
+        operation="mkfs",
+        timeout=MKFS_TIMEOUT,
+        retries=0,
+    )
+    logger.info("Created %s filesystem on %s", mount.filesystem, mount.device)
+
+
+def _add_fstab_entry(mount: Mount):
+    uuid = _blkid(mount.device, "UUID")
+    source = f"UUID={uuid}" if uuid else mount.device
+    entries = FSTAB_PATH.read_text().splitlines() if FSTAB_PATH.exists() else []
+    for entry in entries:
+        fields = entry.split()
+        if len(fields) > 1 and not entry.startswith("#") and fields[1] == str(mount.path):
+            return
+    entries.append(f"{source} {mount.path} {mount.filesystem} {mount.options} 0 2")
+    FSTAB_PATH.write_text("\n".join(entries) + "\n")
+
+
+def ensure_mount(mount: Mount):
+    """Format, persist and mount a storage device if not done yet."""
+    if str(mount.path) in _mounted():
+        return
+    if _has_files(mount.path):
+        raise StorageError(f"Refusing to mount over existing data in {mount.path}")
+    _format(mount)
+    mount.path.mkdir(parents=True, exist_ok=True)
+    _add_fstab_entry(mount)
+    _run(["mount", str(mount.path)], operation="mount", timeout=MOUNT_TIMEOUT)
+    logger.info("Mounted %s on %s", mount.device, mount.path)
+
+
+def check_mount(mount: Mount):
+    """Check a mount is present and writable."""
+    options = _mounted().get(str(mount.path))
+    if options is None:
+        raise StorageError(f"{mount.path} is not mounted")
+    if "ro" in options or not os.access(mount.path, os.W_OK):
+        raise StorageError(f"{mount.path} is not writable")
@@ -0,0 +1,172 @@
+"""Module to manage kernel tuning profiles for AMS hosts."""
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import ops
+from runner import CommandError, CommandTimeoutError, run
+
+SYSCTL_CONFIG_PATH = Path("/etc/sysctl.d/60-ams-performance.conf")
+PROC_SYS_PATH = Path("/proc/sys")
+SYSCTL_TIMEOUT = 30
+
+PROFILE_DEFAULT = "default"
+PROFILE_HIGH_THROUGHPUT = "high-throughput"
+PROFILE_CUSTOM = "custom"
+
+PROFILES: Dict[str, Dict[str, str]] = {
+    PROFILE_DEFAULT: {},
+    PROFILE_HIGH_THROUGHPUT: {
+        "net.core.somaxconn": "4096",
+        "net.core.netdev_max_backlog": "16384",
+        "net.ipv4.tcp_max_syn_backlog": "8192",
+        "net.ipv4.ip_local_port_range": "15000 65000",
+        "net.ipv4.tcp_tw_reuse": "1",
+        "net.netfilter.nf_conntrack_max": "1048576",
+    },
+    PROFILE_CUSTOM: {},
+}
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidProfileError(Exception):
+    """Raised when a performance profile cannot be resolved."""
+
+
+class KernelTuningError(Exception):
+    """Raised when the kernel rejects sysctl settings."""
+
+
+def _sysctl(*args: str):
+    try:
+        run(["sysctl", "-e", "-q", *args], operation="sysctl", timeout=SYSCTL_TIMEOUT, retries=0)
+    except CommandTimeoutError as e:
+        raise KernelTuningError(str(e)) from e
+    except CommandError as e:
+        detail = (e.stderr or b"").decode(errors="replace").strip()
+        raise KernelTuningError(f"sysctl rejected the settings: {detail or e.returncode}") from e
+
+
+def parse_sysctl_settings(raw: str) -> Dict[str, str]:
+    """Parse newline separated `<key>=<value>` sysctl settings."""
+    settings = {}
+    for line in raw.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=" not in line:
+            raise InvalidProfileError(f"Invalid sysctl setting: {line}")
+        key, value = line.split("=", 1)
+        settings[key.strip()] = " ".join(value.split())
+    return settings
+
+
+def resolve_profile(
+    name: str, custom: Optional[Dict[str, str]] = None, port_range: str = ""
+) -> Dict[str, str]:
+    """Return the sysctl settings for a given performance profile.
+
+    The profile name and custom settings are validated with the charm options.
+    The AMS container port range is reserved from the ephemeral port range so
+    that outgoing connections never take a port AMS needs to expose a container.
+    """
+    settings = dict(PROFILES[name])
+    if name == PROFILE_CUSTOM:
+        settings.update(custom or {})
+    if settings and port_range:
+        settings.setdefault("net.ipv4.ip_local_reserved_ports", port_range)
+    return settings
+
+
+class KernelTuning(ops.framework.Object):
+    """Manage a sysctl drop-in for AMS and restore the host defaults on removal."""
+
+    _state = ops.StoredState()
+
+    def __init__(self, charm: ops.CharmBase, key: str = "kernel-tuning"):
+        super().__init__(charm, key)
+        self._state.set_default(defaults={})
+
+    @staticmethod
+    def read(key: str) -> Optional[str]:
+        """Read the effective value of a sysctl key, `None` if the key does not exist."""
+        path = PROC_SYS_PATH / key.replace(".", "/")
+        try:
+            return " ".join(path.read_text().split())
+        except OSError:
+            return None
+
+    def effective_values(self, keys: List[str]) -> Dict[str, str]:
+        """Return the effective value for each of the given keys."""
+        return {key: self.read(key) or "" for key in keys}
+
+    @property
+    def managed_keys(self) -> List[str]:
+        """Return the keys currently managed by the charm."""
+        return list(self._state.defaults.keys())
+
+    def apply(self, settings: Dict[str, str]) -> bool:
+        """Write and load the given settings, returning whether anything changed."""
+        if not settings:
+            return self.reset()
+
+        content = "".join(f"{key} = {value}\n" for key, value in sorted(settings.items()))
+        if SYSCTL_CONFIG_PATH.exists() and SYSCTL_CONFIG_PATH.read_text() == content:
+            return False
+
+        defaults = dict(self._state.defaults)
+        for key in settings:
+            if key not in defaults:
+                defaults[key] = self.read(key)
+
+        # The drop-in and the defaults are only persisted once the kernel took the
+        # settings, so a rejected setting is retried on the next hook
+        SYSCTL_CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        staged = SYSCTL_CONFIG_PATH.with_name(f".{SYSCTL_CONFIG_PATH.name}.new")
+        staged.write_text(content)
+        try:
+            _sysctl("-p", str(staged))
+        except KernelTuningError:
+            staged.unlink()
+            raise
+        for key in list(defaults):
+            if key not in settings:
+                self._write(key, defaults.pop(key))
+        staged.replace(SYSCTL_CONFIG_PATH)
+        self._state.defaults = defaults
+        logger.info("Applied kernel tuning for keys: %s", ", ".join(sorted(settings)))
+        return True
+
+    def reset(self) -> bool:
+        """Remove the managed drop-in and restore the values found before tuning."""
+        if not SYSCTL_CONFIG_PATH.exists() and not self._state.defaults:
+            return False
+        for key, value in self._state.defaults.items():
+            self._write(key, value)
+        self._state.defaults = {}
+        SYSCTL_CONFIG_PATH.unlink(missing_ok=True)
+        logger.info("Restored default kernel tuning")
+        return True
+
+    @staticmethod
+    def _write(key: str, value: Optional[str]):
+        if value is None:
+            return
+        _sysctl("-w", f"{key}={value}")
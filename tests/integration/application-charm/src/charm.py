@@ -1,11 +1,9 @@
 #!/usr/bin/env python3
 
-import json
 import logging
-import tempfile
-import requests
 
 import ops
+from charms.ams.v0.ams_client import AMSRequirer
 from charms.tls_certificates_interface.v3.tls_certificates import (
     generate_ca,
     generate_certificate,
@@ -27,9 +25,10 @@ class ApplicationCharm(ops.CharmBase):
         super().__init__(*args)
 
         self._state.set_default(cert=None, key=None, lxd_nodes=[])
+        self.ams = AMSRequirer(self, "client")
         self.framework.observe(self.on.start, self._on_start)
         self.framework.observe(self.on.client_relation_joined, self._on_client_relation_joined)
-        self.framework.observe(self.on.client_relation_changed, self._on_client_relation_changed)
+        self.framework.observe(self.ams.on.available, self._on_ams_available)
 
     @property
     def public_ip(self) -> str:
@@ -48,20 +47,21 @@ class ApplicationCharm(ops.CharmBase):
         self._state.cert, self._state.key = self._generate_selfsigned_cert(
             self.public_ip, self.public_ip, self.private_ip
         )
-        relation_data = event.relation.data[self.unit]
-        relation_data["client_certificate"] = json.dumps(self._state.cert.decode("utf-8"))
         with open("client.key", "w") as key, open("client.cert", "w") as cert:
             cert.write(self._state.cert.decode())
             key.write(self._state.key.decode())
+        self.ams.register(self._state.cert.decode("utf-8"))
 
-    def _on_client_relation_changed(self, event):
-        data = event.relation.data[event.unit]
-        if not ("public_address" in data or "port" in data):
+    def _on_ams_available(self, event):
+        ams_certificate = self.config["ams_certificate"]
+        if not ams_certificate:
+            self.unit.status = WaitingStatus("Waiting for the AMS server certificate")
             event.defer()
             return
-        test_url = f"https://{data['public_address']}:{data['port']}/1.0/instances"
-        resp = requests.get(test_url, verify=False, cert=("client.cert", "client.key"))
-        resp.raise_for_status()
+        with open("ams.cert", "w") as cert:
+            cert.write(ams_certificate)
+        with self.ams.client(cert=("client.cert", "client.key"), verify="ams.cert") as client:
+            client.get("/1.0/instances").raise_for_status()
         logger.info("Connected to ams successfully with authentication")
 
         self.unit.status = ops.ActiveStatus()
@@ -24,6 +24,7 @@ logger = logging.getLogger(__name__)
 
 TEST_APP_CHARM_PATH = "tests/integration/application-charm"
 TEST_APP_CHARM_NAME = "ams-api-tester"
+AMS_SERVER_CERT_PATH = "/var/snap/ams/common/server/server.crt"
 
 
 @pytest.fixture(scope="module")
@@ -62,6 +63,13 @@ async def test_can_relate_to_client_charms(
             num_units=1,
         ),
     )
+    await ops_test.model.wait_for_idle(apps=[charm_name], status="active", timeout=1000)
+    _, ams_certificate, _ = await ops_test.juju(
+        "ssh", f"{charm_name}/0", "sudo", "cat", AMS_SERVER_CERT_PATH, check=True
+    )
+    await ops_test.model.applications[TEST_APP_CHARM_NAME].set_config(
+        {"ams_certificate": ams_certificate}
+    )
     async with ops_test.fast_forward():
         await ops_test.model.relate(f"{TEST_APP_CHARM_NAME}:client", f"{charm_name}:rest-api"),
         await ops_test.model.wait_for_idle(
@@ -30,5 +30,55 @@ def mocked_ams():
         mock = MagicMock()
         workload_version = "x1"
         type(mock).version = PropertyMock(return_value=workload_version)
+        type(mock).etcd_client_certificate = PropertyMock(return_value=None)
+        type(mock).previous_lxd_client_certificate = PropertyMock(return_value=None)
         mocked_ams.return_value = mock
         yield mock
+
+
+@pytest.fixture(autouse=True)
+def rolling_clock():
+    """Advance a fake clock instead of sleeping while rolling ops poll readiness."""
+    now = [0.0]
+
+    def _sleep(seconds):
+        now[0] += seconds
+
+    with patch("rolling.time.monotonic", side_effect=lambda: now[0]), patch(
+        "rolling.time.sleep", side_effect=_sleep
+    ) as sleep:
+        yield sleep
+
+
+@pytest.fixture(autouse=True)
+def sysctl_paths(tmp_path, monkeypatch):
+    proc_sys = tmp_path / "proc-sys"
+    proc_sys.mkdir()
+    monkeypatch.setattr("sysctl.SYSCTL_CONFIG_PATH", tmp_path / "sysctl.d" / "60-ams.conf")
+    monkeypatch.setattr("sysctl.PROC_SYS_PATH", proc_sys)
+    with patch("sysctl.run") as run:
+        yield run
+
+
+@pytest.fixture(autouse=True)
+def mocked_metrics_exporter():
+    with patch("src.charm.MetricsExporter") as exporter:
+        yield exporter.return_value
+
+
+@pytest.fixture(autouse=True)
+def mocked_key_pool():
+    with patch("src.charm.KeyPool") as pool:
+        pool.return_value.take.return_value = None
+        yield pool.return_value
+
+
+@pytest.fixture(scope="session")
+def self_signed_cert():
+    from charms.tls_certificates_interface.v3.tls_certificates import (
+        generate_ca,
+        generate_private_key,
+    )
+
+    key = generate_private_key(key_size=2048)
+    return generate_ca(key, "ams").decode(), key.decode()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import http.server
+import json
+import socketserver
+import threading
+from dataclasses import replace
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+import yaml
+from ams import (
+    AMS,
+    BackendConfig,
+    ETCDConfig,
+    PrometheusConfig,
+    Readiness,
+    ServiceConfig,
+    write_file,
+)
+from jinja2 import Environment, FileSystemLoader
+from runner import CommandError
+
+
+def _render_store(store: ETCDConfig) -> dict:
+    tenv = Environment(loader=FileSystemLoader("templates"))
+    template = tenv.get_template("settings.yaml.j2")
+    content = {
+        "ip": "10.0.0.1",
+        "port": 8444,
+        "log_level": "info",
+        "store": store.__dict__,
+        "backend": {"lxd_project": ""},
+        "metrics": {"enabled": False},
+    }
+    return yaml.safe_load(template.render(content))["store"]
+
+
+def test_embedded_etcd_tuning_is_rendered_only_when_set():
+    assert "quota-backend-bytes" not in _render_store(ETCDConfig(use_embedded=True))
+    store = _render_store(
+        ETCDConfig(
+            use_embedded=True,
+            quota_backend_bytes=8589934592,
+            auto_compaction_mode="periodic",
+            auto_compaction_retention="1h",
+            heartbeat_interval=100,
+            election_timeout=1000,
+        )
+    )
+    assert store["quota-backend-bytes"] == 8589934592
+    assert store["auto-compaction-retention"] == "1h"
+    assert store["election-timeout"] == 1000
+    assert "snapshot-count" not in store
+
+
+@pytest.mark.parametrize(
+    "output,expected",
+    [(b"Certificate already exists", ""), (b"permission denied", None)],
+)
+def test_register_client_raises_command_errors(tmp_path, output, expected):
+    ams = AMS.__new__(AMS)
+    error = CommandError("amc trust add", 1, [], output=output)
+    with patch.object(AMS, "get_registered_certificates", return_value=[]), patch(
+        "ams.SNAP_COMMON_PATH", tmp_path
+    ), patch("ams.run", side_effect=error):
+        if expected is None:
+            with pytest.raises(CommandError):
+                ams.register_client("cert")
+        else:
+            assert ams.register_client("cert") == expected
+
+
+def test_write_file_replaces_content_only_when_changed(tmp_path):
+    path = tmp_path / "etcd" / "client-key.pem"
+    assert write_file(path, b"key", mode=0o600)
+    assert not write_file(path, b"key", mode=0o600)
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert write_file(path, b"new-key", mode=0o600)
+    assert path.read_bytes() == b"new-key"
+    assert [p.name for p in path.parent.iterdir()] == ["client-key.pem"]
+
+
+@pytest.fixture
+def ams_api(tmp_path, monkeypatch):
+    responses = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body = responses.pop(0)
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    path = tmp_path / "unix.socket"
+    server = socketserver.UnixStreamServer(str(path), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr("ams.AMS_SOCKET_PATH", path)
+    yield responses
+    server.shutdown()
+    server.server_close()
+
+
+def test_readiness_reports_the_api_status(ams_api, monkeypatch):
+    ams = AMS.__new__(AMS)
+    ams_api.extend(
+        [
+            (200, {"status_code": 200, "metadata": {"status": "ready"}}),
+            (200, {"status_code": 200, "metadata": {"status": "migrating"}}),
+            (503, {"error": "waiting for etcd"}),
+        ]
+    )
+    assert ams.readiness() == Readiness(True)
+    assert ams.readiness() == Readiness(False, "service is migrating")
+    assert ams.readiness() == Readiness(False, "API answered 503")
+    monkeypatch.setattr("ams.AMS_SOCKET_PATH", Path("/nonexistent/unix.socket"))
+    assert not ams.is_running
+
+
+def _snapd(hold: bool = True, connected: bool = True, aliased: bool = True):
+    responses = {
+        "snaps/ams": {"revision": "42", "tracking-channel": "1.22/stable"},
+        "connections": {"established": []},
+        "aliases": {"ams": {"amc": {"status": "manual"}} if aliased else {}},
+    }
+    if hold:
+        responses["snaps/ams"]["hold"] = "2315-01-01T00:00:00Z"
+    if connected:
+        plug = {"snap": "ams", "plug": "daemon-notify"}
+        responses["connections"]["established"].append({"plug": plug})
+    client = MagicMock()
+    client._request.side_effect = lambda method, path, query=None: responses[path]
+    client.get_snap_information.return_value = {"channels": {"1.22/stable": {"revision": 42}}}
+    return client
+
+
+def test_install_skips_steps_already_done(tmp_path, monkeypatch):
+    monkeypatch.setattr("ams.SERVICE_DROP_IN_PATH", tmp_path / "10-drop-in.conf")
+    ams = AMS.__new__(AMS)
+    ams._sc = MagicMock()
+    ams._sc._snap_client = _snapd()
+    with patch("ams.passwd") as passwd, patch("ams.systemd") as systemd, patch("ams.run") as run:
+        passwd.add_group.return_value.gr_mem = ["ubuntu"]
+        ams.install(channel="1.22/stable")
+        systemd.daemon_reload.assert_called_once()
+        ams.install(channel="1.22/stable")
+        systemd.daemon_reload.assert_called_once()
+    run.assert_not_called()
+    passwd.add_user_to_group.assert_not_called()
+
+
+def test_install_runs_only_missing_steps(tmp_path, monkeypatch):
+    monkeypatch.setattr("ams.SERVICE_DROP_IN_PATH", tmp_path / "10-drop-in.conf")
+    ams = AMS.__new__(AMS)
+    ams._sc = MagicMock()
+    ams._sc._snap_client = _snapd(hold=False, aliased=False)
+    ams._sc._snap_client.get_snap_information.return_value = {
+        "channels": {"1.22/stable": {"revision": 43}}
+    }
+    with patch("ams.passwd") as passwd, patch("ams.systemd"), patch("ams.run") as run:
+        passwd.add_group.return_value.gr_mem = []
+        ams.install(channel="1.22/stable")
+    assert [c.args[0] for c in run.call_args_list] == [
+        ["snap", "refresh", "ams", "--channel=1.22/stable"],
+        ["snap", "refresh", "--hold", "ams"],
+        ["snap", "alias", "ams.amc", "amc"],
+    ]
+    passwd.add_user_to_group.assert_called_once_with("ubuntu", "ams")
+
+
+def _service_config(log_level: str) -> ServiceConfig:
+    return ServiceConfig(
+        log_level=log_level,
+        ip="10.0.0.1",
+        port=8444,
+        store=ETCDConfig(use_embedded=True),
+        backend=BackendConfig(
+            port_range="10000-11000", force_tls12=False, use_network_acl=False, lxd_project=""
+        ),
+        metrics=PrometheusConfig("10.0.0.1", 0, "", "", "", "", "/metrics"),
+    )
+
+
+@pytest.mark.parametrize("supported", [True, False])
+def test_log_level_change_is_applied_live_when_supported(tmp_path, monkeypatch, supported):
+    monkeypatch.setattr("ams.AMS_CONFIG_PATH", tmp_path / "settings.yaml")
+    ams = AMS.__new__(AMS)
+    with patch("ams.systemd") as systemd, patch("ams.run") as run:
+        run.return_value.stdout = b"config:\n  log.level: info\n" if supported else b"config: {}\n"
+        systemd.service_running.return_value = True
+        ams.configure(_service_config("info"))
+        run.reset_mock()
+
+        assert ams.configure(_service_config("debug")) is not supported
+        if supported:
+            assert run.call_args.args[0][-4:] == ["config", "set", "log.level", "debug"]
+        # Any other change needs a restart
+        assert ams.configure(replace(_service_config("debug"), port=8445))
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests
+from charms.ams.v0.ams_client import AMSClient, AMSClientError, AMSRequirer, Endpoint
+from ops import CharmBase
+from ops.testing import Harness
+
+METADATA = """
+name: test
+requires:
+  ams:
+    interface: rest
+"""
+
+
+class RequirerCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.ams = AMSRequirer(self, "ams")
+
+
+@pytest.fixture
+def harness(request):
+    harness = Harness(RequirerCharm, meta=METADATA)
+    request.addfinalizer(harness.cleanup)
+    harness.begin()
+    return harness
+
+
+def test_registers_certificate_and_orders_endpoints(harness):
+    rel_id = harness.add_relation("ams", "ams")
+    harness.add_relation_unit(rel_id, "ams/0")
+    harness.charm.ams.register("cert")
+    assert harness.get_relation_data(rel_id, "test/0")["client_certificate"] == '"cert"'
+    assert not harness.charm.ams.is_ready
+
+    endpoints = [
+        {"node": "ams0", "address": "10.0.0.1", "port": 8444, "healthy": False, "weight": 100},
+        {"node": "ams1", "address": "10.0.0.2", "port": 8444, "healthy": True, "weight": 10},
+        {"node": "ams2", "address": "10.0.0.3", "port": 8444, "healthy": True, "weight": 50},
+    ]
+    harness.update_relation_data(rel_id, "ams", {"endpoints": json.dumps(endpoints)})
+    harness.update_relation_data(rel_id, "ams/0", {"port": "8444"})
+    assert harness.charm.ams.is_ready
+    assert [e.node for e in harness.charm.ams.endpoints] == ["ams2", "ams1", "ams0"]
+
+
+def test_falls_back_to_unit_addresses(harness):
+    rel_id = harness.add_relation("ams", "ams")
+    harness.add_relation_unit(rel_id, "ams/0")
+    harness.update_relation_data(
+        rel_id, "ams/0", {"private_address": "https://lb.example.com", "port": "8444"}
+    )
+    assert [e.url for e in harness.charm.ams.endpoints] == ["https://lb.example.com"]
+
+
+def _response(status: int) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    return resp
+
+
+def test_client_fails_over_and_retries_with_backoff():
+    endpoints = [Endpoint("10.0.0.1", 8444), Endpoint("10.0.0.2", 8444)]
+    client = AMSClient(endpoints, cert=("c", "k"), retries=1)
+    session = MagicMock()
+    session.request.side_effect = [
+        requests.exceptions.ConnectionError("refused"),
+        _response(503),
+        requests.exceptions.ConnectionError("refused"),
+        _response(200),
+    ]
+    client._session = session
+    with patch("time.sleep") as sleep:
+        assert client.get("/1.0/instances").status_code == 200
+    sleep.assert_called_once()
+    urls = [c.args[1] for c in session.request.call_args_list]
+    assert (
+        urls
+        == [
+            "https://10.0.0.1:8444/1.0/instances",
+            "https://10.0.0.2:8444/1.0/instances",
+        ]
+        * 2
+    )
+
+
+def test_client_verifies_the_server_certificate_by_default():
+    assert AMSClient([Endpoint("10.0.0.1", 8444)], cert="c")._session.verify is True
+    client = AMSClient([Endpoint("10.0.0.1", 8444)], cert="c", verify="/etc/ams/ca.crt")
+    assert client._session.verify == "/etc/ams/ca.crt"
+
+
+def test_client_does_not_resend_non_idempotent_requests_on_errors():
+    client = AMSClient([Endpoint("10.0.0.1", 8444)], cert="c", retries=2)
+    client._session = MagicMock()
+    client._session.request.return_value = _response(503)
+    assert client.post("/1.0/instances").status_code == 503
+    client._session.request.side_effect = requests.exceptions.ReadTimeout("slow")
+    with pytest.raises(AMSClientError):
+        client.post("/1.0/instances")
+    assert client._session.request.call_count == 2
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import os
+
+from artifacts import collect, referenced_ids
+
+
+def _artifact(root, rel, size=10, age=7200):
+    path = root / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    mtime = path.stat().st_mtime - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_referenced_ids_include_nested_versions():
+    objects = [{"id": "img1", "versions": [{"id": "ver1"}]}, {"id": "app1", "name": "app"}]
+    assert referenced_ids(objects) == {"img1", "ver1", "app1"}
+
+
+def test_collect_reports_and_deletes_only_old_orphans(tmp_path):
+    _artifact(tmp_path, "images/img1/rootfs.tar.xz", size=100)
+    orphan = _artifact(tmp_path, "images/gone/rootfs.tar.xz", size=50)
+    fresh = _artifact(tmp_path, "addons/uploading.tar", size=5, age=0)
+
+    report = collect(tmp_path, {"img1"})
+    assert report.total_bytes == 155
+    assert report.reclaimable_bytes == 50
+    assert orphan.exists()
+
+    report = collect(tmp_path, {"img1"}, delete=True)
+    assert not orphan.parent.exists()
+    assert fresh.exists()
+    assert report.total_bytes == 105
+    gauges = {g.name: g.value for g in report.gauges}
+    assert gauges["ams_charm_artifacts_reclaimable_bytes"] == 0
+
+
+def test_nothing_is_deleted_when_referenced_ids_are_missing_on_disk(tmp_path):
+    _artifact(tmp_path, "images/img1/rootfs.tar.xz")
+    orphan = _artifact(tmp_path, "images/gone/rootfs.tar.xz")
+
+    report = collect(tmp_path, {"img1", "ver1"}, delete=True)
+    assert report.unmatched_ids == ["ver1"]
+    assert not report.deleted
+    assert orphan.exists()
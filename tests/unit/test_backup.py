@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from backup import BackupError, create_backup, stage_backup, verify_backup
+from runner import CommandTimeoutError
+
+
+@pytest.fixture
+def artifacts(tmp_path):
+    path = tmp_path / "data" / "artifacts"
+    (path / "images").mkdir(parents=True)
+    (path / "images" / "a.tar").write_bytes(b"a" * 4096)
+    (path / "addons").mkdir()
+    (path / "addons" / "b.tar").write_bytes(b"b" * 4096)
+    return path
+
+
+def test_backup_round_trip_restores_artifacts(tmp_path, artifacts):
+    backups = tmp_path / "backups"
+    results = create_backup(backups, artifacts)
+    assert results["artifacts-included"] == 2
+
+    (artifacts / "images" / "a.tar").write_bytes(b"changed")
+    staged = stage_backup(Path(results["archive"]), artifacts)
+    staged.apply()
+    staged.cleanup()
+    assert (artifacts / "images" / "a.tar").read_bytes() == b"a" * 4096
+    assert sorted(p.name for p in artifacts.parent.iterdir()) == ["artifacts"]
+
+
+def test_incremental_backup_skips_unchanged_artifacts(tmp_path, artifacts):
+    backups = tmp_path / "backups"
+    create_backup(backups, artifacts)
+    (artifacts / "images" / "c.tar").write_bytes(b"c")
+    results = create_backup(backups, artifacts, incremental=True)
+    assert results["incremental"]
+    assert results["artifacts-included"] == 1
+    assert results["artifacts-skipped"] == 2
+
+    (artifacts / "images" / "c.tar").unlink()
+    staged = stage_backup(Path(results["archive"]), artifacts)
+    staged.apply()
+    assert (artifacts / "images" / "c.tar").read_bytes() == b"c"
+    assert (artifacts / "addons" / "b.tar").exists()
+
+
+def test_tampered_backup_is_rejected(tmp_path, artifacts):
+    results = create_backup(tmp_path / "backups", artifacts)
+    with open(results["archive"], "ab") as f:
+        f.write(b"garbage")
+    with pytest.raises(BackupError):
+        verify_backup(Path(results["archive"]))
+
+
+def test_stuck_etcd_snapshot_restore_is_cleaned_up(tmp_path, artifacts):
+    etcd = MagicMock()
+    etcd.snapshot.side_effect = lambda dest: dest.write_bytes(b"snapshot")
+    results = create_backup(tmp_path / "backups", artifacts, etcd)
+    error = CommandTimeoutError("etcd snapshot restore", ["etcdctl"], 600)
+    with patch("backup.run", side_effect=error):
+        with pytest.raises(BackupError, match="timed out"):
+            stage_backup(Path(results["archive"]), artifacts, tmp_path / "etcd-data")
+    assert sorted(p.name for p in artifacts.parent.iterdir()) == ["artifacts"]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import pytest
+from capacity import port_usage, suggest_range
+from config import PortRange
+
+
+def test_usage_counts_exposed_port_ranges_per_node():
+    instances = [
+        {"node": "lxd0", "network": {"services": [{"node_port": 10000, "node_port_end": 10004}]}},
+        {"node": "lxd0", "network": {"services": [{"node_port": 10005}, {"port": 22}]}},
+        {"node": "lxd1", "network": {}},
+    ]
+    usages = port_usage(instances, PortRange(10000, 10019))
+    assert [(u.node, u.allocated, u.utilisation) for u in usages] == [
+        ("lxd0", 6, 0.3),
+        ("lxd1", 0, 0.0),
+    ]
+
+
+def test_suggested_range_must_fit_below_the_last_port():
+    assert suggest_range(1000, 2, start=10000, headroom=0.1) == PortRange(10000, 12199)
+    with pytest.raises(ValueError, match="use a lower start"):
+        suggest_range(30000, 2, start=10000)
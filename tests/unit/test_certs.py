@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import time
+from unittest.mock import patch
+
+from certs import CertificateIndex
+from cryptography import x509
+
+
+def test_expiry_is_parsed_once_per_content(self_signed_cert):
+    cert = self_signed_cert[0].encode()
+    cache = {}
+    index = CertificateIndex(cache)
+    with patch(
+        "certs.x509.load_pem_x509_certificate", wraps=x509.load_pem_x509_certificate
+    ) as load:
+        entries = index.index({"lxd-client": cert, "broken": b"not a certificate"})
+        index.index({"lxd-client": cert})
+    assert load.call_count == 2
+    assert [e.name for e in entries] == ["lxd-client"]
+    assert 364 * 86400 < entries[0].remaining(time.time()) <= 365 * 86400
+    assert len(cache) == 1
+
+    index.index({})
+    assert cache == {}
@@ -13,12 +13,16 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
-from unittest.mock import PropertyMock
+import json
+from unittest.mock import PropertyMock, patch
 import pytest
+import yaml
 
-from ops import BlockedStatus
-from ops.testing import Harness
-from ams import SNAP_DEFAULT_RISK
+from ops import ActiveStatus, BlockedStatus, WaitingStatus
+from ops.testing import ActionFailed, Harness
+from ams import SNAP_DEFAULT_RISK, Readiness
+from etcd import ETCDProxy
+from runner import CommandError, CommandTimeoutError
 
 from src.charm import AmsOperatorCharm
 
@@ -27,6 +31,7 @@ from src.charm import AmsOperatorCharm
 def charm():
     charm_cls = AmsOperatorCharm
     charm_cls.private_ip = "10.0.0.1"
+    charm_cls.public_ip = "10.0.0.1"
     return charm_cls
 
 
@@ -37,10 +42,35 @@ def test_charm_installs_specific_revision(request, mocked_ams, charm, current_ve
     harness.begin()
     harness.charm.on.install.emit()
     harness.charm.ams.install.assert_called_with(
-        channel=f"{current_version}/{SNAP_DEFAULT_RISK}", revision="567"
+        channel=f"{current_version}/{SNAP_DEFAULT_RISK}", revision="567", extra_steps={}
     )
 
 
+def test_failed_refresh_is_retried_on_next_config_change(
+    request, mocked_ams, charm, current_version
+):
+    type(mocked_ams).is_running = PropertyMock(return_value=True)
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True})
+    harness.begin()
+    harness.charm.on.install.emit()
+    mocked_ams.install.side_effect = CommandError("snap refresh", 1, [], stderr=b"store down")
+    harness.update_config({"snap_revision": "567"})
+    assert mocked_ams.install.call_count == 2
+    assert harness.model.unit.status == ActiveStatus("AMS not refreshed to stable@567 yet")
+
+    mocked_ams.install.side_effect = None
+    harness.charm.on.config_changed.emit()
+    assert mocked_ams.install.call_count == 3
+    assert harness.model.unit.status == ActiveStatus()
+    mocked_ams.install.assert_called_with(
+        channel=f"{current_version}/{SNAP_DEFAULT_RISK}", revision="567", extra_steps={}
+    )
+    harness.charm.on.config_changed.emit()
+    assert mocked_ams.install.call_count == 3
+
+
 def test_charm_sets_workload_version_on_install(request, mocked_ams, charm):
     workload_version = "1.21"
     type(mocked_ams).version = PropertyMock(return_value=workload_version)
@@ -82,3 +112,511 @@ def test_can_set_location_in_ams(request, mocked_ams, charm):
     harness.begin()
     harness.charm.on.config_changed.emit()
     harness.charm.ams.set_location.assert_called_once()
+
+
+def test_can_report_performance_profile(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True, "performance_profile": "high-throughput"})
+    harness.begin()
+    harness.charm.on.config_changed.emit()
+    output = harness.run_action("show-performance-profile")
+    settings = json.loads(output.results["settings"])
+    assert settings["net.core.somaxconn"]["expected"] == "4096"
+    assert output.results["in-sync"] == "False"
+
+
+def test_blocks_on_unknown_performance_profile(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True, "performance_profile": "turbo"})
+    harness.begin()
+    harness.charm.on.config_changed.emit()
+    assert harness.charm.unit.status == BlockedStatus(
+        "Invalid performance_profile: unknown profile 'turbo', use one of default, "
+        "high-throughput, custom"
+    )
+
+
+def test_blocks_when_the_kernel_rejects_settings(request, mocked_ams, charm, sysctl_paths):
+    sysctl_paths.side_effect = CommandError("sysctl", 255, ["sysctl"], stderr=b"bad value")
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config(
+        {
+            "use_embedded_etcd": True,
+            "performance_profile": "custom",
+            "performance_sysctl": "net.core.somaxconn=lots",
+        }
+    )
+    harness.begin()
+    harness.charm.on.config_changed.emit()
+    assert harness.charm.unit.status == BlockedStatus("sysctl rejected the settings: bad value")
+    mocked_ams.configure.assert_not_called()
+
+
+def test_etcd_maintenance_compacts_and_defragments(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True})
+    harness.begin()
+    with patch("src.charm.ETCDClient") as client_cls:
+        client = client_cls.return_value
+        client.status.side_effect = [{"dbSize": "2048"}, {"dbSize": "1024"}]
+        client.compact.return_value = 42
+        output = harness.run_action("etcd-maintenance")
+    client.defragment.assert_called_once()
+    assert output.results == {
+        "compacted-revision": 42,
+        "db-size-before": 2048,
+        "db-size-after": 1024,
+    }
+
+
+def test_routes_external_etcd_through_local_proxy(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_etcd_proxy": True})
+    harness.begin()
+    rel_id = harness.add_relation("etcd", "etcd")
+    harness.add_relation_unit(rel_id, "etcd/0")
+    with patch("src.charm.install_etcd"), patch.object(ETCDProxy, "configure") as configure, patch(
+        "src.charm.order_by_latency", return_value=["https://10.0.0.5:2379"]
+    ):
+        harness.update_relation_data(
+            rel_id,
+            "etcd/0",
+            {
+                "client_cert": "cert",
+                "client_key": "key",
+                "client_ca": "ca",
+                "connection_string": "https://10.0.0.5:2379",
+            },
+        )
+    configure.assert_called_once()
+    cfg = mocked_ams.configure.call_args.args[0]
+    assert cfg.store.servers == ["http://127.0.0.1:23790"]
+    jobs = harness.charm.generate_scrape_config()
+    assert any(job["job_name"] == "etcd-proxy" for job in jobs)
+
+
+def test_failed_etcd_snap_install_blocks_the_unit(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_etcd_proxy": True})
+    harness.begin()
+    rel_id = harness.add_relation("etcd", "etcd")
+    harness.add_relation_unit(rel_id, "etcd/0")
+    error = CommandError("etcd snap install", 1, [], stderr=b"snap not found")
+    with patch("src.charm.install_etcd", side_effect=error), patch(
+        "src.charm.order_by_latency", return_value=["https://10.0.0.5:2379"]
+    ):
+        harness.update_relation_data(
+            rel_id,
+            "etcd/0",
+            {
+                "client_cert": "cert",
+                "client_key": "key",
+                "client_ca": "ca",
+                "connection_string": "https://10.0.0.5:2379",
+            },
+        )
+    assert harness.charm.unit.status == BlockedStatus(str(error))
+    mocked_ams.configure.assert_not_called()
+
+
+def test_unchanged_etcd_relation_data_does_not_reconfigure(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.begin()
+    rel_id = harness.add_relation("etcd", "etcd")
+    harness.add_relation_unit(rel_id, "etcd/0")
+    data = {
+        "client_cert": "cert",
+        "client_key": "key",
+        "client_ca": "ca",
+        "connection_string": "https://10.0.0.5:2379",
+    }
+    with patch("src.charm.order_by_latency", return_value=["https://10.0.0.5:2379"]):
+        harness.update_relation_data(rel_id, "etcd/0", data)
+        harness.update_relation_data(rel_id, "etcd/0", {"unrelated": "value", **data})
+    mocked_ams.setup_etcd.assert_called_once()
+    mocked_ams.configure.assert_called_once()
+
+
+def test_artifacts_gc_dry_run_does_not_delete(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.begin()
+    mocked_ams.list_objects.return_value = [{"id": "img1"}]
+    with patch("src.charm.collect") as collect:
+        collect.return_value.gauges = []
+        collect.return_value.orphans = []
+        harness.run_action("artifacts-gc")
+    assert collect.call_args.kwargs["delete"] is False
+    assert collect.call_args.args[1] == {"img1"}
+
+
+def test_lxd_clusters_share_one_persisted_identity(request, mocked_ams, charm, self_signed_cert):
+    cert, key = self_signed_cert
+    type(mocked_ams).lxd_client_certificate = PropertyMock(side_effect=[None, cert.encode()])
+    type(mocked_ams).pending_lxd_client_certificate = PropertyMock(return_value=None)
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.begin()
+    with patch.object(
+        AmsOperatorCharm, "_generate_selfsigned_cert", return_value=(cert.encode(), key.encode())
+    ) as generate:
+        rel_a = harness.add_relation("lxd-cluster", "lxd-a")
+        rel_b = harness.add_relation("lxd-cluster", "lxd-b")
+        harness.add_relation_unit(rel_a, "lxd-a/0")
+        harness.add_relation_unit(rel_b, "lxd-b/0")
+    generate.assert_called_once()
+    data_a = harness.get_relation_data(rel_a, harness.charm.unit.name)
+    data_b = harness.get_relation_data(rel_b, harness.charm.unit.name)
+    assert data_a["client_certificates"] == data_b["client_certificates"]
+    assert json.loads(data_a["client_certificates"]) == [cert]
+
+
+def test_lxd_rotation_restarts_ams_before_withdrawing_the_old_certificate(
+    request, mocked_ams, charm
+):
+    pending, previous = PropertyMock(return_value=b"new"), PropertyMock(return_value=None)
+    type(mocked_ams).lxd_client_certificate = PropertyMock(return_value=b"old")
+    type(mocked_ams).pending_lxd_client_certificate = pending
+    type(mocked_ams).previous_lxd_client_certificate = previous
+    type(mocked_ams).is_running = PropertyMock(return_value=False)
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.begin()
+    with patch("src.charm.LXDClusterConsumer.is_trusted", return_value=False):
+        harness.charm._progress_lxd_rotation()
+    mocked_ams.complete_lxd_rotation.assert_not_called()
+
+    with patch("src.charm.LXDClusterConsumer.is_trusted", return_value=True):
+        harness.charm._progress_lxd_rotation()
+        mocked_ams.complete_lxd_rotation.assert_called_once()
+        mocked_ams.restart.assert_called_once()
+        assert harness.charm.rolling.pending == "restart"
+
+        pending.return_value, previous.return_value = None, b"old"
+        harness.charm._progress_lxd_rotation()
+        mocked_ams.withdraw_previous_lxd_client_certificate.assert_not_called()
+
+        type(mocked_ams).is_running = PropertyMock(return_value=True)
+        harness.charm.rolling.update()
+        harness.charm._progress_lxd_rotation()
+    mocked_ams.withdraw_previous_lxd_client_certificate.assert_called_once()
+
+
+def test_failed_restore_cleans_up_and_reports_readiness(request, mocked_ams, charm):
+    mocked_ams.stop.side_effect = CommandError("snap stop", 1, [], stderr=b"timed out")
+    mocked_ams.readiness.return_value = Readiness(False, "service down")
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": False})
+    harness.begin()
+    with patch("src.charm.stage_backup") as stage:
+        with pytest.raises(ActionFailed) as e:
+            harness.run_action("restore-backup", {"archive": "/tmp/backup.tar.gz"})
+    assert e.value.message.startswith("Cannot restore backup")
+    stage.return_value.apply.assert_not_called()
+    stage.return_value.cleanup.assert_called_once()
+    mocked_ams.start.assert_called_once()
+    assert harness.model.unit.status == WaitingStatus("AMS is not ready: service down")
+
+
+def test_certificates_take_pregenerated_keys(
+    request, mocked_ams, charm, mocked_key_pool, self_signed_cert
+):
+    _, key = self_signed_cert
+    type(mocked_ams).lxd_client_certificate = PropertyMock(return_value=None)
+    type(mocked_ams).pending_lxd_client_certificate = PropertyMock(return_value=None)
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True})
+    harness.begin()
+    mocked_key_pool.take.return_value = key.encode()
+    assert harness.charm._new_private_key() == key.encode()
+
+    mocked_key_pool.take.return_value = None
+    with patch("src.charm.generate_private_key", return_value=b"inline") as generate:
+        assert harness.charm._new_private_key() == b"inline"
+    generate.assert_called_once_with(key_size=4096)
+
+    harness.charm.on.update_status.emit()
+    mocked_key_pool.refill_in_background.assert_called_once_with(2)
+    harness.update_config({"key_pool_size": 0})
+    harness.charm.on.update_status.emit()
+    mocked_key_pool.clear.assert_called_once()
+
+
+def test_certificates_close_to_expiry_are_rotated_or_reported(
+    request, mocked_ams, charm, mocked_metrics_exporter, self_signed_cert
+):
+    cert = self_signed_cert[0].encode()
+    type(mocked_ams).lxd_client_certificate = PropertyMock(return_value=cert)
+    type(mocked_ams).etcd_client_certificate = PropertyMock(return_value=cert)
+    type(mocked_ams).pending_lxd_client_certificate = PropertyMock(return_value=None)
+    mocked_ams.readiness.return_value = Readiness(True)
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True})
+    harness.begin()
+    with patch.object(AmsOperatorCharm, "_start_lxd_rotation") as rotate:
+        harness.charm.on.update_status.emit()
+        rotate.assert_not_called()
+        groups = dict(c.args for c in mocked_metrics_exporter.set.call_args_list)
+        gauges = groups["certificates"]
+        assert {g.labels["certificate"] for g in gauges} == {"lxd-client", "etcd-client"}
+        assert harness.model.unit.status == ActiveStatus()
+
+        harness.update_config({"cert_renewal_days": 400})
+        harness.charm.on.update_status.emit()
+        rotate.assert_called_once()
+    assert harness.model.unit.status == ActiveStatus("Certificate etcd-client expires in 364 days")
+
+
+def test_invalid_options_never_reach_ams(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True, "port_range": "10000-9000"})
+    harness.begin()
+    harness.charm.on.config_changed.emit()
+    assert harness.model.unit.status == BlockedStatus(
+        "Invalid port_range: '10000-9000' must be an ascending range within 1-65535"
+    )
+    mocked_ams.configure.assert_not_called()
+    mocked_ams.restart.assert_not_called()
+
+
+def test_blocks_once_the_port_range_is_exhausted(
+    request, mocked_ams, charm, mocked_metrics_exporter
+):
+    type(mocked_ams).is_running = PropertyMock(return_value=True)
+    type(mocked_ams).lxd_client_certificate = PropertyMock(return_value=None)
+    type(mocked_ams).pending_lxd_client_certificate = PropertyMock(return_value=None)
+    mocked_ams.readiness.return_value = Readiness(True)
+
+    def _instance(node, port, port_end=0):
+        service = {"port": 5559, "node_port": port, "node_port_end": port_end}
+        return {"node": node, "network": {"services": [service]}}
+
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True, "port_range": "10000-10009"})
+    harness.begin()
+    mocked_ams.list_instances.return_value = [
+        _instance("lxd0", 10000, 10007),
+        _instance("lxd1", 10000),
+    ]
+    harness.charm.on.update_status.emit()
+    assert harness.model.unit.status == ActiveStatus("Port range 80% used on lxd0")
+    groups = dict(c.args for c in mocked_metrics_exporter.set.call_args_list)
+    utilisation = {
+        g.labels["node"]: g.value
+        for g in groups["ports"]
+        if g.name == "ams_charm_port_range_utilisation"
+    }
+    assert utilisation == {"lxd0": 0.8, "lxd1": 0.1}
+
+    mocked_ams.list_instances.return_value.append(_instance("lxd0", 10008, 10009))
+    harness.charm.on.update_status.emit()
+    assert harness.model.unit.status == BlockedStatus(
+        "Port range exhausted on lxd0: 10/10 ports allocated, extend port_range"
+    )
+    mocked_ams.list_instances.return_value.pop()
+    harness.charm.on.update_status.emit()
+    assert harness.model.unit.status == ActiveStatus("Port range 80% used on lxd0")
+
+    action = harness.run_action("suggest-port-range", {"instances": 100})
+    assert action.results == {
+        "port-range": "10000-10539",
+        "capacity": 540,
+        "current-capacity": 10,
+        "ports-per-instance": 4.5,
+    }
+
+
+def test_debug_logging_is_time_boxed(request, mocked_ams, charm):
+    type(mocked_ams).lxd_client_certificate = PropertyMock(return_value=None)
+    type(mocked_ams).pending_lxd_client_certificate = PropertyMock(return_value=None)
+    mocked_ams.configure.return_value = False
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True})
+    harness.begin()
+
+    action = harness.run_action("set-debug-logging", {"minutes": 10})
+    assert action.results["log-level"] == "debug"
+    assert mocked_ams.configure.call_args.args[0].log_level == "debug"
+    mocked_ams.schedule_log_level_revert.assert_called_once_with("info", 10)
+    mocked_ams.restart.assert_not_called()
+
+    harness.charm._state.debug_logging_until = 1.0
+    harness.charm.on.update_status.emit()
+    assert mocked_ams.configure.call_args.args[0].log_level == "info"
+    assert harness.charm._state.debug_logging_until == 0.0
+
+
+def test_leader_publishes_load_of_all_units(request, mocked_ams, charm):
+    type(mocked_ams).is_running = PropertyMock(return_value=True)
+    type(mocked_ams).lxd_client_certificate = PropertyMock(return_value=None)
+    type(mocked_ams).pending_lxd_client_certificate = PropertyMock(return_value=None)
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.set_leader(True)
+    peers = harness.add_relation("ams-peers", "ams")
+    harness.add_relation_unit(peers, "ams/1")
+    harness.update_relation_data(
+        peers,
+        "ams/1",
+        {"address": "10.0.0.2", "port": "8444", "node": "ams1", "healthy": "False", "weight": "1"},
+    )
+    rest_api = harness.add_relation("rest-api", "client")
+    harness.begin()
+    with patch("src.charm.fetch_metrics", return_value={"ams_containers_running": 100.0}):
+        harness.charm.on.update_status.emit()
+
+    endpoints = json.loads(harness.get_relation_data(rest_api, "ams")["endpoints"])
+    assert endpoints == [
+        {"node": "ams0", "address": "10.0.0.1", "port": 8444, "healthy": True, "weight": 50},
+        {"node": "ams1", "address": "10.0.0.2", "port": 8444, "healthy": False, "weight": 1},
+    ]
+
+
+def test_registers_backend_with_reverse_proxy_and_resets_location_when_removed(
+    request, mocked_ams, charm
+):
+    type(mocked_ams).is_running = PropertyMock(return_value=True)
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True, "proxy_weight": 50, "proxy_maxconn": 200})
+    harness.begin()
+    rel_id = harness.add_relation("website", "haproxy")
+    harness.add_relation_unit(rel_id, "haproxy/0")
+    harness.update_relation_data(rel_id, "haproxy/0", {"public-address": "192.168.1.10"})
+
+    services = yaml.safe_load(harness.get_relation_data(rel_id, "ams/0")["services"])
+    assert services[0]["service_port"] == 8444
+    assert "mode tcp" in services[0]["service_options"]
+    name, address, port, options = services[0]["servers"][0]
+    assert (name, address, port) == ("ams-0", "10.0.0.1", 8444)
+    assert "check-ssl" in options and "weight 50" in options and "maxconn 200" in options
+    harness.charm.ams.set_location.assert_called_with("192.168.1.10", 8444)
+
+    harness.remove_relation(rel_id)
+    harness.charm.ams.set_location.assert_called_with("10.0.0.1", 8444)
+
+    harness.update_config({"location": "ams.example.com"})
+    rel_id = harness.add_relation("website", "haproxy")
+    harness.remove_relation(rel_id)
+    harness.charm.ams.set_location.assert_called_with("ams.example.com", 8444)
+
+
+def test_relation_hooks_report_failed_ams_commands(request, mocked_ams, charm):
+    type(mocked_ams).is_running = PropertyMock(return_value=True)
+    mocked_ams.register_client.return_value = "fp"
+    mocked_ams.get_config_item.side_effect = CommandTimeoutError("amc config show", [], 30)
+    mocked_ams.set_location.side_effect = CommandError("amc config set", 1, [], stderr=b"denied")
+    mocked_ams.unregister_client.side_effect = CommandError(
+        "amc trust remove", 1, [], stderr=b"no such client"
+    )
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True})
+    harness.begin()
+    rest_api = harness.add_relation("rest-api", "client")
+    harness.add_relation_unit(rest_api, "client/0")
+    harness.update_relation_data(rest_api, "client/0", {"client_certificate": repr("cert")})
+    relation = harness.model.get_relation("rest-api", rest_api)
+    harness.charm.on["rest-api"].relation_joined.emit(
+        relation, app=relation.app, unit=harness.model.get_unit("client/0")
+    )
+    assert harness.model.unit.status == WaitingStatus(
+        "Retrying later: amc config show timed out after 30s"
+    )
+
+    website = harness.add_relation("website", "haproxy")
+    harness.add_relation_unit(website, "haproxy/0")
+    harness.update_relation_data(website, "haproxy/0", {"public-address": "192.168.1.10"})
+    assert harness.model.unit.status == BlockedStatus("amc config set failed with error: denied")
+
+    harness.remove_relation_unit(rest_api, "client/0")
+    assert harness.model.unit.status == BlockedStatus(
+        "amc trust remove failed with error: no such client"
+    )
+
+
+def test_waits_until_ams_api_is_ready(request, mocked_ams, charm):
+    mocked_ams.readiness.return_value = Readiness(False, "service is migrating")
+    type(mocked_ams).lxd_client_certificate = PropertyMock(return_value=None)
+    type(mocked_ams).pending_lxd_client_certificate = PropertyMock(return_value=None)
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True})
+    harness.begin()
+    harness.charm.on.config_changed.emit()
+    assert harness.model.unit.status == WaitingStatus("AMS is not ready: service is migrating")
+
+    mocked_ams.readiness.return_value = Readiness(True)
+    harness.charm.on.update_status.emit()
+    assert harness.model.unit.status == ActiveStatus()
+
+
+def test_reports_failed_commands_instead_of_failing_the_hook(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.update_config({"use_embedded_etcd": True})
+    harness.begin()
+    mocked_ams.configure.side_effect = CommandTimeoutError("snap start", [], 300)
+    harness.charm.on.config_changed.emit()
+    assert harness.model.unit.status == WaitingStatus(
+        "Retrying later: snap start timed out after 300s"
+    )
+
+    mocked_ams.configure.side_effect = CommandError("snap start", 1, [], stderr=b"snap not found")
+    harness.charm.on.config_changed.emit()
+    assert harness.model.unit.status == BlockedStatus(
+        "snap start failed with error: snap not found"
+    )
+
+
+def test_installs_snap_resource_only_when_it_changed(request, mocked_ams, charm):
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.add_resource("ams-snap", b"snap-v1")
+    harness.begin()
+    harness.charm.on.install.emit()
+    snap_file, kwargs = mocked_ams.install_local.call_args
+    assert snap_file[0].read_bytes() == b"snap-v1"
+    assert kwargs == {"assertion": None}
+    mocked_ams.install.assert_not_called()
+
+    harness.charm.on.upgrade_charm.emit()
+    assert mocked_ams.install_local.call_count == 1
+
+    # Juju replaces an updated resource at the same path
+    snap_file[0].write_bytes(b"snap-v2")
+    harness.add_resource("ams-snap-assert", b"assertion")
+    harness.charm.on.upgrade_charm.emit()
+    assert mocked_ams.install_local.call_count == 2
+    assert mocked_ams.install_local.call_args.kwargs["assertion"].read_bytes() == b"assertion"
+
+
+def test_upgrade_refreshes_from_staged_snap(request, mocked_ams, charm, tmp_path):
+    mocked_ams.store_revision.return_value = ("42", 1024)
+    harness = Harness(charm)
+    request.addfinalizer(harness.cleanup)
+    harness.begin()
+    harness.charm.snap_stager.path = tmp_path
+    (tmp_path / "ams_42.snap").write_bytes(b"snap")
+    (tmp_path / "ams_42.assert").write_bytes(b"assert")
+    assert harness.charm._staging_message() == "AMS revision 42 staged"
+
+    harness.charm.on.upgrade_charm.emit()
+    mocked_ams.install_local.assert_called_once_with(
+        tmp_path / "ams_42.snap", assertion=tmp_path / "ams_42.assert"
+    )
+    mocked_ams.install.assert_not_called()
+    assert not tmp_path.exists()
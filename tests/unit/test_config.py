@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import pytest
+import yaml
+from config import CharmConfig, ConfigError, PortRange
+
+
+@pytest.fixture
+def defaults():
+    with open("config.yaml") as f:
+        options = yaml.safe_load(f)["options"]
+    return {name: option.get("default") for name, option in options.items()}
+
+
+def test_defaults_are_valid(defaults):
+    cfg = CharmConfig.from_options(defaults)
+    assert cfg.port_range == PortRange(10000, 11000)
+    assert cfg.port_range.count == 1001
+    assert str(cfg.port_range) == "10000-11000"
+    assert cfg.prometheus_extra_labels == {}
+    assert cfg.config == {}
+
+
+def test_composite_options_are_parsed(defaults):
+    cfg = CharmConfig.from_options(
+        {
+            **defaults,
+            "prometheus_extra_labels": "region=eu, zone = a",
+            "config": "images.url=https://images.example.com/?a=b\n\nregistry.mode=client\n",
+            "metrics_server": "influxdb:user:pass@10.0.0.5:8086",
+        }
+    )
+    assert cfg.prometheus_extra_labels == {"region": "eu", "zone": "a"}
+    assert cfg.config == {
+        "images.url": "https://images.example.com/?a=b",
+        "registry.mode": "client",
+    }
+    assert cfg.metrics_server == "user:pass@10.0.0.5:8086"
+
+
+@pytest.mark.parametrize(
+    "option,value,message",
+    [
+        ("port_range", "11000-10000", "Invalid port_range: '11000-10000' must be an ascending"),
+        ("port_range", "10000:11000", "Invalid port_range: '10000:11000' is not of the form"),
+        ("prometheus_extra_labels", "region", "Invalid prometheus_extra_labels: 'region'"),
+        ("config", "images.url https://x", "Invalid config: 'images.url https://x'"),
+        ("metrics_server", "http://influx:8086", "Invalid metrics_server"),
+        ("log_level", "verbose", "Invalid log_level: unexpected value"),
+        ("port", 0, "Invalid port: ensure this value is greater than or equal to 1"),
+        ("snap_revision", "latest", "Invalid snap_revision: must be a snap revision number"),
+        ("performance_profile", "turbo", "Invalid performance_profile: unknown profile"),
+        ("performance_sysctl", "net.core.somaxconn 4096", "Invalid performance_sysctl"),
+        ("storage_filesystem", "btrfs", "Invalid storage_filesystem: unexpected value"),
+        ("etcd_auto_compaction_mode", "hourly", "Invalid etcd_auto_compaction_mode"),
+        ("etcd_auto_compaction_mode", "revision", "Invalid etcd_auto_compaction_retention"),
+        ("etcd_quota_backend_bytes", -1, "Invalid etcd_quota_backend_bytes"),
+    ],
+)
+def test_invalid_options_name_the_option(defaults, option, value, message):
+    with pytest.raises(ConfigError) as e:
+        CharmConfig.from_options({**defaults, option: value})
+    assert str(e.value).startswith(message)
+
+
+@pytest.mark.parametrize(
+    "options,message",
+    [
+        (
+            {"storage_device": "/dev/sdb", "etcd_storage_device": "/dev/sdb"},
+            "Invalid etcd_storage_device: must differ from storage_device",
+        ),
+        (
+            {"etcd_heartbeat_interval": 100, "etcd_election_timeout": 400},
+            "Invalid etcd_election_timeout: must be at least 5 times",
+        ),
+        ({"unknown_option": "x"}, "Invalid unknown_option: extra fields not permitted"),
+    ],
+)
+def test_options_are_validated_together(defaults, options, message):
+    with pytest.raises(ConfigError) as e:
+        CharmConfig.from_options({**defaults, **options})
+    assert str(e.value).startswith(message)
+
+
+def test_every_option_is_modelled(defaults):
+    assert set(CharmConfig.__fields__) == set(defaults)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+from endpoints import compute_weight, parse_metrics, request_rate
+
+
+def test_parse_metrics_sums_labelled_samples():
+    text = """# HELP ams_containers_running Running containers
+# TYPE ams_containers_running gauge
+ams_containers_running{node="lxd0"} 3
+ams_containers_running{node="lxd1",app="a b"} 4 1700000000
+ams_http_requests_total 120
+"""
+    assert parse_metrics(text) == {"ams_containers_running": 7.0, "ams_http_requests_total": 120.0}
+
+
+def test_request_rate_ignores_counter_resets():
+    assert request_rate(150.0, [100.0, 10.0], 20.0) == 5.0
+    assert request_rate(10.0, [100.0, 10.0], 20.0) == 0.0
+    assert request_rate(10.0, [0.0, 0.0], 20.0) == 0.0
+
+
+def test_weight_decreases_with_load():
+    assert compute_weight(0, 0) == 100
+    assert compute_weight(100, 0) == 50
+    assert compute_weight(10000, 5000) == 1
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from etcd import (
+    ETCD_INSTALL_TIMEOUT,
+    ETCDClient,
+    ETCDError,
+    ETCDProxy,
+    install_etcd,
+    order_by_latency,
+)
+
+
+def _response(payload: dict):
+    resp = MagicMock()
+    resp.read.return_value = json.dumps(payload).encode()
+    resp.__enter__.return_value = resp
+    return resp
+
+
+def test_compact_uses_current_revision_by_default():
+    with patch("etcd.urllib.request.urlopen") as urlopen:
+        urlopen.side_effect = [_response({"header": {"revision": "42"}}), _response({})]
+        assert ETCDClient().compact() == 42
+    request = urlopen.call_args.args[0]
+    assert request.full_url.endswith("/v3/kv/compaction")
+    assert json.loads(request.data) == {"revision": "42", "physical": True}
+
+
+def test_failed_requests_raise_etcd_error():
+    with patch("etcd.urllib.request.urlopen", side_effect=OSError("refused")):
+        with pytest.raises(ETCDError):
+            ETCDClient().defragment()
+
+
+def test_endpoints_are_ordered_by_latency_without_unhealthy_members():
+    rtts = {"https://a:2379": 0.050, "https://b:2379": None, "https://c:2379": 0.002}
+    with patch("etcd.probe", side_effect=lambda s, *_: rtts[s]):
+        ordered = order_by_latency(list(rtts), ca=None, cert=None, key=None)
+    assert ordered == ["https://c:2379", "https://a:2379"]
+
+
+def test_similar_latencies_keep_previous_order():
+    rtts = {"https://a:2379": 0.0031, "https://b:2379": 0.0012}
+    with patch("etcd.probe", side_effect=lambda s, *_: rtts[s]):
+        ordered = order_by_latency(
+            list(rtts), ca=None, cert=None, key=None, previous=["https://a:2379", "https://b:2379"]
+        )
+    assert ordered == ["https://a:2379", "https://b:2379"]
+
+
+@pytest.mark.parametrize(
+    "rtt_a,rtt_b,expected",
+    [
+        # Jitter across a 5ms boundary used to swap the endpoints
+        (0.0051, 0.0049, ["https://a:2379", "https://b:2379"]),
+        (0.0081, 0.0039, ["https://a:2379", "https://b:2379"]),
+        (0.0081, 0.0009, ["https://b:2379", "https://a:2379"]),
+    ],
+)
+def test_endpoints_move_ahead_only_when_faster_by_the_margin(rtt_a, rtt_b, expected):
+    rtts = {"https://a:2379": rtt_a, "https://b:2379": rtt_b}
+    with patch("etcd.probe", side_effect=lambda s, *_: rtts[s]):
+        ordered = order_by_latency(
+            list(rtts), ca=None, cert=None, key=None, previous=["https://a:2379", "https://b:2379"]
+        )
+    assert ordered == expected
+
+
+def test_all_endpoints_failing_keeps_the_relation_order():
+    servers = ["https://a:2379", "https://b:2379"]
+    with patch("etcd.probe", return_value=None):
+        assert order_by_latency(servers, ca=None, cert=None, key=None) == servers
+
+
+def test_proxy_is_only_restarted_when_upstreams_change(tmp_path, monkeypatch):
+    monkeypatch.setattr("etcd.ETCD_PROXY_UNIT_PATH", tmp_path / "ams-etcd-proxy.service")
+    proxy = ETCDProxy()
+    with patch("etcd.systemd") as systemd:
+        assert proxy.configure(["https://a:2379", "https://b:2379"], "ca", "cert", "key")
+        assert not proxy.configure(["https://a:2379", "https://b:2379"], "ca", "cert", "key")
+        assert proxy.configure(["https://b:2379"], "ca", "cert", "key")
+    assert systemd.service_restart.call_count == 2
+    unit = (tmp_path / "ams-etcd-proxy.service").read_text()
+    assert "--endpoints=https://b:2379 " in unit
+    assert "--listen-addr=127.0.0.1:23790" in unit
+
+
+@pytest.mark.parametrize("installed, action", [(False, "install"), (True, "refresh")])
+def test_install_etcd_bounds_snap_commands(installed, action):
+    with patch("etcd.Path.exists", return_value=installed), patch("etcd.run") as run:
+        install_etcd("3.5/stable")
+    run.assert_called_once_with(
+        ["snap", action, "etcd", "--channel=3.5/stable"],
+        operation=f"etcd snap {action}",
+        timeout=ETCD_INSTALL_TIMEOUT,
+    )
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from keypool import KeyPool
+
+
+def test_keys_are_private_to_root_and_taken_once(tmp_path):
+    pool = KeyPool(tmp_path / "pool", key_size=1024)
+    assert pool.fill(2) == 2
+    assert pool.fill(2) == 0
+    assert (tmp_path / "pool").stat().st_mode & 0o077 == 0
+    for key_file in (tmp_path / "pool").glob("*.pem"):
+        assert key_file.stat().st_mode & 0o077 == 0
+
+    first, second = pool.take(), pool.take()
+    assert first != second
+    assert serialization.load_pem_private_key(first, password=None).key_size == 1024
+    assert pool.take() is None
+
+
+def test_pool_is_trimmed_to_a_lower_size(tmp_path):
+    pool = KeyPool(tmp_path, key_size=1024)
+    pool.fill(3)
+    pool.trim(1)
+    assert len(pool) == 1
+    assert not pool.refilling
+
+
+def test_unreadable_keys_are_discarded(tmp_path):
+    pool = KeyPool(tmp_path, key_size=1024)
+    key = rsa.generate_private_key(public_exponent=65537, key_size=1024)
+    (tmp_path / "encrypted.pem").write_bytes(
+        key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.BestAvailableEncryption(b"secret"),
+        )
+    )
+    assert pool.take() is None
+    assert len(pool) == 0
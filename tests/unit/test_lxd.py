@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from interfaces.lxd import LXDClusterConsumer, probe_trust
+from ops import CharmBase
+from ops.testing import Harness
+
+METADATA = """
+name: test
+requires:
+  lxd-cluster:
+    interface: lxd
+"""
+
+
+@pytest.fixture
+def harness(request):
+    harness = Harness(CharmBase, meta=METADATA)
+    request.addfinalizer(harness.cleanup)
+    harness.begin()
+    return harness
+
+
+def test_publish_only_updates_changed_relations(harness):
+    consumer = LXDClusterConsumer(harness.charm, "lxd-cluster")
+    rel_id = harness.add_relation("lxd-cluster", "lxd-a")
+    assert consumer.publish(["cert"])
+    assert not consumer.publish(["cert"])
+    harness.add_relation("lxd-cluster", "lxd-b")
+    assert consumer.publish(["cert"])
+    data = harness.get_relation_data(rel_id, harness.charm.unit.name)
+    assert json.loads(data["client_certificates"]) == ["cert"]
+
+
+def test_certificate_is_trusted_once_all_clusters_trust_it(harness, tmp_path):
+    consumer = LXDClusterConsumer(harness.charm, "lxd-cluster")
+    rel_a = harness.add_relation("lxd-cluster", "lxd-a")
+    harness.add_relation_unit(rel_a, "lxd-a/0")
+    harness.update_relation_data(rel_a, "lxd-a/0", {"private-address": "10.0.0.1"})
+    rel_b = harness.add_relation("lxd-cluster", "lxd-b")
+    harness.add_relation_unit(rel_b, "lxd-b/0")
+    harness.add_relation_unit(rel_b, "lxd-b/1")
+    harness.update_relation_data(rel_b, "lxd-b/0", {"private-address": "10.0.1.1"})
+    harness.update_relation_data(rel_b, "lxd-b/1", {"private-address": "10.0.1.2"})
+    trusted = {"10.0.0.1": True, "10.0.1.1": None, "10.0.1.2": False}
+    with patch("interfaces.lxd.probe_trust", side_effect=lambda a, *_: trusted[a]):
+        assert not consumer.is_trusted(tmp_path / "crt", tmp_path / "key")
+        trusted["10.0.1.2"] = True
+        assert consumer.is_trusted(tmp_path / "crt", tmp_path / "key")
+
+
+@pytest.mark.parametrize(
+    "response,expected",
+    [
+        (b'{"metadata": {"auth": "trusted"}}', True),
+        (b'{"metadata": {"auth": "untrusted"}}', False),
+        (b"<html>", None),
+    ],
+)
+def test_probe_trust_reads_the_auth_lxd_reports(self_signed_cert, tmp_path, response, expected):
+    cert, key = self_signed_cert
+    (tmp_path / "crt").write_text(cert)
+    (tmp_path / "key").write_text(key)
+    with patch("interfaces.lxd.http.client.HTTPSConnection") as connection:
+        conn = MagicMock()
+        conn.getresponse.return_value.read.return_value = response
+        connection.return_value = conn
+        assert probe_trust("10.0.0.1", tmp_path / "crt", tmp_path / "key") is expected
+    conn.request.assert_called_once_with("GET", "/1.0")
+
+
+@pytest.mark.parametrize("key", [None, "not a key"])
+def test_probe_trust_without_a_usable_certificate(self_signed_cert, tmp_path, key):
+    cert, _ = self_signed_cert
+    (tmp_path / "crt").write_text(cert)
+    if key:
+        (tmp_path / "key").write_text(key)
+    with patch("interfaces.lxd.http.client.HTTPSConnection") as connection:
+        assert probe_trust("10.0.0.1", tmp_path / "crt", tmp_path / "key") is None
+    connection.assert_not_called()
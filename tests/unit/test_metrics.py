@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+from metrics import CHARM_METRICS_FILE, Gauge, MetricsExporter
+from metrics_server import handler
+
+
+def test_groups_are_combined_into_one_exposition_file(tmp_path):
+    exporter = MetricsExporter(tmp_path)
+    exporter.set("artifacts", [Gauge("ams_charm_artifacts_bytes", 10, "Bytes")])
+    exporter.set(
+        "ports",
+        [
+            Gauge("ams_charm_ports", 2, "Ports", {"state": "used"}),
+            Gauge("ams_charm_ports", 8, "Ports", {"state": "free"}),
+        ],
+    )
+    content = (tmp_path / CHARM_METRICS_FILE).read_text()
+    assert content.count("# TYPE ams_charm_ports gauge") == 1
+    assert 'ams_charm_ports{state="used"} 2' in content
+    assert "ams_charm_artifacts_bytes 10" in content
+
+    exporter.set("artifacts", [Gauge("ams_charm_artifacts_bytes", 5, "Bytes")])
+    assert "ams_charm_artifacts_bytes 5" in (tmp_path / CHARM_METRICS_FILE).read_text()
+
+
+def test_server_only_exposes_the_metrics_file(tmp_path):
+    (tmp_path / CHARM_METRICS_FILE).write_text("ams_charm_ports 2\n")
+    (tmp_path / "secret").write_text("secret")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler(tmp_path / CHARM_METRICS_FILE))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(f"{url}/{CHARM_METRICS_FILE}") as resp:
+            assert resp.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert resp.read() == b"ams_charm_ports 2\n"
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{url}/secret")
+        assert e.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import threading
+
+import pytest
+from pipeline import Step, run_steps
+
+
+def test_independent_steps_overlap_and_dependent_ones_wait():
+    started = threading.Barrier(2, timeout=5)
+    order = []
+
+    def _parallel(name):
+        def _step():
+            # Both steps must be running at the same time to pass the barrier
+            started.wait()
+            order.append(name)
+
+        return _step
+
+    run_steps(
+        {
+            "connect": Step(lambda: order.append("connect"), after=("install",)),
+            "install": Step(_parallel("install")),
+            "group": Step(_parallel("group")),
+        }
+    )
+    assert set(order[:2]) == {"install", "group"}
+    assert order[2] == "connect"
+
+
+def test_failed_step_stops_dependent_steps():
+    ran = []
+
+    def _fail():
+        raise RuntimeError("install failed")
+
+    with pytest.raises(RuntimeError, match="install failed"):
+        run_steps(
+            {
+                "install": Step(_fail),
+                "connect": Step(lambda: ran.append("connect"), after=("install",)),
+            }
+        )
+    assert not ran
+
+
+def test_unknown_dependencies_are_rejected():
+    with pytest.raises(ValueError, match="connect"):
+        run_steps({"connect": Step(lambda: None, after=("install",))})
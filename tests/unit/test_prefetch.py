@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import subprocess
+from unittest.mock import MagicMock
+
+from prefetch import PrefetchTarget, prefetch
+
+
+def test_prefetch_stages_every_target_on_every_node_and_cleans_up():
+    ams = MagicMock()
+    ams.launch.side_effect = lambda target, node, **_: f"{target}-{node}"
+    progress = []
+    results = prefetch(
+        ams,
+        [PrefetchTarget("jammy", raw=True), PrefetchTarget("game", raw=False)],
+        ["lxd0", "lxd1"],
+        parallelism=2,
+        progress=progress.append,
+    )
+    assert len(results) == len(progress) == 4
+    assert all(r.ok for r in results)
+    assert ams.delete_container.call_count == 4
+
+
+def test_prefetch_reports_failures_per_node():
+    ams = MagicMock()
+    ams.launch.return_value = "c0000000000000000000"
+    ams.wait_for_container.side_effect = subprocess.CalledProcessError(
+        1, "amc", stderr=b"timed out"
+    )
+    (result,) = prefetch(ams, [PrefetchTarget("jammy", raw=True)], ["lxd0"])
+    assert result.error == "timed out"
+    ams.delete_container.assert_called_once_with("c0000000000000000000")
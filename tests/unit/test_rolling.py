@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import json
+
+import pytest
+from ops import CharmBase
+from ops.testing import Harness
+from rolling import RollingOpsCoordinator
+
+METADATA = """
+name: ams
+peers:
+  ams-peers:
+    interface: ams_peers
+"""
+
+
+class RollingCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.runs = []
+        self.ready = True
+        self.failing_checks = 0
+        self.rolling = RollingOpsCoordinator(
+            self,
+            "ams-peers",
+            run=self.runs.append,
+            is_ready=self._is_ready,
+            max_concurrent=lambda: 1,
+        )
+
+    def _is_ready(self):
+        if self.failing_checks:
+            self.failing_checks -= 1
+            return False
+        return self.ready
+
+
+@pytest.fixture
+def harness(request):
+    harness = Harness(RollingCharm, meta=METADATA)
+    request.addfinalizer(harness.cleanup)
+    harness.set_leader(True)
+    harness.begin()
+    return harness
+
+
+def _granted(harness, rel_id):
+    return json.loads(harness.get_relation_data(rel_id, "ams").get("granted", "[]"))
+
+
+def test_units_restart_one_at_a_time_in_request_order(harness):
+    rel_id = harness.add_relation("ams-peers", "ams")
+    harness.add_relation_unit(rel_id, "ams/1")
+    harness.update_relation_data(
+        rel_id, "ams/1", {"lock": json.dumps({"operation": "restart", "requested": 1})}
+    )
+    assert _granted(harness, rel_id) == ["ams/1"]
+
+    harness.charm.rolling.acquire("restart")
+    assert harness.charm.runs == []
+    assert harness.charm.rolling.message == "restart queued at position 1"
+
+    harness.update_relation_data(rel_id, "ams/1", {"lock": ""})
+    assert harness.charm.runs == ["restart"]
+    assert _granted(harness, rel_id) == []
+    assert not harness.charm.rolling.pending
+
+
+def test_lock_is_held_until_ams_is_ready(harness):
+    rel_id = harness.add_relation("ams-peers", "ams")
+    harness.charm.ready = False
+    harness.charm.rolling.acquire("restart")
+    harness.charm.rolling.acquire("refresh")
+    assert harness.charm.runs == ["restart", "refresh"]
+    assert _granted(harness, rel_id) == ["ams/0"]
+    assert harness.charm.rolling.message == "refresh in progress"
+
+    harness.charm.ready = True
+    harness.charm.rolling.update()
+    assert harness.charm.runs == ["restart", "refresh"]
+    assert _granted(harness, rel_id) == []
+
+
+def test_lock_is_released_in_the_same_hook_once_ams_is_ready(harness, rolling_clock):
+    rel_id = harness.add_relation("ams-peers", "ams")
+    harness.charm.failing_checks = 3
+    harness.charm.rolling.acquire("restart")
+    assert harness.charm.runs == ["restart"]
+    assert rolling_clock.call_count == 3
+    assert _granted(harness, rel_id) == []
+    assert not harness.charm.rolling.pending
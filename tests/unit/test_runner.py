@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import subprocess
+from unittest.mock import patch
+
+import pytest
+from runner import CommandError, CommandTimeoutError, retry_stats, run
+
+
+def _result(returncode: int, stderr: bytes = b"") -> subprocess.CompletedProcess:
+    return subprocess.CompletedProcess([], returncode, stdout=b"out", stderr=stderr)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    retry_stats.clear()
+    with patch("runner.time.sleep") as sleep:
+        yield sleep
+
+
+def test_transient_failures_are_retried_and_accounted():
+    with patch("runner.subprocess.run") as mock_run:
+        mock_run.side_effect = [_result(1, b"dial unix: connection refused"), _result(0)]
+        assert run(["amc", "ls"], operation="amc ls").stdout == b"out"
+    assert mock_run.call_args.kwargs["timeout"] == 60
+    assert retry_stats["amc ls"]["retries"] == 1
+
+
+def test_permanent_failures_are_not_retried():
+    with patch("runner.subprocess.run", return_value=_result(1, b"invalid name")) as mock_run:
+        with pytest.raises(CommandError) as e:
+            run(["amc", "ls"], operation="amc ls")
+        assert not e.value.transient
+        assert isinstance(e.value, subprocess.CalledProcessError)
+        assert mock_run.call_count == 1
+        assert run(["amc", "ls"], check=False).returncode == 1
+
+
+def test_timeouts_are_bounded_and_raised_after_retries():
+    with patch("runner.subprocess.run", side_effect=subprocess.TimeoutExpired([], 5)) as mock_run:
+        with pytest.raises(CommandTimeoutError, match="amc ls timed out after 5s"):
+            run(["amc", "ls"], operation="amc ls", timeout=5, retries=1, check=False)
+        assert mock_run.call_count == 2
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+from unittest.mock import patch
+
+import pytest
+from staging import SnapStager
+
+
+@pytest.fixture
+def stager(tmp_path):
+    with patch("staging.systemd.service_running", return_value=False):
+        yield SnapStager(tmp_path / "staged")
+
+
+def test_download_runs_detached_and_reports_progress(stager):
+    with patch("staging.run") as run:
+        assert stager.start("42")
+    cmd = run.call_args.args[0]
+    assert cmd[:2] == ["systemd-run", "--unit=ams-snap-download"]
+    assert cmd[-3:] == ["ams", "--revision=42", f"--target-directory={stager.path}"]
+
+    (stager.path / "ams_42.snap.partial").write_bytes(b"x" * 25)
+    assert stager.progress(100) == 0.25
+    assert stager.staged is None
+
+
+def test_staged_revision_is_not_downloaded_again(stager):
+    stager.path.mkdir()
+    (stager.path / "ams_42.snap").write_bytes(b"snap")
+    (stager.path / "ams_42.assert").write_bytes(b"assert")
+    assert stager.staged.revision == "42"
+    with patch("staging.run") as run:
+        assert not stager.start("42")
+        run.assert_not_called()
+        assert stager.start("43")
+    assert stager.staged is None
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+from unittest.mock import MagicMock, patch
+
+import pytest
+import storage
+from runner import CommandError, CommandTimeoutError
+
+
+@pytest.fixture
+def host(tmp_path, monkeypatch):
+    device = tmp_path / "sdb"
+    device.touch()
+    monkeypatch.setattr("storage.FSTAB_PATH", tmp_path / "fstab")
+    monkeypatch.setattr("storage.MOUNTS_PATH", tmp_path / "mounts")
+    (tmp_path / "mounts").write_text("/dev/sda1 / ext4 rw,relatime 0 0\n")
+    with patch("storage.run") as run:
+        run.return_value = MagicMock(stdout=b"")
+        yield device, run
+
+
+def test_etcd_data_shares_device_unless_dedicated_one_is_set():
+    assert storage.etcd_data_path("") == storage.ETCD_DATA_MOUNT_PATH
+    assert storage.etcd_data_path("/dev/sdb") == storage.DATA_MOUNT_PATH / "etcd"
+    assert storage.etcd_data_path("/dev/sdb", "/dev/sdc") == storage.ETCD_DATA_MOUNT_PATH
+
+
+def test_ensure_mount_formats_and_persists_device(host, tmp_path):
+    device, run = host
+    mount = storage.Mount(device=str(device), path=tmp_path / "data")
+    storage.ensure_mount(mount)
+    run.assert_any_call(
+        ["mkfs.xfs", "-q", str(device)],
+        operation="mkfs",
+        timeout=storage.MKFS_TIMEOUT,
+        retries=0,
+    )
+    run.assert_called_with(
+        ["mount", str(mount.path)], operation="mount", timeout=storage.MOUNT_TIMEOUT
+    )
+    fstab = storage.FSTAB_PATH.read_text()
+    assert f"{mount.path} xfs defaults,noatime" in fstab
+
+    storage.ensure_mount(mount)
+    assert fstab == storage.FSTAB_PATH.read_text()
+
+
+def test_ensure_mount_refuses_to_hide_existing_data(host, tmp_path):
+    device, _ = host
+    path = tmp_path / "data" / "artifacts"
+    path.mkdir(parents=True)
+    (path / "image.tar").write_text("data")
+    with pytest.raises(storage.StorageError):
+        storage.ensure_mount(storage.Mount(device=str(device), path=tmp_path / "data"))
+
+
+@pytest.mark.parametrize("tag, value", [("PTTYPE", b"gpt\n"), ("TYPE", b"LVM2_member\n")])
+def test_ensure_mount_refuses_to_format_devices_in_use(host, tmp_path, tag, value):
+    device, run = host
+    run.side_effect = lambda cmd, **_: MagicMock(stdout=value if tag in cmd else b"")
+    with pytest.raises(storage.StorageError, match="Refusing to format"):
+        storage.ensure_mount(storage.Mount(device=str(device), path=tmp_path / "data"))
+    assert not any(call.args[0][0].startswith("mkfs") for call in run.call_args_list)
+
+
+def test_stranded_etcd_data_is_detected(tmp_path, monkeypatch):
+    monkeypatch.setattr("storage.DATA_MOUNT_PATH", tmp_path / "data")
+    monkeypatch.setattr("storage.ETCD_DATA_MOUNT_PATH", tmp_path / "etcd-data")
+    (tmp_path / "etcd-data" / "member").mkdir(parents=True)
+    (tmp_path / "etcd-data" / "member" / "wal").write_text("data")
+    assert storage.stranded_etcd_data(tmp_path / "etcd-data") is None
+    assert storage.stranded_etcd_data(tmp_path / "data" / "etcd") == tmp_path / "etcd-data"
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        CommandTimeoutError("mkfs", ["mkfs.xfs"], storage.MKFS_TIMEOUT),
+        CommandError("mkfs", 1, ["mkfs.xfs"], stderr=b"device busy"),
+    ],
+)
+def test_failed_commands_raise_storage_error(host, tmp_path, error):
+    device, run = host
+
+    def _run(cmd, **_):
+        if cmd[0] == "blkid":
+            return MagicMock(stdout=b"")
+        raise error
+
+    run.side_effect = _run
+    with pytest.raises(storage.StorageError, match="mkfs"):
+        storage.ensure_mount(storage.Mount(device=str(device), path=tmp_path / "data"))
+
+
+def test_check_mount_detects_read_only_mounts(host, tmp_path):
+    storage.MOUNTS_PATH.write_text(f"/dev/sdb {tmp_path} xfs ro,noatime 0 0\n")
+    with pytest.raises(storage.StorageError):
+        storage.check_mount(storage.Mount(device="/dev/sdb", path=tmp_path))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2024 Canonical Ltd.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+import pytest
+import sysctl
+from ops import CharmBase
+from ops.testing import Harness
+from runner import CommandError, CommandTimeoutError
+
+
+@pytest.fixture
+def tuning(request):
+    harness = Harness(CharmBase, meta="name: test")
+    request.addfinalizer(harness.cleanup)
+    harness.begin()
+    return sysctl.KernelTuning(harness.charm)
+
+
+def test_high_throughput_profile_reserves_ams_port_range():
+    settings = sysctl.resolve_profile("high-throughput", port_range="10000-11000")
+    assert settings["net.core.somaxconn"] == "4096"
+    assert settings["net.ipv4.ip_local_reserved_ports"] == "10000-11000"
+
+
+def test_custom_profile_rejects_malformed_settings():
+    with pytest.raises(sysctl.InvalidProfileError):
+        sysctl.parse_sysctl_settings("net.core.somaxconn 4096")
+    custom = sysctl.parse_sysctl_settings("# tuned\nnet.core.somaxconn = 4096\n")
+    assert sysctl.resolve_profile("custom", custom=custom) == {"net.core.somaxconn": "4096"}
+
+
+def test_apply_is_idempotent_and_reset_restores_defaults(tuning, sysctl_paths):
+    somaxconn = sysctl.PROC_SYS_PATH / "net" / "core" / "somaxconn"
+    somaxconn.parent.mkdir(parents=True)
+    somaxconn.write_text("128\n")
+
+    assert tuning.apply({"net.core.somaxconn": "4096"})
+    assert not tuning.apply({"net.core.somaxconn": "4096"})
+    assert sysctl_paths.call_count == 1
+
+    assert tuning.reset()
+    assert not sysctl.SYSCTL_CONFIG_PATH.exists()
+    sysctl_paths.assert_called_with(
+        ["sysctl", "-e", "-q", "-w", "net.core.somaxconn=128"],
+        operation="sysctl",
+        timeout=sysctl.SYSCTL_TIMEOUT,
+        retries=0,
+    )
+
+
+@pytest.mark.parametrize(
+    "error, message",
+    [
+        (CommandError("sysctl", 255, ["sysctl"], stderr=b"bad value"), "bad value"),
+        (CommandTimeoutError("sysctl", ["sysctl"], sysctl.SYSCTL_TIMEOUT), "timed out"),
+    ],
+)
+def test_rejected_settings_are_retried(tuning, sysctl_paths, error, message):
+    sysctl_paths.side_effect = error
+    with pytest.raises(sysctl.KernelTuningError, match=message):
+        tuning.apply({"net.core.somaxconn": "lots"})
+    assert not sysctl.SYSCTL_CONFIG_PATH.exists()
+    assert tuning.managed_keys == []
+
+    sysctl_paths.side_effect = None
+    assert tuning.apply({"net.core.somaxconn": "4096"})
+    assert sysctl.SYSCTL_CONFIG_PATH.read_text() == "net.core.somaxconn = 4096\n"
+    assert tuning.managed_keys == ["net.core.somaxconn"]